@@ -0,0 +1,329 @@
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import random
+from game import allow_error
+from game.maze.generator import GENERATORS, prim, carve
+from game.maze import Maze
+from game.maze.labelling import label_components, dfs_tree
+from game.maze.solver import distance_field
+from game.maze.corridor_graph import CorridorGraph
+from game.maze.collision import sweep_batch
+from game.maze.chunked import ChunkedMaze
+allow_error()
+
+BENCHMARKS: Dict[str, Callable[[int, int], None]] = {}
+
+def benchmark(name: str) -> Callable:
+    "register a benchmark, it will be called with param=(size, repeat)"
+    def decorator(func: Callable[[int, int], None]) -> Callable[[int, int], None]:
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+def measure(func: Callable, repeat: int) -> float:
+    "returns the best time of <repeat> runs, unit: seconds"
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+def report(name: str, size: int, baseline: float, optimized: float):
+    print(f"{name:<24} size={size:<4} baseline={baseline * 1000:>10.2f}ms optimized={optimized * 1000:>10.2f}ms "
+          f"speedup={baseline / optimized:>8.1f}x")
+
+
+def legacy_prim(num_rows: int, num_cols: int, num_h: int) -> np.ndarray:
+    "the Prim with a list frontier and list.remove that prim() replaced"
+    M = np.zeros((num_rows, num_cols, num_h, 7), dtype=np.uint8)
+    possibility = [(0, 0, 0)]
+    while possibility:
+        r, c, t = random.choice(possibility)
+        M[r, c, t, 6] = 1
+        possibility.remove((r, c, t))
+        check = []
+        for direction, dr, dc, dt, inside in (("L", 0, -1, 0, c > 0), ("U", -1, 0, 0, r > 0), ("F", 0, 0, -1, t > 0),
+                                               ("R", 0, 1, 0, c < num_cols - 1), ("D", 1, 0, 0, r < num_rows - 1),
+                                               ("B", 0, 0, 1, t < num_h - 1)):
+            if not inside:
+                continue
+            if M[r + dr, c + dc, t + dt, 6] == 1:
+                check.append(direction)
+            elif M[r + dr, c + dc, t + dt, 6] == 0:
+                possibility.append((r + dr, c + dc, t + dt))
+                M[r + dr, c + dc, t + dt, 6] = 2
+        if len(check):
+            move_direction = random.choice(check)
+            wall, dr, dc, dt, back = {"L": (0, 0, -1, 0, 2), "U": (1, -1, 0, 0, 3), "R": (2, 0, 1, 0, 0),
+                                      "D": (3, 1, 0, 0, 1), "F": (4, 0, 0, -1, 5), "B": (5, 0, 0, 1, 4)}[move_direction]
+            M[r, c, t, wall] = 1
+            M[r + dr, c + dc, t + dt, back] = 1
+    return M[..., :6]
+
+def legacy_carve(M: np.ndarray) -> np.ndarray:
+    "the per-cell loop that carve() replaced"
+    num_rows, num_cols, num_h, _ = M.shape
+    maze = np.zeros((num_rows * 2 + 1, num_cols * 2 + 1, num_h * 2 + 1), dtype=np.uint8)
+    for row in range(num_rows):
+        for col in range(num_cols):
+            for height in range(num_h):
+                maze[row * 2 + 1, col * 2 + 1, height * 2 + 1] = 1
+                if M[row, col, height, 0] == 1:
+                    maze[row * 2 + 1, col * 2, height * 2 + 1] = 1
+                if M[row, col, height, 1] == 1:
+                    maze[row * 2, col * 2 + 1, height * 2 + 1] = 1
+                if M[row, col, height, 2] == 1:
+                    maze[row * 2 + 1, col * 2 + 2, height * 2 + 1] = 1
+                if M[row, col, height, 3] == 1:
+                    maze[row * 2 + 2, col * 2 + 1, height * 2 + 1] = 1
+                if M[row, col, height, 4] == 1:
+                    maze[row * 2 + 1, col * 2 + 1, height * 2] = 1
+                if M[row, col, height, 5] == 1:
+                    maze[row * 2 + 1, col * 2 + 1, height * 2 + 2] = 1
+    return maze
+
+def legacy_divide(mask: np.ndarray) -> np.ndarray:
+    "the flood fill over a position dict that label_components() replaced in Maze.divide_maze"
+    X, Y, Z = mask.shape
+    maze = {(x, y, z): -1 if mask[x, y, z] else 0 for x in range(X) for y in range(Y) for z in range(Z)}
+    index = 0
+    for (x, y, z), state in maze.items():
+        if state != -1:
+            continue
+        index += 1
+        maze[(x, y, z)] = index
+        available = [(x, y, z)]
+        while available:
+            x, y, z = available.pop(0)
+            for neighbor in ((x + 1, y, z), (x - 1, y, z), (x, y + 1, z), (x, y - 1, z), (x, y, z + 1), (x, y, z - 1)):
+                if maze.get(neighbor) == -1:
+                    maze[neighbor] = index
+                    available.append(neighbor)
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    labels[tuple(np.array(list(maze)).T)] = list(maze.values())
+    return labels
+
+def legacy_solute(maze: np.ndarray) -> np.ndarray:
+    "the LIFO flood from the goal that distance_field() replaced in Maze.solute, its distances are not the shortest"
+    solution = np.zeros(maze.shape, dtype=np.int32)
+    solution[maze == 0] = -1
+    available = [(maze.shape[0] - 2, maze.shape[1] - 2, maze.shape[2] - 2, 1)]
+    while available:
+        x, y, z, d = available.pop()
+        if solution[x, y, z]:
+            continue
+        solution[x, y, z] = d
+        for dx, dy, dz in ((1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)):
+            if solution[x + dx, y + dy, z + dz] == 0:
+                solution[x + dx, y + dy, z + dz] = d + 1
+                available.append((x + 2 * dx, y + 2 * dy, z + 2 * dz, d + 2))
+    return solution
+
+def legacy_refiner(maze: np.ndarray, position: Tuple[float, float, float], delta: float,
+                   collide: bool = False) -> Tuple[Tuple[float, float, float], bool]:
+    "the recursive probe test that collision.sweep() replaced in Maze.position_refiner"
+    x, y, z = position
+    if not maze[int(x + delta), int(y), int(z)]:
+        return legacy_refiner(maze, (int(x + delta) - delta * 1.01, y, z), delta, True)
+    if not maze[int(x - delta), int(y), int(z)]:
+        return legacy_refiner(maze, (int(x) + delta * 1.01, y, z), delta, True)
+    if not maze[int(x), int(y + delta), int(z)]:
+        return legacy_refiner(maze, (x, int(y + delta) - delta * 1.01, z), delta, True)
+    if not maze[int(x), int(y - delta), int(z)]:
+        return legacy_refiner(maze, (x, int(y) + delta * 1.01, z), delta, True)
+    if not maze[int(x), int(y), int(z + delta)]:
+        return legacy_refiner(maze, (x, y, int(z + delta) - delta * 1.01), delta, True)
+    if not maze[int(x), int(y), int(z - delta)]:
+        return legacy_refiner(maze, (x, y, int(z) + delta * 1.01), delta, True)
+    return position, collide
+
+def legacy_floating(maze: Maze, num: int = 2) -> List[List[Tuple[int, int, int]]]:
+    "one round of Maze.gen_floating_blocks as it was before the corridor graph, a search of the voxels of each part "
+    "in turn, with the same rules and the same draws, so it places the same blocks"
+    labels = maze.part_label.ravel()
+    shape = maze.part_label.shape
+    steps = np.array((shape[1] * shape[2], -shape[1] * shape[2], shape[2], -shape[2], 1, -1))
+    start = np.ravel_multi_index((1, 1, 1), shape)
+    goal = np.ravel_multi_index((shape[0] - 2, shape[1] - 2, shape[2] - 2), shape)
+    blocks: List[List[Tuple[int, int, int]]] = [[] for _ in range(num)]
+    for label in range(1, maze.part_num + 1):
+        voxels = maze.part_voxels(label)
+        n = len(voxels)
+        if n < 5:
+            continue
+        around = voxels[:, None] + steps
+        index = np.minimum(np.searchsorted(voxels, around), n - 1)
+        order, disc, low, parent, size = dfs_tree(np.where(voxels[index] == around, index, -1))
+        own = np.stack(((labels[around] == -2).any(axis=1), (labels[around] == -3).any(axis=1), voxels == start),
+                       axis=1).astype(np.int64)
+        prefix = np.zeros((n + 1, 3), dtype=np.int64)
+        np.cumsum(own[order], axis=0, out=prefix[1:])
+        sub = prefix[disc + size] - prefix[disc]
+        child = np.flatnonzero(parent >= 0)
+        child = child[low[child] >= disc[parent[child]]]
+        separated = np.zeros((n, 3), dtype=np.int64)
+        np.add.at(separated, parent[child], sub[child])
+        bad = np.bincount(parent[child], weights=~Maze.valid_piece(sub[child]), minlength=n) > 0
+        rest_size = n - 1 - np.bincount(parent[child], weights=size[child], minlength=n)
+        candidates = np.where(parent < 0, np.bincount(parent[child], minlength=n) >= 2,
+                              np.bincount(parent[child], minlength=n) >= 1) & ~bad
+        candidates &= (rest_size == 0) | Maze.valid_piece(sub[0] - own - separated)
+        candidates &= (voxels != start) & (voxels != goal) & ~(around == start).any(axis=1)
+        candidates = np.flatnonzero(candidates)
+        if len(candidates):
+            v = voxels[candidates[maze.rng.randrange(len(candidates))]]
+            blocks[sum(map(len, blocks)) % num].append(tuple(int(i) for i in np.unravel_index(v, shape)))
+    return blocks
+
+def goal_reachable(maze: Maze) -> bool:
+    "whether the goal can be reached from the start in the phase 0, moving in a phase and changing it in a cell"
+    shape = maze.layout.shape
+    start = np.ravel_multi_index((1, 1, 1), shape)
+    goal = np.ravel_multi_index((shape[0] - 2, shape[1] - 2, shape[2] - 2), shape)
+    components = [] # the labels of each phase, shifted so that no two phases share one
+    offset = 0
+    for volume, _, _ in maze.phases:
+        labels, counts, _ = label_components(volume == 1, split=False)
+        components.append(np.where(labels.ravel() > 0, labels.ravel().astype(np.int64) + offset, 0))
+        offset += len(counts)
+    cells = np.flatnonzero(maze.cell_id.ravel())
+    root = list(range(offset + 1)) # a union-find of the components joined in a cell
+    def find(a: int) -> int:
+        while root[a] != a:
+            root[a] = root[root[a]]
+            a = root[a]
+        return a
+    for row in np.unique(np.stack([labels[cells] for labels in components], axis=1), axis=0).tolist():
+        for b in row[1:]:
+            root[find(b)] = find(row[0])
+    return find(int(components[0][start])) in {find(int(labels[goal])) for labels in components}
+
+@benchmark("carve")
+def bench_carve(size: int, repeat: int):
+    M = prim(size, size, size)
+    if not np.array_equal(legacy_carve(M), carve(M)):
+        raise RuntimeError("carve() differs from the legacy loop")
+    report("carve", size, measure(lambda: legacy_carve(M), repeat), measure(lambda: carve(M), repeat))
+
+@benchmark("generate")
+def bench_generate(size: int, repeat: int):
+    baseline = measure(lambda: legacy_prim(size, size, size), repeat)
+    for name, func in GENERATORS.items():
+        report(f"generate:{name}", size, baseline, measure(lambda: func(size, size, size), repeat))
+
+@benchmark("divide")
+def bench_divide(size: int, repeat: int):
+    maze = carve(prim(size, size, size))
+    maze[1:-1:8, 1:-1:8, 1:-1:8] = 0 # cut the tree into parts, like the cells do
+    mask = maze == 1
+    if not np.array_equal(legacy_divide(mask), label_components(mask)[0]):
+        raise RuntimeError("label_components() differs from the legacy flood fill")
+    report("divide", size, measure(lambda: legacy_divide(mask), repeat), measure(lambda: label_components(mask), repeat))
+
+@benchmark("solve")
+def bench_solve(size: int, repeat: int):
+    maze = carve(prim(size, size, size))
+    for x in range(1, size * 2 - 5, 8): # chambers, which make loops
+        maze[x: x + 3, x: x + 3, x: x + 3] = 1
+    goal = (size * 2 - 1,) * 3
+    legacy, solution = legacy_solute(maze), distance_field(maze, [goal])
+    reached = legacy > 0 # the legacy flood skips the voxels of a chamber that are off the cell grid
+    if not (solution[reached] > 0).all() or (solution[reached] > legacy[reached]).any():
+        raise RuntimeError("distance_field() misses a voxel or is longer than the legacy flood")
+    report("solve", size, measure(lambda: legacy_solute(maze), repeat), measure(lambda: distance_field(maze, [goal]), repeat))
+
+@benchmark("collide")
+def bench_collide(size: int, repeat: int):
+    maze = carve(prim(size, size, size))
+    path = np.argwhere(maze == 1)
+    positions = path[np.random.randint(len(path), size=10000)] + np.random.uniform(0.05, 0.95, (10000, 3))
+    legacy = [legacy_refiner(maze, tuple(p), 0.2) for p in positions.tolist()]
+    resolved, collide = sweep_batch(maze, None, positions, 0.2)
+    if not np.array_equal(np.array([p for p, _ in legacy]), resolved) or [c for _, c in legacy] != collide.tolist():
+        raise RuntimeError("sweep_batch() differs from the legacy refiner")
+    report("collide", size, measure(lambda: [legacy_refiner(maze, p, 0.2) for p in positions.tolist()], repeat),
+           measure(lambda: sweep_batch(maze, None, positions, 0.2), repeat))
+
+@benchmark("corridor")
+def bench_corridor(size: int, repeat: int):
+    "the distance between two voxels by a distance field against a search of the corridor graph, the graph is "
+    "smaller where the corridors are longer, so each generator is measured"
+    for name, func in GENERATORS.items():
+        maze = carve(func(size, size, size))
+        cell_id = np.zeros(maze.shape, dtype=np.int32)
+        for k, x in enumerate(range(1, size * 2 - 5, 8), 1): # chambers, as the cells of a Maze
+            maze[x: x + 3, x: x + 3, x: x + 3] = 1
+            cell_id[x: x + 3, x: x + 3, x: x + 3] = k
+        graph = CorridorGraph(maze, cell_id)
+        path = np.argwhere(maze == 1)
+        pairs = [(tuple(path[i]), tuple(path[j])) for i, j in np.random.randint(len(path), size=(20, 2)).tolist()]
+        def by_field() -> List[int]:
+            return [int(distance_field(maze, [a])[b]) - 1 for a, b in pairs]
+        def by_graph() -> List[int]:
+            return [graph.distance(a, b) for a, b in pairs]
+        if by_field() != by_graph():
+            raise RuntimeError("CorridorGraph.distance() differs from distance_field()")
+        report(f"corridor:{name}", size, measure(by_field, repeat), measure(by_graph, repeat))
+
+
+@benchmark("floating")
+def bench_floating(size: int, repeat: int):
+    "one round of floating blocks on the corridor graph of all the parts against a search of the voxels part by part, "
+    "both are given the same draws, for every maze algorithm, the goal must stay reachable through the phases after "
+    "one round and after three"
+    for name in GENERATORS:
+        maze = Maze(size, size, size, cells=0.05, algorithm=name, seed=0)
+        if not goal_reachable(maze):
+            raise RuntimeError("a floating block cuts the start from the goal")
+        maze.maze = maze.layout # every block open
+        maze.divide_maze()
+        labels, index = maze.part_label.copy(), dict(maze.part_index)
+        def fresh() -> Maze:
+            maze.part_label[...] = labels
+            maze.part_index, maze.label_num = dict(index), maze.part_num
+            maze.rng = random.Random(size)
+            return maze
+        def by_voxels() -> List[List[Tuple[int, int, int]]]:
+            return legacy_floating(fresh())
+        def by_graph() -> List[List[Tuple[int, int, int]]]:
+            fresh().gen_floating_blocks()
+            return maze.floating_block
+        if by_voxels() != by_graph():
+            raise RuntimeError("Maze.gen_floating_blocks() differs from the search of the voxels")
+        report(f"floating:{name}", size, measure(by_voxels, repeat), measure(by_graph, repeat))
+        fresh().gen_floating_blocks(rounds=3) # the pieces are split again, a loose rule would strand the goal here
+        maze.maze = maze.layout
+        maze.build_phases()
+        if not goal_reachable(maze):
+            raise RuntimeError("a floating block of a later round cuts the start from the goal")
+
+
+@benchmark("infinite")
+def bench_infinite(size: int, repeat: int):
+    "the up-front volume of a maze of <size> against the start of a chunked maze, the chunks around the player"
+    def start() -> ChunkedMaze:
+        maze = ChunkedMaze(seed=0)
+        maze.chunks.region((0, 0, 0), (1, 1, 1))
+        return maze
+    chunks = size // 6 + 1
+    region = start().chunks.region((0, 0, 0), (chunks - 1,) * 3)
+    if not (distance_field(region, [(1, 1, 1)])[region == 1] > 0).all():
+        raise RuntimeError("the chunks are not connected")
+    report("infinite", size, measure(lambda: carve(prim(size, size, size)), repeat), measure(start, repeat))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the maze pipeline")
+    parser.add_argument("--size", type=int, nargs="+", default=[15, 30], help="The sizes of the maze")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of runs, the best one is reported")
+    parser.add_argument("--only", type=str, nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks")
+    args = parser.parse_args()
+    random.seed(0)
+    for name, func in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        for size in args.size:
+            func(size, args.repeat)
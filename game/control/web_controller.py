@@ -2,6 +2,7 @@ from .base_controller import Controller
 from ..engine.base_wrapper import GeneralPoint, AUTO, GeneralVector
 from ..engine.base_environment import Render
 from ..engine.global_var import set_var, ENTRANCE, get_control_coordinator, set_control_coordinator
+from ..engine.direction import NAMES
 from typing import Tuple, Callable, List, Any, Dict
 from flask import Flask, request
 import requests
@@ -147,7 +148,8 @@ class WebController:
             return "OK"
         @self.app.route("/get_matrix", methods=["GET"])
         def get_matrix():
-            return pickle.dumps((self.camera.position, self.camera.target, self.camera.up, get_control_coordinator()[1]))
+            axis = tuple(NAMES[d] for d in get_control_coordinator()[1])
+            return pickle.dumps((self.camera.position, self.camera.target, self.camera.up, axis))
         @self.app.route("/close", methods=["GET"])
         def close():
             set_var("CLOSE", True)
@@ -3,5 +3,8 @@ from .base_wrapper import WHITE, RED, GREEN, BLUE, YELLOW, CYAN, MAGENTA, BLACK,
 from .base_object import Line, Quad, Text
 from .base_environment import Camera, Render
 from .useful_object import Tube, FloatingBlock
+from .batch import Batch
+from .mesher import VoxelMesh
+from .culling import Frustum, ChunkIndex
 from .global_var import set_max_brightness_level, get_max_brightness_level, set_control_coordinator, \
     get_control_coordinator, ENTRANCE, disable_mouse
\ No newline at end of file
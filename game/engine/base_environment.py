@@ -12,6 +12,10 @@ from .global_var import set_var, get_var, get_max_brightness_level, set_control_
     get_control_coordinator
 from typing import List, Tuple
 from .useful_object import Tube, FloatingBlock
+from .batch import Batch
+from .mesher import VoxelMesh
+from .culling import Frustum, ChunkIndex, bounds
+from .direction import FRAMES, FRAME_INDEX, HEADING, TURN_UP, AXIS, POSITIVE, quadrant
 from argparse import ArgumentParser
 import win32gui
 import win32con
@@ -32,12 +36,12 @@ class Camera:
     up: Vector
     render: "Render"
     def __init__(self, position: GeneralPoint, target: GeneralPoint, up: GeneralVector, 
-                 position_refiner: Callable[[GeneralPoint], Tuple[GeneralPoint, bool]] | None = None,
+                 position_refiner: Callable[[GeneralPoint, GeneralPoint | None], Tuple[GeneralPoint, bool]] | None = None,
                  ipd: float = 0.06, concentrate: float = 0.85) -> None:
         if Camera.EXIST:
             raise RuntimeError("Cannot create more than one camera")
         if position_refiner is None:
-            def position_refiner(position: GeneralPoint) -> Tuple[GeneralPoint, bool]:
+            def position_refiner(position: GeneralPoint, start: GeneralPoint | None = None) -> Tuple[GeneralPoint, bool]:
                 return position, False
         self.position_refiner = position_refiner
         self.glu_look_at(position, target, up)
@@ -54,7 +58,9 @@ class Camera:
         self.tilt = 0. # the tilt angle of the camera, only valid when arduino sensor is on
 
     
-    def glu_look_at(self, position: GeneralPoint = AUTO, target: GeneralPoint = AUTO, up: GeneralVector = AUTO) -> bool:
+    def glu_look_at(self, position: GeneralPoint = AUTO, target: GeneralPoint = AUTO, up: GeneralVector = AUTO,
+                    start: GeneralPoint | None = None) -> bool:
+        "<start> is where the position moves from, the move is then swept by the position refiner"
         if position == AUTO:
             position = self.position
         if target == AUTO:
@@ -69,7 +75,7 @@ class Camera:
             up = Vector(*up)
         self.target = target
         self.up = up
-        self.position, collide = self.position_refiner(position)
+        self.position, collide = self.position_refiner(position, start)
         self.calc_sight()
         return collide
 
@@ -78,7 +84,8 @@ class Camera:
         self.theta = sight.theta
         self.phi = sight.phi
     
-    def flip(self):
+    def eye(self) -> Tuple[Point, Point]:
+        "the position and the target of the view, one eye is beside the position when the screen is one-sided"
         _, _, coord = get_control_coordinator()
         if self.left_sided or self.right_sided:
             length = self.half_ipd
@@ -92,13 +99,22 @@ class Camera:
         else:
             position = self.position
             target = self.target
+        return position, target
+
+    def roll_axis(self) -> np.ndarray:
+        "the axis the tilt turns the view around"
+        _, _, coord = get_control_coordinator()
+        return coord[0] * cos(self.theta) + coord[1] * sin(self.theta)
+
+    def flip(self):
+        position, target = self.eye()
         glPopMatrix()
         glPushMatrix()
         self.calc_sight()
         up = self.up
         gluLookAt(0, 0, 0, target.x - position.x, target.y - position.y, target.z - position.z, up.x, up.y, up.z)
 
-        glRotatef(-self.tilt / pi * 180, *(coord[0] * cos(self.theta) + coord[1] * sin(self.theta)).tolist())
+        glRotatef(-self.tilt / pi * 180, *self.roll_axis().tolist())
         glTranslatef(-position.x, -position.y, -position.z)
         
 
@@ -109,9 +125,9 @@ class Camera:
         print(up)
         return Vector(*up.tolist())
 
-    def set_position(self, position: GeneralPoint) -> bool:
+    def set_position(self, position: GeneralPoint, start: GeneralPoint | None = None) -> bool:
         theta, phi = self.theta, self.phi
-        collide = self.glu_look_at(position=position)
+        collide = self.glu_look_at(position=position, start=start)
         self.look_at(theta, phi)
         return collide
     
@@ -145,7 +161,7 @@ class Camera:
             return
         _, _, coord = get_control_coordinator()
         delta_pos = length * coord[2]
-        return self.set_position(Vector(*delta_pos) + self.position)
+        return self.set_position(Vector(*delta_pos) + self.position, self.position)
     
     def move_in_plane(self, length: float, theta: float) -> bool:
         _, _, coord = get_control_coordinator()
@@ -153,7 +169,7 @@ class Camera:
             return
         theta = self.theta + theta
         delta_pos = cos(theta) * length * coord[0] + sin(theta) * length * coord[1]
-        return self.set_position(Vector(*delta_pos) + self.position)
+        return self.set_position(Vector(*delta_pos) + self.position, self.position)
     
     def rotate(self, left: float, up: float):
         if self.suppress_control:
@@ -242,42 +258,22 @@ class Camera:
             new_theta = -pi / 2
         else:
             new_theta = pi - 1e-3
-        def get_axis(theta: float) -> str:
-            if theta > pi:
-                theta -= pi * 2
-            elif theta < -pi:
-                theta += pi * 2
-            if -pi / 4 < theta < pi / 4:
-                return axis[0]
-            elif pi / 4 < theta < 3 * pi / 4:
-                return axis[1]
-            elif -3 * pi / 4 < theta < -pi / 4:
-                return f"{axis[1][0]}{'-' if axis[1][1] == '+' else '+'}"
-            else:
-                return f"{axis[0][0]}{'-' if axis[0][1] == '+' else '+'}"
-        new_axis = [get_axis(self.theta - pi / 2), axis[2], get_axis(self.theta + pi)]
+        frame = FRAME_INDEX[axis]
+        q = quadrant(self.theta)
+        new_axis = FRAMES[TURN_UP[frame][q]]
         new_pos = self.position
         if in_tube:
-            this = Tube.ALL[Point(int(self.position.x), int(self.position.y), int(self.position.z))]
-            front = get_axis(self.theta)
-            if front in this.direction:
+            front = HEADING[frame][q]
+            viewer = get_var("GLOBAL_VIEWER")
+            if viewer.maze.layout_faces[int(self.position.x), int(self.position.y), int(self.position.z)] >> front & 1:
                 if report_url is not None:
                     requests.get(report_url)
                 return
-            viewer = get_var("GLOBAL_VIEWER")
             delta = viewer.maze.delta
-            if front == "x+":
-                new_pos = Point(int(self.position.x) + 1 - delta, self.position.y, self.position.z)
-            elif front == "x-":
-                new_pos = Point(int(self.position.x) + delta, self.position.y, self.position.z)
-            elif front == "y+":
-                new_pos = Point(self.position.x, int(self.position.y) + 1 - delta, self.position.z)
-            elif front == "y-":
-                new_pos = Point(self.position.x, int(self.position.y) + delta, self.position.z)
-            elif front == "z+":
-                new_pos = Point(self.position.x, self.position.y, int(self.position.z) + 1 - delta)
-            elif front == "z-":
-                new_pos = Point(self.position.x, self.position.y, int(self.position.z) + delta)
+            pos = [self.position.x, self.position.y, self.position.z]
+            a = AXIS[front]
+            pos[a] = int(pos[a]) + 1 - delta if POSITIVE[front] else int(pos[a]) + delta # next to the front wall
+            new_pos = Point(*pos)
         def after(theta=self.theta, phi=self.phi):
             set_control_coordinator(*new_axis, self.render.camera)
             self.render.camera.calc_sight()
@@ -310,8 +306,12 @@ class Camera:
 class Render:
     def __init__(self, camera: Camera, size: Tuple[int, int] | None = None, fovy: int = 45, z_near: float = 0.1, 
                  z_far: float = 500.0, after: Callable | None = None, event: Callable | None = None, 
-                 sight_len: int = 99999, auto_light: bool = False, g: float = 0.0004, maxspeed: float = 0.08) -> None:
-        "`after` is a function that will be run in a thread with param=(self, )"
+                 sight_len: int = 99999, auto_light: bool = False, g: float = 0.0004, maxspeed: float = 0.08, 
+                 batch: bool = True) -> None:
+        "`after` is a function that will be run in a thread with param=(self, )\n"
+        "`batch` draws the tubes and the floating blocks from VBOs by a Batch instead of one by one\n"
+        "only the chunks of the scene in the frustum of `fovy`, the aspect of `size` and `z_far`, or `sight_len` if "
+        "it is nearer, are drawn"
         set_var("GLOBAL_RENDER", self)
         if size is None:
             user32 = ctypes.windll.user32
@@ -346,6 +346,9 @@ class Render:
         self.speed = 0.0
         self.position = position
         self.objs = []
+        self.index: ChunkIndex | None = None # the chunks of self.objs, made again after they change
+        self.batch = Batch() if batch else None
+        self.meshes: List[VoxelMesh] = []
         self.with_opengl: bool
         self.animation_tasks: List[Animation] = []
     
@@ -354,6 +357,7 @@ class Render:
         os.environ['SDL_VIDEO_WINDOW_POS'] = f"{self.position[0]},{self.position[1]}"
         pygame.init()
         self.screen = pygame.display.set_mode(self.size, DOUBLEBUF | OPENGL | NOFRAME)
+        TEXTURES.new_context()
         gluPerspective(self.fovy, (self.size[0] / self.size[1]), self.z_near, self.z_far)
         glMatrixMode(GL_MODELVIEW)
         glEnable(GL_DEPTH_TEST)
@@ -430,6 +434,7 @@ class Render:
         while True:
             for event in pygame.event.get():
                 if get_var("CLOSE"):
+                    TEXTURES.release()
                     pygame.quit()
                     os._exit(0)
                 if self.register_event:
@@ -472,7 +477,32 @@ class Render:
         self.animation_tasks.append(animation)
 
     def register(self, obj):
+        if isinstance(obj, VoxelMesh):
+            self.meshes.append(obj)
+            return
+        if self.batch is not None and isinstance(obj, Tube):
+            self.batch.add(obj)
+            return
         self.objs.append(obj)
+        self.index = None
+
+    def unregister(self, *objs):
+        "stops drawing the objects, the list is built again so a draw in progress is not disturbed"
+        if self.batch is not None:
+            tubes = [obj for obj in objs if isinstance(obj, Tube)]
+            if tubes:
+                self.batch.remove(*tubes)
+        drop = set(map(id, objs))
+        self.meshes = [mesh for mesh in self.meshes if id(mesh) not in drop]
+        self.objs = [obj for obj in self.objs if id(obj) not in drop]
+        self.index = None
+
+    def frustum(self) -> Frustum:
+        "the view volume of the camera, as Camera.flip() sets it"
+        camera = self.camera
+        position, target = camera.eye()
+        return Frustum(position, target, camera.up, self.fovy, self.size[0] / self.size[1], self.z_near,
+                       min(self.z_far, self.sight_len), camera.tilt, camera.roll_axis() if camera.tilt else None)
     
     def draw_objs(self):
         if self.auto_light:
@@ -480,19 +510,25 @@ class Render:
             pos = Point(int(pos.x), int(pos.y), int(pos.z))
             Tube.reset_brightness_level()
             FloatingBlock.reset_brightness_level()
-            Tube.ALL[pos].set_light(get_max_brightness_level(), 
-                                    Point(self.camera.position.x - pos.x, self.camera.position.y - pos.y, self.camera.position.z - pos.z))
-            
-        for obj in self.objs:
+            tube = Tube.ALL.get((int(pos.x), int(pos.y), int(pos.z))) # a chunk of the tube may be loading
+            if tube is not None:
+                tube.set_light(get_max_brightness_level(), 
+                               Point(self.camera.position.x - pos.x, self.camera.position.y - pos.y, self.camera.position.z - pos.z))
+        frustum = self.frustum()
+        for mesh in self.meshes:
+            if self.auto_light:
+                mesh.light(self.camera.position, get_max_brightness_level())
+            mesh.draw(frustum)
+        if self.batch is not None:
+            lit = [*Tube.LIT.values(), *FloatingBlock.LIT.values()] if self.auto_light else None
+            self.batch.draw(frustum, lit)
+        if self.index is None:
+            self.index = ChunkIndex(*bounds(self.objs))
+        for i in np.sort(self.index.visible(frustum)):
+            obj = self.objs[i]
             if isinstance(obj, Tube) and obj.brightness_level <= 0:
                 continue
-            arrow = obj.pos_scaler - self.camera.position
-            length = arrow.length
-            if length < 2:
-                obj.draw()
-                continue
-            if length < self.sight_len and arrow.dot(self.camera.target - self.camera.position) > -2:
-                obj.draw()
+            obj.draw()
 
     def drop(self):
         self.speed += self.g
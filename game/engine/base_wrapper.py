@@ -1,10 +1,11 @@
-from typing import Tuple
+from typing import Dict, Tuple
 from math import inf, atan, pi
 from OpenGL.GL import *
 from OpenGL.GLU import *
 import pygame
 from .global_var import get_control_coordinator, set_var
 import numpy as np
+import os
 WHITE = (1.0, 1.0, 1.0)
 RED = (1.0, 0.3, 0.3)
 GREEN = (0.3, 1.0, 0.3)
@@ -161,18 +162,66 @@ class Texture:
         self.height = self.surface.get_height()
 
     def enable(self):
-        "Enable texture mapping"
+        "Enable texture mapping, the pixels are uploaded by TEXTURES the first time in a context, then only bound"
         glEnable(GL_TEXTURE_2D)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, self.width, self.height, 0, GL_RGB, GL_UNSIGNED_BYTE, self.data)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        TEXTURES.bind(self)
 
     def disable(self):
         "Disable texture mapping"
         glDisable(GL_TEXTURE_2D)
 
+
+class TextureManager:
+    "the GL texture objects of the textures, a texture is uploaded with its mipmaps once in each OpenGL context\n"
+    "the names only live in the context they are made in, so a new context (Render.opengl_init) or a process that "
+    "is not the one they are made in, like an eye process, uploads the textures again"
+    def __init__(self) -> None:
+        self.names: Dict[int, int] = {} # id of a texture -> its name in the current context
+        self.textures: Dict[int, Texture] = {} # keeps the textures, so their ids are not reused
+        self.pid: int | None = None
+
+    def new_context(self):
+        "forgets the names of the former context, they are gone with it"
+        self.names.clear()
+        self.textures.clear()
+        self.pid = os.getpid()
+
+    def bind(self, texture: Texture):
+        if self.pid != os.getpid():
+            self.new_context()
+        name = self.names.get(id(texture))
+        if name is None:
+            name = self.upload(texture)
+        else:
+            glBindTexture(GL_TEXTURE_2D, name)
+
+    def upload(self, texture: Texture) -> int:
+        "makes and binds the texture object with its mipmaps, the pixels are not kept by GL again"
+        name = int(glGenTextures(1))
+        glBindTexture(GL_TEXTURE_2D, name)
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+        if bool(glGenerateMipmap): # OpenGL 3.0 and up
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, texture.width, texture.height, 0, GL_RGB, GL_UNSIGNED_BYTE, 
+                         texture.data)
+            glGenerateMipmap(GL_TEXTURE_2D)
+        else:
+            gluBuild2DMipmaps(GL_TEXTURE_2D, GL_RGB, texture.width, texture.height, GL_RGB, GL_UNSIGNED_BYTE, 
+                              texture.data)
+        self.names[id(texture)] = name
+        self.textures[id(texture)] = texture
+        return name
+
+    def release(self):
+        "deletes the texture objects, it is called before the context is closed"
+        if self.names and self.pid == os.getpid():
+            glDeleteTextures(list(self.names.values()))
+        self.new_context()
+
+TEXTURES = TextureManager()
+
 class Font:
     "Only in no OpenGL mode"
     ALL = []
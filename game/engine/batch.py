@@ -0,0 +1,152 @@
+from OpenGL.GL import *
+from .base_wrapper import *
+from .direction import FACE_CORNERS
+from .culling import Frustum, ChunkIndex
+from typing import Dict, Iterable, List
+import numpy as np
+
+CORNERS = np.array(FACE_CORNERS, dtype=np.float32) # the corners of the face in each direction, in shape (6, 4, 3)
+TEX_COORD = np.array(Texture.COORD, dtype=np.float32)
+VERTEX = np.arange(4, dtype=np.uint32)
+
+class Batch:
+    "the faces of the tubes and the floating blocks packed in vertex, texture coordinate and color arrays, "
+    "they are uploaded to VBOs once and a frame is a glDrawElements for each texture\n"
+    "the arrays are built again after a tube is added or removed, a new color of a tube only rewrites its rows\n"
+    "the slots are grouped in a ChunkIndex, so a frame only reads the slots of the chunks in the frustum"
+    def __init__(self) -> None:
+        self.tubes: List = [] # the tube of each slot, tube.slot is its index
+        self.dirty = True
+        self.buffers = None
+        self.recolored = False # the colors are uploaded again before the next draw
+        self.uploaded = False
+        self.textures: List[Texture | None] = []
+        self.groups: Dict[int, int] = {} # id of a texture -> its index in self.textures
+        self.first = np.zeros(1, dtype=np.int64) # the faces of the slot i are first[i]: first[i + 1]
+        self.group = np.zeros(0, dtype=np.int64) # the texture of each slot
+        self.positions = np.zeros((0, 3), dtype=np.float64)
+        self.colors = np.zeros((0, 4, 3), dtype=np.float32)
+        self.index = ChunkIndex(self.positions, self.positions + 1)
+
+    def add(self, tube):
+        tube.batch = self
+        self.tubes.append(tube)
+        self.dirty = True
+
+    def remove(self, *tubes):
+        drop = set(map(id, tubes))
+        for tube in tubes:
+            tube.batch = None
+        self.tubes = [tube for tube in self.tubes if id(tube) not in drop]
+        self.dirty = True
+
+    def texture_group(self, texture: Texture | None) -> int:
+        key = id(texture)
+        if key not in self.groups:
+            self.groups[key] = len(self.textures)
+            self.textures.append(texture)
+        return self.groups[key]
+
+    def build(self):
+        "packs the faces of every tube, a face is open where the bit of its direction is set in tube.mask"
+        for slot, tube in enumerate(self.tubes):
+            tube.slot = slot
+        masks = np.array([tube.mask for tube in self.tubes], dtype=np.int64)
+        closed = (masks[:, None] >> np.arange(6) & 1) == 0 # the faces drawn, in shape (N, 6)
+        self.positions = np.array([(tube.position.x, tube.position.y, tube.position.z) for tube in self.tubes],
+                                  dtype=np.float64).reshape(-1, 3)
+        self.index = ChunkIndex(self.positions, self.positions + 1)
+        self.first = np.zeros(len(self.tubes) + 1, dtype=np.int64)
+        np.cumsum(closed.sum(axis=1), out=self.first[1:])
+        slot_of, direction = np.nonzero(closed) # in the order of tube.faces
+        self.vertices = (self.positions[slot_of, None, :] + CORNERS[direction]).astype(np.float32)
+        self.tex_coords = np.broadcast_to(TEX_COORD, (len(slot_of), 4, 2)).copy()
+        self.colors = np.zeros((len(slot_of), 4, 3), dtype=np.float32)
+        self.textures, self.groups = [], {}
+        self.group = np.zeros(len(self.tubes), dtype=np.int64)
+        for slot, tube in enumerate(self.tubes):
+            self.group[slot] = self.texture_group(tube.texture)
+            if tube.faces:
+                color = tube.faces[0].color
+                self.colors[self.first[slot]: self.first[slot + 1]] = (color.r, color.g, color.b)
+        self.blocks = [tube for tube in self.tubes if hasattr(tube, "hidden")]
+        self.dirty = False
+        self.recolored = True
+        self.uploaded = False
+
+    def recolor(self, tube, color: Color):
+        "the new color of the faces of a tube"
+        if self.dirty: # the arrays are built with the colors of the faces
+            return
+        self.colors[self.first[tube.slot]: self.first[tube.slot + 1]] = (color.r, color.g, color.b)
+        self.recolored = True
+
+    def retexture(self, tube, texture: Texture | None):
+        if self.dirty:
+            return
+        self.group[tube.slot] = self.texture_group(texture)
+
+    def upload(self):
+        if self.buffers is None:
+            self.buffers = glGenBuffers(3)
+        for buffer, array, usage in zip(self.buffers, (self.vertices, self.tex_coords, self.colors),
+                                        (GL_STATIC_DRAW, GL_STATIC_DRAW, GL_DYNAMIC_DRAW)):
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+            glBufferData(GL_ARRAY_BUFFER, array.nbytes, array, usage)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.uploaded = True
+        self.recolored = False
+
+    def visible(self, frustum: Frustum, lit: Iterable | None = None) -> np.ndarray:
+        "the slots in the frustum, <lit> are the tubes with light, None is every tube"
+        if lit is None:
+            slots = self.index.visible(frustum)
+            hidden = [tube.slot for tube in self.blocks if tube.hidden or not tube.brightness_level]
+            if hidden:
+                slots = np.setdiff1d(slots, hidden)
+            return slots
+        slots = np.array([tube.slot for tube in lit if tube.batch is self and tube.brightness_level
+                          and not getattr(tube, "hidden", False)], dtype=np.int64)
+        return slots[frustum.boxes(self.positions[slots], self.positions[slots] + 1)]
+
+    def indices(self, slots: np.ndarray) -> np.ndarray:
+        "the vertices of the faces of the slots"
+        counts = self.first[slots + 1] - self.first[slots]
+        faces = np.repeat(self.first[slots] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return (faces[:, None] * 4 + VERTEX).astype(np.uint32).ravel()
+
+    def draw(self, frustum: Frustum, lit: Iterable | None = None):
+        if self.dirty:
+            self.build()
+        if not len(self.colors):
+            return
+        if not self.uploaded:
+            self.upload()
+        slots = self.visible(frustum, lit)
+        vertex_buffer, tex_buffer, color_buffer = self.buffers
+        glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, tex_buffer)
+        glTexCoordPointer(2, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, color_buffer)
+        if self.recolored:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, self.colors.nbytes, self.colors)
+            self.recolored = False
+        glColorPointer(3, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        group = self.group[slots]
+        for index, texture in enumerate(self.textures):
+            indices = self.indices(slots[group == index])
+            if not len(indices):
+                continue
+            if texture is not None:
+                texture.enable()
+            glDrawElements(GL_QUADS, len(indices), GL_UNSIGNED_INT, indices)
+            if texture is not None:
+                texture.disable()
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
@@ -0,0 +1,102 @@
+from .base_wrapper import *
+from math import tan, sin, cos, radians
+from typing import Iterable, Tuple
+import numpy as np
+
+CHUNK = 8 # the voxels along each side of a chunk of the spatial index
+
+def unit(vector: np.ndarray) -> np.ndarray:
+    return vector / np.linalg.norm(vector)
+
+def rotate(vector: np.ndarray, axis: np.ndarray, angle: float) -> np.ndarray:
+    "the vector turned by <angle> around the unit <axis>, by the right hand"
+    return vector * cos(angle) + np.cross(axis, vector) * sin(angle) + axis * (axis @ vector) * (1 - cos(angle))
+
+def bounds(objs: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+    "the bounding boxes of the registered objects, a quad spans its points, the others fill the voxel at their "
+    "pos_scaler like a tube"
+    lo, hi = [], []
+    for obj in objs:
+        if hasattr(obj, "points"):
+            points = [(p.x, p.y, p.z) for p in obj.points]
+            lo.append(np.min(points, axis=0))
+            hi.append(np.max(points, axis=0))
+        else:
+            p = obj.pos_scaler
+            lo.append((p.x, p.y, p.z))
+            hi.append((p.x + 1, p.y + 1, p.z + 1))
+    return np.array(lo, dtype=np.float64).reshape(-1, 3), np.array(hi, dtype=np.float64).reshape(-1, 3)
+
+
+class Frustum:
+    "the six planes of the view volume of gluPerspective() and gluLookAt(), a plane is a unit normal pointing "
+    "inside and an offset, a point p is inside when normal @ p + offset >= 0 for every plane\n"
+    "<roll> turns the view around <roll_axis> as the tilt of Camera.flip()"
+    def __init__(self, position: Point, target: Point, up: Vector, fovy: float, aspect: float, z_near: float,
+                 z_far: float, roll: float = 0.0, roll_axis: np.ndarray | None = None) -> None:
+        eye = np.array((position.x, position.y, position.z), dtype=np.float64)
+        front = unit(np.array((target.x - position.x, target.y - position.y, target.z - position.z)))
+        side = np.cross(front, (up.x, up.y, up.z))
+        if not side.any(): # looking along the up vector, any side works
+            side = np.cross(front, np.eye(3)[np.argmin(np.abs(front))])
+        side = unit(side)
+        top = np.cross(side, front)
+        if roll:
+            axis = unit(np.asarray(roll_axis, dtype=np.float64))
+            front, side, top = (rotate(v, axis, roll) for v in (front, side, top))
+        vertical = tan(radians(fovy) / 2)
+        horizontal = vertical * aspect
+        self.normals = np.array([front, -front,
+                                 unit(front * horizontal + side), unit(front * horizontal - side),
+                                 unit(front * vertical + top), unit(front * vertical - top)])
+        self.offsets = -self.normals @ eye
+        self.offsets[0] -= z_near
+        self.offsets[1] += z_far
+
+    def boxes(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        "whether each box from <lo> to <hi>, both in shape (N, 3), meets the view volume, a box out of it is out of "
+        "one of the planes, a few boxes near the edges are kept though they are out of the volume"
+        center = (lo + hi) / 2
+        extent = (hi - lo) / 2
+        distance = center @ self.normals.T + extent @ np.abs(self.normals).T + self.offsets
+        return (distance >= 0).all(axis=1)
+
+
+class ChunkIndex:
+    "the items with the bounding boxes from <lo> to <hi> grouped by the chunk of <side> ^ 3 voxels their <lo> is "
+    "in, a chunk keeps the box of its items, so the frustum tests the chunks and only reads the items of the "
+    "visible ones"
+    def __init__(self, lo: np.ndarray, hi: np.ndarray, side: int = CHUNK) -> None:
+        self.side = side
+        keys = np.floor_divide(lo, side).astype(np.int64)
+        if len(keys):
+            keys -= keys.min(axis=0)
+            chunk = np.ravel_multi_index(tuple(keys.T), tuple(keys.max(axis=0) + 1))
+        else:
+            chunk = np.zeros(0, dtype=np.int64)
+        self.items = np.argsort(chunk, kind="stable") # the items of the chunk i are items[first[i]: first[i + 1]]
+        _, counts = np.unique(chunk, return_counts=True)
+        self.first = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.first[1:])
+        self.item_lo, self.item_hi = lo, hi
+        if len(counts):
+            self.lo = np.minimum.reduceat(lo[self.items], self.first[:-1])
+            self.hi = np.maximum.reduceat(hi[self.items], self.first[:-1])
+        else:
+            self.lo = self.hi = np.zeros((0, 3), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def visible(self, frustum: Frustum, box: Tuple[np.ndarray, np.ndarray] | None = None) -> np.ndarray:
+        "the items of the chunks in the frustum, with <box> only the items that meet it"
+        keep = frustum.boxes(self.lo, self.hi)
+        if box is not None:
+            keep &= ((self.hi > box[0]) & (self.lo < box[1])).all(axis=1)
+        chunks = np.flatnonzero(keep)
+        counts = self.first[chunks + 1] - self.first[chunks]
+        rows = np.repeat(self.first[chunks] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        items = self.items[rows]
+        if box is not None:
+            items = items[((self.item_hi[items] > box[0]) & (self.item_lo[items] < box[1])).all(axis=1)]
+        return items
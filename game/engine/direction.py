@@ -0,0 +1,67 @@
+from math import pi
+from itertools import permutations, product
+from typing import Dict, Tuple
+import numpy as np
+
+# a direction is an int, the face of a voxel it points to is in the order of the open-face bitmask of the maze
+X_POS, X_NEG, Y_POS, Y_NEG, Z_POS, Z_NEG = range(6)
+CENTER = 6 # the light source is in the tube itself
+NAMES = ('x+', 'x-', 'y+', 'y-', 'z+', 'z-', 'center') # only for the HUD and the other string boundaries
+UNIT: Tuple[Tuple[int, int, int], ...] = ((1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1))
+UNIT_ARRAY = np.array(UNIT)
+OPPOSITE = (X_NEG, X_POS, Y_NEG, Y_POS, Z_NEG, Z_POS)
+AXIS = (0, 0, 1, 1, 2, 2)
+POSITIVE = (True, False, True, False, True, False)
+
+def parse(direction: int | str) -> int:
+    "a direction from its int or its name"
+    if isinstance(direction, str):
+        if direction not in NAMES:
+            raise ValueError(f"Invalid direction <{direction}>, it should be one of {', '.join(NAMES)}")
+        return NAMES.index(direction)
+    return direction
+
+# a frame is the directions of the (x, y, z) control axes, 24 of the 48 frames are right-handed,
+# a rotation never changes the handedness
+FRAMES: Tuple[Tuple[int, int, int], ...] = tuple((2 * a + sa, 2 * b + sb, 2 * c + sc) for (a, b, c) in permutations(range(3))
+                                                 for sa, sb, sc in product((0, 1), repeat=3))
+RIGHT_HANDED: Tuple[bool, ...] = tuple(bool(np.linalg.det(UNIT_ARRAY[list(frame)]) > 0) for frame in FRAMES)
+FRAME_INDEX: Dict[Tuple[int, int, int], int] = {frame: i for i, frame in enumerate(FRAMES)}
+# the direction the camera heads to in each quadrant of theta, see quadrant()
+HEADING: Tuple[Tuple[int, int, int, int], ...] = tuple((x, y, OPPOSITE[x], OPPOSITE[y]) for x, y, _ in FRAMES)
+# the frame after turning the up axis to the front in each quadrant, the new (x, y, z) axes are
+# (the right side, the old up axis, the back side)
+TURN_UP: Tuple[Tuple[int, int, int, int], ...] = tuple(
+    tuple(FRAME_INDEX[(HEADING[f][(q - 1) % 4], frame[2], HEADING[f][(q + 2) % 4])] for q in range(4))
+    for f, frame in enumerate(FRAMES))
+
+def quadrant(theta: float) -> int:
+    "the quadrant of the angle theta in the horizontal plane, 0 is the x axis of the frame and 1 is the y axis"
+    if theta > pi:
+        theta -= pi * 2
+    elif theta < -pi:
+        theta += pi * 2
+    if -pi / 4 < theta < pi / 4:
+        return 0
+    elif pi / 4 < theta < 3 * pi / 4:
+        return 1
+    elif -3 * pi / 4 < theta < -pi / 4:
+        return 3
+    return 2
+
+def facing(frame: Tuple[int, int, int], theta: float, phi: float) -> int:
+    "the direction the camera looks at"
+    if phi > pi / 4:
+        return frame[2]
+    elif phi < -pi / 4:
+        return OPPOSITE[frame[2]]
+    return HEADING[FRAME_INDEX[frame]][quadrant(theta)]
+# the corners of the unit cube face in each direction, in the order they are drawn
+FACE_CORNERS: Tuple[Tuple[Tuple[int, int, int], ...], ...] = (
+    ((1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)),
+    ((0, 0, 0), (0, 1, 0), (0, 1, 1), (0, 0, 1)),
+    ((0, 1, 0), (1, 1, 0), (1, 1, 1), (0, 1, 1)),
+    ((0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)),
+    ((0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)),
+    ((0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)),
+)
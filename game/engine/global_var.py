@@ -1,6 +1,7 @@
 from typing import Tuple, Dict, Any
 import numpy as np
 import inspect
+from .direction import X_POS, Y_POS, Z_POS, UNIT_ARRAY, FRAME_INDEX, RIGHT_HANDED, parse
 
 __glob: Dict[str, Any] = {'MAX_BRIGHTNESS_LEVEL': 7, "NO_OPENGL": False, "CLOSE": False, 
                           'DISABLE_MOUSE': False, 'ArduinoController': None}
@@ -19,28 +20,18 @@ def get_max_brightness_level() -> int:
 
 
 RIGHT_HAND_COORDINATE: bool = True
-COORDINATOR: Tuple[str, str, str] = ("x+", "y+", "z+")
+COORDINATOR: Tuple[int, int, int] = (X_POS, Y_POS, Z_POS) # the directions of the control axes, see direction.py
 COORDINATE_MAP: np.ndarray = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]])
 
-def set_control_coordinator(x: str = "x+", y: str = "y+", z: str = "z+", camera=None):
+def set_control_coordinator(x: int | str = X_POS, y: int | str = Y_POS, z: int | str = Z_POS, camera=None):
+    "the directions may be given by their names, like 'x+'"
     global RIGHT_HAND_COORDINATE, COORDINATOR, COORDINATE_MAP
-    def get_vec(s: str) -> np.ndarray:
-        if s == "x+":
-            return np.array([1, 0, 0])
-        if s == "x-":
-            return np.array([-1, 0, 0])
-        if s == "y+":
-            return np.array([0, 1, 0])
-        if s == "y-":
-            return np.array([0, -1, 0])
-        if s == "z+":
-            return np.array([0, 0, 1])
-        if s == "z-":
-            return np.array([0, 0, -1])
+    frame = (parse(x), parse(y), parse(z))
+    if frame not in FRAME_INDEX:
         raise ValueError("Invalid direction")
-    mat = np.array([get_vec(x), get_vec(y), get_vec(z)])
-    RIGHT_HAND_COORDINATE = int(np.linalg.det(mat)) > 0
-    COORDINATOR = (x, y, z)
+    mat = UNIT_ARRAY[list(frame)]
+    RIGHT_HAND_COORDINATE = RIGHT_HANDED[FRAME_INDEX[frame]]
+    COORDINATOR = frame
     COORDINATE_MAP = mat
     if camera is not None:
         camera.glu_look_at(up=tuple(mat[2].tolist()))
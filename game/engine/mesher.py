@@ -0,0 +1,341 @@
+from OpenGL.GL import *
+from .base_wrapper import *
+from .batch import Batch, CORNERS, TEX_COORD, VERTEX
+from .culling import Frustum, ChunkIndex
+from .direction import UNIT_ARRAY, AXIS, POSITIVE, CENTER
+from .useful_object import FloatingBlock
+from typing import List, Tuple
+import numpy as np
+
+def shift(array: np.ndarray, d: int) -> np.ndarray:
+    "the array moved one voxel toward the direction d, the voxels coming in are zero"
+    res = np.zeros_like(array)
+    src, dst = [slice(None)] * 3, [slice(None)] * 3
+    axis = AXIS[d]
+    src[axis], dst[axis] = (slice(None, -1), slice(1, None)) if POSITIVE[d] else (slice(1, None), slice(None, -1))
+    res[tuple(dst)] = array[tuple(src)]
+    return res
+
+def mesh_faces(volume: np.ndarray, faces: np.ndarray) -> Tuple[np.ndarray, ...]:
+    "the wall faces of the path voxels of <volume>, a face of a path voxel is a wall where its bit is not set in the "
+    "open-face mask <faces> (see maze.bitmask.open_faces, the mask comes from shifted comparisons of the volume)\n"
+    "it returns the path voxels (sorted flat indices), the faces of each voxel in CSR form (the faces of the voxel i "
+    "are first[i]: first[i + 1]), then for each face its voxel, direction, corners (F, 4, 3), normal toward the "
+    "inside of the voxel (F, 3) and texture coordinates (F, 4, 2)"
+    voxels = np.flatnonzero(volume)
+    closed = (faces.ravel()[voxels][:, None] >> np.arange(6) & 1) == 0
+    slot, direction = np.nonzero(closed) # sorted by voxel, then direction
+    first = np.zeros(len(voxels) + 1, dtype=np.int64)
+    np.cumsum(closed.sum(axis=1), out=first[1:])
+    coords = np.stack(np.unravel_index(voxels, volume.shape), axis=1)
+    corners = (coords[slot, None, :] + CORNERS[direction]).astype(np.float32)
+    normals = -UNIT_ARRAY[direction].astype(np.float32)
+    uvs = np.broadcast_to(TEX_COORD, (len(slot), 4, 2)).copy()
+    return voxels, first, slot, direction.astype(np.uint8), corners, normals, uvs
+
+def greedy_faces(volume: np.ndarray, faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    "the wall faces of mesh_faces() merged into rectangles, the faces of one direction in one plane are first "
+    "merged into runs along the last axis of the plane, then the runs of the same span in the next rows are "
+    "merged, so a straight corridor is a few quads instead of a quad per voxel\n"
+    "it returns the direction (R,), corners (R, 4, 3) and texture coordinates (R, 4, 2) of the rectangles, the "
+    "texture coordinates count the voxels, so the texture repeats once per voxel with GL_REPEAT"
+    path = volume != 0
+    directions, corners, uvs = [], [], []
+    for d in range(6):
+        a = AXIS[d]
+        b, c = (axis for axis in range(3) if axis != a) # the texture s and t axes, see FACE_CORNERS
+        closed = np.transpose(path & (faces >> d & 1 == 0), (a, b, c))
+        padded = np.zeros(closed.shape[:2] + (closed.shape[2] + 2,), dtype=bool)
+        padded[..., 1:-1] = closed
+        start = np.argwhere(padded[..., 1:-1] & ~padded[..., :-2]) # (plane, row, first) of each run
+        end = np.argwhere(padded[..., 1:-1] & ~padded[..., 2:])[:, 2] # the last of each run, in the same order
+        plane, row, first = start.T
+        order = np.lexsort((row, end, first, plane))
+        plane, row, first, end = plane[order], row[order], first[order], end[order]
+        new = np.ones(len(row), dtype=bool) # a run that does not continue the run before it
+        new[1:] = (plane[1:] != plane[:-1]) | (first[1:] != first[:-1]) | (end[1:] != end[:-1]) | \
+                  (row[1:] != row[:-1] + 1)
+        head = np.flatnonzero(new)
+        tail = np.append(head[1:], len(row)) - 1
+        lo = np.zeros((len(head), 3), dtype=np.int64)
+        size = np.ones((len(head), 3), dtype=np.int64)
+        lo[:, a], lo[:, b], lo[:, c] = plane[head], row[head], first[head]
+        size[:, b], size[:, c] = row[tail] - row[head] + 1, end[head] - first[head] + 1
+        corners.append((lo[:, None, :] + CORNERS[d] * size[:, None, :]).astype(np.float32))
+        uvs.append((CORNERS[d][:, [b, c]] * size[:, None, [b, c]]).astype(np.float32))
+        directions.append(np.full(len(head), d, dtype=np.uint8))
+    return np.concatenate(directions), np.concatenate(corners), np.concatenate(uvs)
+
+
+class VoxelMesh(Batch):
+    "the wall faces of a voxel volume in flat arrays, drawn by the Batch VBOs with one texture\n"
+    "the slots are the path voxels, every array of a face, its position, normal, texture coordinates, color, "
+    "voxel and direction, is a row of the same index, so the rendering, the lighting and the picking share them\n"
+    "each voxel has a tint, the face colors are the tint times the brightness of the voxel\n"
+    "with <greedy> the walls are drawn as the rectangles of greedy_faces(), then the color of each voxel is a texel "
+    "of a 3D light texture on the second texture unit instead of a vertex color, so a rectangle keeps the colors "
+    "of the voxels it covers whatever their light"
+    def __init__(self, volume: np.ndarray, faces: np.ndarray, texture: Texture | None = None,
+                 color: GeneralColor = WHITE, origin: Tuple[int, int, int] = (0, 0, 0), greedy: bool = False) -> None:
+        "<faces> is the open-face mask of <volume>, the voxel (i, j, k) is drawn at <origin> + (i, j, k)"
+        super().__init__()
+        if isinstance(color, Color):
+            color = color.to_tuple()
+        self.shape = volume.shape
+        self.faces = faces
+        self.origin = np.array(origin, dtype=np.int64)
+        self.voxels, self.first, slot, self.directions, corners, self.normals, self.tex_coords = \
+            mesh_faces(volume, faces)
+        self.vertices = corners + self.origin.astype(np.float32)
+        self.face_slot = slot
+        self.slot_of = np.full(self.shape, -1, dtype=np.int32)
+        self.slot_of.ravel()[self.voxels] = np.arange(len(self.voxels), dtype=np.int32)
+        self.positions = (np.stack(np.unravel_index(self.voxels, self.shape), axis=1) + self.origin).astype(np.float64)
+        self.index = ChunkIndex(self.positions, self.positions + 1)
+        self.tint = np.empty((len(self.voxels), 3), dtype=np.float32)
+        self.tint[:] = color
+        self.bright = np.ones(len(self.voxels), dtype=np.float32) # the brightness over the maximum
+        self.colors = np.empty((len(slot), 4, 3), dtype=np.float32)
+        self.colors[:] = self.tint[slot, None, :]
+        self.textures = [texture]
+        self.group = np.zeros(len(self.voxels), dtype=np.int64)
+        self.lit = np.zeros(0, dtype=np.int64) # the slots with light
+        self.lighting = False # only the lit slots are drawn once light() is called
+        self.dirty = False
+        self.greedy = greedy
+        if greedy:
+            self.quad_directions, quads, self.quad_uvs = greedy_faces(volume, faces)
+            self.quads = quads + self.origin.astype(np.float32)
+            # the light texture is read at the center of the voxel of a point, half a voxel inside the wall,
+            # the texture is the C-ordered volume, so its (s, t, r) are (z, y, x)
+            inside = quads - 0.5 * UNIT_ARRAY[self.quad_directions][:, None, :]
+            self.quad_light = (inside / self.shape)[..., ::-1].astype(np.float32)
+            self.quad_lo = np.floor(inside.min(axis=1)).astype(np.int64) # the voxels of each rectangle
+            self.quad_hi = np.ceil(inside.max(axis=1)).astype(np.int64)
+            self.quad_index = ChunkIndex(self.quad_lo + self.origin, self.quad_hi + self.origin)
+            self.light_box = (np.zeros(3, dtype=np.int64), np.zeros(3, dtype=np.int64)) # the voxels with light
+            self.light_texels = np.zeros(self.shape + (3,), dtype=np.uint8)
+            self.light_texels[tuple(np.unravel_index(self.voxels, self.shape))] = self.tint * 255
+            self.light_name = None
+            self.touched: List[Tuple[np.ndarray, np.ndarray]] = [] # the boxes of texels to upload
+
+    def build(self):
+        "the arrays are made once from the volume"
+        self.dirty = False
+
+    def slots(self, voxels) -> np.ndarray:
+        "the slots of voxels in shape (N, 3), -1 for a wall or a voxel out of the mesh"
+        local = np.asarray(voxels, dtype=np.int64).reshape(-1, 3) - self.origin
+        inside = ((local >= 0) & (local < self.shape)).all(axis=1)
+        res = np.full(len(local), -1, dtype=np.int64)
+        res[inside] = self.slot_of[tuple(local[inside].T)]
+        return res
+
+    def face_rows(self, slots: np.ndarray) -> np.ndarray:
+        "the faces of the slots"
+        counts = self.first[slots + 1] - self.first[slots]
+        return np.repeat(self.first[slots] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    def paint(self, slots: np.ndarray):
+        "writes the colors of the faces of the slots"
+        if self.greedy:
+            if len(slots):
+                at = np.stack(np.unravel_index(self.voxels[slots], self.shape), axis=1)
+                self.light_texels[tuple(at.T)] = self.tint[slots] * self.bright[slots, None] * 255
+                self.touched.append((at.min(axis=0), at.max(axis=0) + 1))
+            return
+        rows = self.face_rows(slots)
+        self.colors[rows] = (self.tint[self.face_slot[rows]] * self.bright[self.face_slot[rows], None])[:, None, :]
+        self.recolored = True
+
+    def set_tint(self, voxels, color: GeneralColor):
+        "the tint of voxels in shape (N, 3), the walls are skipped"
+        if isinstance(color, Color):
+            color = color.to_tuple()
+        slots = self.slots(voxels)
+        slots = slots[slots >= 0]
+        self.tint[slots] = color
+        self.paint(slots)
+
+    def get_tint(self, voxel: Tuple[int, int, int]) -> Tuple[float, float, float] | None:
+        slot = int(self.slots([voxel])[0])
+        return tuple(self.tint[slot].tolist()) if slot >= 0 else None
+
+    def change_texture(self, texture: Texture | None):
+        self.textures = [texture]
+
+    def light(self, position: Point, level: int):
+        "the light of a source at <position> spreads through the open faces and loses a level at each voxel, as "
+        "Tube.set_light(), the voxels within <level> - 1 steps are found by a breadth-first search over the "
+        "shifted masks of a box around the source, the floating blocks on them are lit too"
+        dark = self.lit if self.lighting else np.arange(len(self.voxels)) # every voxel is bright at first
+        self.bright[dark] = 0
+        self.lighting = True
+        local = np.array((int(position.x), int(position.y), int(position.z))) - self.origin
+        if (local < 0).any() or (local >= self.shape).any() or self.slot_of[tuple(local)] < 0:
+            self.lit = np.zeros(0, dtype=np.int64)
+            if self.greedy:
+                self.paint(dark)
+                self.light_box = (np.zeros(3, dtype=np.int64), np.zeros(3, dtype=np.int64))
+            return
+        lo = np.maximum(local - level + 1, 0)
+        hi = np.minimum(local + level, self.shape)
+        box = tuple(slice(a, b) for a, b in zip(lo, hi))
+        if self.greedy:
+            self.light_box = (lo, hi)
+        faces = self.faces[box]
+        levels = np.zeros(faces.shape, dtype=np.int8)
+        source = np.full(faces.shape, CENTER, dtype=np.uint8) # the direction the light comes from
+        front = np.zeros(faces.shape, dtype=bool)
+        front[tuple(local - lo)] = True
+        levels[front] = level
+        for step in range(level - 1, 0, -1):
+            reached = np.zeros(faces.shape, dtype=bool)
+            for d in range(6):
+                new = shift(front & (faces >> d & 1 == 1), d) & (levels == 0) & ~reached
+                source[new] = d
+                reached |= new
+            if not reached.any():
+                break
+            levels[reached] = step
+            front = reached
+        at = np.argwhere(levels > 0)
+        lit_levels = levels[tuple(at.T)].astype(np.float32)
+        lit_source = source[tuple(at.T)]
+        self.lit = self.slot_of[tuple((at + lo).T)].astype(np.int64)
+        # the voxels next to the source are brighter on the side the source is near
+        x, y, z = position.x - int(position.x), position.y - int(position.y), position.z - int(position.z)
+        relative = (x, y, z)
+        near = np.array([1 - relative[AXIS[d]] if POSITIVE[d] else relative[AXIS[d]] for d in range(6)] + [1.0],
+                        dtype=np.float32)
+        self.bright[self.lit] = (lit_levels + 1 - near[lit_source]) / level
+        self.paint(np.concatenate((dark, self.lit)) if self.greedy else self.lit) # the drawn walls of the dark
+        if FloatingBlock.ALL:
+            origin = self.origin + lo
+            relative = Point(x, y, z)
+            for key, block in FloatingBlock.ALL.items():
+                i, j, k = (v - o for v, o in zip(key, origin))
+                if 0 <= i < levels.shape[0] and 0 <= j < levels.shape[1] and 0 <= k < levels.shape[2] \
+                   and levels[i, j, k]:
+                    block.set_light(int(levels[i, j, k]), relative, int(source[i, j, k]))
+
+    def visible(self, frustum: Frustum, lit=None) -> np.ndarray:
+        "the lit slots in the frustum once light() is called, else the slots of the chunks in the frustum"
+        if not self.lighting:
+            return self.index.visible(frustum)
+        return self.lit[frustum.boxes(self.positions[self.lit], self.positions[self.lit] + 1)]
+
+    def upload_light(self):
+        "the light texture, then the boxes of texels painted since the last draw"
+        if self.light_name is None:
+            self.light_name = int(glGenTextures(1))
+            glBindTexture(GL_TEXTURE_3D, self.light_name)
+            glTexParameteri(GL_TEXTURE_3D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_3D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            for wrap in (GL_TEXTURE_WRAP_S, GL_TEXTURE_WRAP_T, GL_TEXTURE_WRAP_R):
+                glTexParameteri(GL_TEXTURE_3D, wrap, GL_CLAMP_TO_EDGE)
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+            x, y, z = self.shape
+            glTexImage3D(GL_TEXTURE_3D, 0, GL_RGB8, z, y, x, 0, GL_RGB, GL_UNSIGNED_BYTE, self.light_texels)
+            self.touched.clear()
+            return
+        glBindTexture(GL_TEXTURE_3D, self.light_name)
+        if not self.touched:
+            return
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        for lo, hi in self.touched:
+            (x0, y0, z0), (x1, y1, z1) = lo.tolist(), hi.tolist()
+            texels = np.ascontiguousarray(self.light_texels[x0: x1, y0: y1, z0: z1])
+            glTexSubImage3D(GL_TEXTURE_3D, 0, z0, y0, x0, z1 - z0, y1 - y0, x1 - x0, GL_RGB, GL_UNSIGNED_BYTE, texels)
+        self.touched.clear()
+
+    def upload(self):
+        if not self.greedy:
+            return super().upload()
+        if self.buffers is None:
+            self.buffers = glGenBuffers(3)
+        for buffer, array in zip(self.buffers, (self.quads, self.quad_uvs, self.quad_light)):
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+            glBufferData(GL_ARRAY_BUFFER, array.nbytes, array, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.uploaded = True
+
+    def draw(self, frustum: Frustum, lit=None):
+        "the greedy rectangles of the chunks in the frustum are drawn by one call, with light only the ones that "
+        "reach the box of the lit voxels, the others would be black"
+        if not self.greedy:
+            return super().draw(frustum, lit)
+        if not len(self.quads):
+            return
+        if not self.uploaded:
+            self.upload()
+        vertex_buffer, tex_buffer, light_buffer = self.buffers
+        glActiveTexture(GL_TEXTURE1)
+        glEnable(GL_TEXTURE_3D)
+        self.upload_light()
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        glClientActiveTexture(GL_TEXTURE1)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, light_buffer)
+        glTexCoordPointer(3, GL_FLOAT, 0, None)
+        glActiveTexture(GL_TEXTURE0)
+        glClientActiveTexture(GL_TEXTURE0)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, tex_buffer)
+        glTexCoordPointer(2, GL_FLOAT, 0, None)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glColor3f(1.0, 1.0, 1.0)
+        texture = self.textures[0]
+        if texture is not None:
+            texture.enable()
+        if self.lighting:
+            lo, hi = self.light_box
+            near = self.quad_index.visible(frustum, (lo + self.origin, hi + self.origin))
+        else:
+            near = self.quad_index.visible(frustum)
+        indices = (near[:, None] * 4 + VERTEX).astype(np.uint32).ravel()
+        glDrawElements(GL_QUADS, len(indices), GL_UNSIGNED_INT, indices)
+        if texture is not None:
+            texture.disable()
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glClientActiveTexture(GL_TEXTURE1)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glClientActiveTexture(GL_TEXTURE0)
+        glActiveTexture(GL_TEXTURE1)
+        glDisable(GL_TEXTURE_3D)
+        glActiveTexture(GL_TEXTURE0)
+
+    def face(self, slot: int, d: int) -> int:
+        "the face of the slot in the direction d, -1 if that face is open"
+        mask = int(self.faces.ravel()[self.voxels[slot]])
+        if mask >> d & 1:
+            return -1
+        closed = ~mask & ((1 << d) - 1)
+        return int(self.first[slot]) + bin(closed).count("1")
+
+    def pick(self, origin: Point, direction: Vector, distance: float = 64.0) -> int:
+        "the face a ray from <origin> along <direction> hits first, the voxels are walked one by one (a 3D DDA), "
+        "-1 if the ray starts in a wall or goes farther than <distance>"
+        p = [origin.x - self.origin[0], origin.y - self.origin[1], origin.z - self.origin[2]]
+        v = [int(np.floor(c)) for c in p]
+        if any(c < 0 or c >= s for c, s in zip(v, self.shape)) or self.slot_of[tuple(v)] < 0:
+            return -1
+        ray = (direction.x, direction.y, direction.z)
+        step = [1 if r > 0 else -1 for r in ray]
+        t_next = [((v[a] + (step[a] > 0)) - p[a]) / ray[a] if ray[a] else np.inf for a in range(3)]
+        t_delta = [abs(1 / ray[a]) if ray[a] else np.inf for a in range(3)]
+        while True:
+            axis = int(np.argmin(t_next))
+            if t_next[axis] > distance:
+                return -1
+            d = 2 * axis + (step[axis] < 0)
+            slot = int(self.slot_of[tuple(v)])
+            face = self.face(slot, d)
+            if face >= 0:
+                return face
+            v[axis] += step[axis]
+            t_next[axis] += t_delta[axis]
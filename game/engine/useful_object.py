@@ -1,64 +1,44 @@
 from .base_object import *
 from .global_var import get_max_brightness_level
+from .direction import UNIT, AXIS, POSITIVE, CENTER, FACE_CORNERS, parse
 from typing import Tuple, List, Dict, Callable
 
 class Tube:
-    all_directions = ('x+', 'x-', 'y+', 'y-', 'z+', 'z-')
     shader = {'x': 0.99, 'y': 0.8, 'z': 1.0}
-    ALL: Dict[Point, 'Tube'] = {}
-    def __init__(self, position: GeneralPoint, direction: str | Tuple[str, ...], color: GeneralColor = WHITE, 
+    ALL: Dict[Tuple[int, int, int], 'Tube'] = {}
+    LIT: Dict[Tuple[int, int, int], 'Tube'] = {} # the tubes with light, only they are reset
+    batch = None # the Batch the faces are drawn by, see batch.py
+    def __init__(self, position: GeneralPoint, direction: int | str | Tuple[str, ...], color: GeneralColor = WHITE, 
                  brightness_level: int | None= None, texture: Texture | None = None, 
                  register: bool = True) -> None:
+        "direction is the open faces, a mask of the maze open-face bitmask (the bit d is the direction d), "
+        "an axis like 'x' or the names of the directions"
         if isinstance(position, tuple):
             position = Point(*position)
         self.position = position
-        Tube.ALL[position] = self
+        self.key = (int(position.x), int(position.y), int(position.z))
+        Tube.ALL[self.key] = self
         self.pos_scaler = position
         if isinstance(color, tuple):
             color = Color(*color)
         self.color = color
         if isinstance(direction, str):
             direction = (f"{direction}+", f"{direction}-")
-        self.direction = direction
+        if not isinstance(direction, int):
+            direction = sum(1 << parse(i) for i in set(direction))
+        self.mask = direction
         if brightness_level is None:
             brightness_level = get_max_brightness_level()
         self.brightness_level = brightness_level
+        if brightness_level:
+            Tube.LIT[self.key] = self
         self.texture = texture
         self.faces: List[Quad] = []
         brightness = self.brightness_level / get_max_brightness_level()
-        for i in self.all_directions:
-            if i in direction:
+        for d, corners in enumerate(FACE_CORNERS):
+            if direction >> d & 1:
                 continue
-            if i == 'x+':
-                vertex = ((position.x + 1, position.y, position.z),
-                          (position.x + 1, position.y + 1, position.z),
-                          (position.x + 1, position.y + 1, position.z + 1),
-                          (position.x + 1, position.y, position.z + 1))
-            elif i == 'x-':
-                vertex = ((position.x, position.y, position.z),
-                          (position.x, position.y + 1, position.z),
-                          (position.x, position.y + 1, position.z + 1),
-                          (position.x, position.y, position.z + 1))
-            elif i == 'y+':
-                vertex = ((position.x, position.y + 1, position.z),
-                          (position.x + 1, position.y + 1, position.z),
-                          (position.x + 1, position.y + 1, position.z + 1),
-                          (position.x, position.y + 1, position.z + 1))
-            elif i == 'y-':
-                vertex = ((position.x, position.y, position.z),
-                          (position.x + 1, position.y, position.z),
-                          (position.x + 1, position.y, position.z + 1),
-                          (position.x, position.y, position.z + 1))
-            elif i == 'z+':
-                vertex = ((position.x, position.y, position.z + 1),
-                          (position.x + 1, position.y, position.z + 1),
-                          (position.x + 1, position.y + 1, position.z + 1),
-                          (position.x, position.y + 1, position.z + 1))
-            elif i == 'z-':
-                vertex = ((position.x, position.y, position.z),
-                          (position.x + 1, position.y, position.z),
-                          (position.x + 1, position.y + 1, position.z),
-                          (position.x, position.y + 1, position.z))
+            vertex = tuple((position.x + dx, position.y + dy, position.z + dz) for dx, dy, dz in corners)
             self.faces.append(Quad(vertex, color=color * brightness, texture=texture, register=not register))
         if register:
             get_var("GLOBAL_RENDER").register(self) 
@@ -69,7 +49,9 @@ class Tube:
         for face in self.faces:
             face.draw()
     
-    def change_color(self, color: GeneralColor, relative_pos: Point | None = None, source_direction: str | None = None):
+    def change_color(self, color: GeneralColor, relative_pos: Point | None = None, 
+                     source_direction: int | str | None = None):
+        "source_direction is the direction from the light source, or CENTER if the source is in the tube"
         if isinstance(color, tuple):
             color = Color(*color)
         self.color = color
@@ -79,70 +61,60 @@ class Tube:
             raise ValueError("Both relative_pos and source_direction should be None or not None")
         else:
             brightness_level = self.brightness_level + 1
-            if source_direction == "x+":
-                brightness_level -= 1 - relative_pos.x
-            elif source_direction == "x-":
-                brightness_level -= relative_pos.x
-            elif source_direction == "y+":
-                brightness_level -= 1 - relative_pos.y
-            elif source_direction == "y-":
-                brightness_level -= relative_pos.y
-            elif source_direction == "z+":
-                brightness_level -= 1 - relative_pos.z
-            elif source_direction == "z-":
-                brightness_level -= relative_pos.z
-            elif source_direction == 'center':
+            source_direction = parse(source_direction)
+            if source_direction == CENTER:
                 brightness_level -= 1
             else:
-                raise ValueError("source_direction should be one of 'x+', 'x-', 'y+', 'y-', 'z+', 'z-', 'center'")
+                pos = (relative_pos.x, relative_pos.y, relative_pos.z)[AXIS[source_direction]]
+                brightness_level -= 1 - pos if POSITIVE[source_direction] else pos
         color = color * (brightness_level / get_max_brightness_level())
         for face in self.faces:
             face.change_color(color)
+        if self.batch is not None:
+            self.batch.recolor(self, color)
     
     @classmethod
     def reset_brightness_level(cls):
-        for tube in cls.ALL.values():
+        for tube in cls.LIT.values():
             tube.brightness_level = 0
+        cls.LIT.clear()
     
-    def set_light(self, level: int, relative_pos: Point = Point(0.5, 0.5, 0.5), source_direction: str = 'center'):
+    def set_light(self, level: int, relative_pos: Point = Point(0.5, 0.5, 0.5), source_direction: int = CENTER):
         self.brightness_level = level
         if not level:
             return
-        for direction in self.direction:
-            if direction == 'x+':
-                pos = Point(self.position.x + 1, self.position.y, self.position.z)
-            elif direction == 'x-':
-                pos = Point(self.position.x - 1, self.position.y, self.position.z)
-            elif direction == 'y+':
-                pos = Point(self.position.x, self.position.y + 1, self.position.z)
-            elif direction == 'y-':
-                pos = Point(self.position.x, self.position.y - 1, self.position.z)
-            elif direction == 'z+':
-                pos = Point(self.position.x, self.position.y, self.position.z + 1)
-            elif direction == 'z-':
-                pos = Point(self.position.x, self.position.y, self.position.z - 1)
-            if pos in self.ALL and self.ALL[pos].brightness_level < level - 1:
-                self.ALL[pos].set_light(level - 1, relative_pos, direction)
+        Tube.LIT[self.key] = self
+        x, y, z = self.key
+        for d, (dx, dy, dz) in enumerate(UNIT):
+            if not self.mask >> d & 1:
+                continue
+            tube = self.ALL.get((x + dx, y + dy, z + dz))
+            if tube is not None and tube.brightness_level < level - 1:
+                tube.set_light(level - 1, relative_pos, d)
         self.change_color(self.color, relative_pos, source_direction)
-        if self.pos_scaler in FloatingBlock.ALL:
-            FloatingBlock.ALL[self.pos_scaler].set_light(level, relative_pos, source_direction)
+        if self.key in FloatingBlock.ALL:
+            FloatingBlock.ALL[self.key].set_light(level, relative_pos, source_direction)
 
     def change_texture(self, texture: Texture):
         self.texture = texture
         for face in self.faces:
             face.change_texture(texture)
+        if self.batch is not None:
+            self.batch.retexture(self, texture)
 
 
 
 class FloatingBlock(Tube):
-    ALL: Dict[Point, 'FloatingBlock'] = {}
+    ALL: Dict[Tuple[int, int, int], 'FloatingBlock'] = {}
+    LIT: Dict[Tuple[int, int, int], 'FloatingBlock'] = {}
     def __init__(self, position: GeneralPoint, color: GeneralColor = WHITE, 
                  brightness_level: int | None= None, texture: Texture | None = None, 
                  register: bool = True, collide: bool = True, hide: bool = False) -> None:
         if isinstance(position, tuple):
             position = Point(*position)
         self.position = position
-        FloatingBlock.ALL[position] = self
+        self.key = (int(position.x), int(position.y), int(position.z))
+        FloatingBlock.ALL[self.key] = self
         self.pos_scaler = position
         if isinstance(color, tuple):
             color = Color(*color)
@@ -150,6 +122,9 @@ class FloatingBlock(Tube):
         if brightness_level is None:
             brightness_level = get_max_brightness_level()
         self.brightness_level = brightness_level
+        if brightness_level:
+            FloatingBlock.LIT[self.key] = self
+        self.mask = 0 # every face is drawn
         self.texture = texture
         self.faces: List[Quad] = []
         brightness = self.brightness_level / get_max_brightness_level()
@@ -160,43 +135,17 @@ class FloatingBlock(Tube):
             self.hide()
         else:
             self.show()
-        vertex = ((position.x + 1, position.y, position.z),
-                  (position.x + 1, position.y + 1, position.z),
-                  (position.x + 1, position.y + 1, position.z + 1),
-                  (position.x + 1, position.y, position.z + 1))
-        self.faces.append(Quad(vertex, color=color * brightness, texture=texture, register=not register))
-        vertex = ((position.x, position.y, position.z),
-                  (position.x, position.y + 1, position.z),
-                  (position.x, position.y + 1, position.z + 1),
-                  (position.x, position.y, position.z + 1))
-        self.faces.append(Quad(vertex, color=color * brightness, texture=texture, register=not register))
-        vertex = ((position.x, position.y + 1, position.z),
-                  (position.x + 1, position.y + 1, position.z),
-                  (position.x + 1, position.y + 1, position.z + 1),
-                  (position.x, position.y + 1, position.z + 1))
-        self.faces.append(Quad(vertex, color=color * brightness, texture=texture, register=not register))
-        vertex = ((position.x, position.y, position.z),
-                  (position.x + 1, position.y, position.z),
-                  (position.x + 1, position.y, position.z + 1),
-                  (position.x, position.y, position.z + 1))
-        self.faces.append(Quad(vertex, color=color * brightness, texture=texture, register=not register))
-        vertex = ((position.x, position.y, position.z),
-                  (position.x + 1, position.y, position.z),
-                  (position.x + 1, position.y + 1, position.z),
-                  (position.x, position.y + 1, position.z))
-        self.faces.append(Quad(vertex, color=color * brightness, texture=texture, register=not register))
-        vertex = ((position.x, position.y, position.z + 1),
-                  (position.x + 1, position.y, position.z + 1),
-                  (position.x + 1, position.y + 1, position.z + 1),
-                  (position.x, position.y + 1, position.z + 1))
-        self.faces.append(Quad(vertex, color=color * brightness, texture=texture, register=not register))
+        for corners in FACE_CORNERS:
+            vertex = tuple((position.x + dx, position.y + dy, position.z + dz) for dx, dy, dz in corners)
+            self.faces.append(Quad(vertex, color=color * brightness, texture=texture, register=not register))
         if register:
             get_var("GLOBAL_RENDER").register(self) 
     
-    def set_light(self, level: int, relative_pos: Point = Point(0.5, 0.5, 0.5), source_direction: str = 'center'):
+    def set_light(self, level: int, relative_pos: Point = Point(0.5, 0.5, 0.5), source_direction: int = CENTER):
         self.brightness_level = level
         if not level:
             return
+        FloatingBlock.LIT[self.key] = self
         self.change_color(self.color, relative_pos, source_direction)
 
     def draw(self):
@@ -207,10 +156,10 @@ class FloatingBlock(Tube):
             face.draw()
 
     def show(self):
+        "the walls of the blocks are in the volumes of the maze phases, showing a block only pushes the player out"
         self.hidden = False
         if self.collide:
             x, y, z = int(self.pos_scaler.x), int(self.pos_scaler.y), int(self.pos_scaler.z)
-            self.change_maze(x, y, z, 0)
             pos = get_var("GLOBAL_RENDER").camera.position
             if int(pos.x) == x and int(pos.y) == y and int(pos.z) == z:
                 maze = get_var("GLOBAL_VIEWER").maze.maze
@@ -229,11 +178,6 @@ class FloatingBlock(Tube):
 
     def hide(self):
         self.hidden = True
-        if self.collide:
-            self.change_maze(int(self.pos_scaler.x), int(self.pos_scaler.y), int(self.pos_scaler.z), 1)
-
-    def change_maze(self, x: int, y: int, z: int, value: int):
-        get_var("GLOBAL_VIEWER").maze.maze[x, y, z] = value
 
 
 
@@ -1,2 +1,4 @@
 from .maze3d import Maze
-from .maze_viewer import Viewer
\ No newline at end of file
+from .chunked import ChunkedMaze
+from .maze_viewer import Viewer, ChunkViewer
+from .generator import GENERATORS
\ No newline at end of file
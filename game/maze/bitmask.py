@@ -0,0 +1,37 @@
+import numpy as np
+from typing import Tuple
+from ..engine.direction import UNIT as OFFSETS
+
+# the bit of each direction in the open-face mask, the bit d is the direction d of engine.direction,
+# in the order x+, x-, y+, y-, z+, z-
+X_POS, X_NEG, Y_POS, Y_NEG, Z_POS, Z_NEG = (1 << i for i in range(6))
+
+def open_faces(volume: np.ndarray, out: np.ndarray | None = None, slab: int = 32) -> np.ndarray:
+    "returns the open-face mask of a maze volume in uint8, the bit i of a voxel is set if both the voxel "
+    "and its neighbor at OFFSETS[i] are path, the voxels out of the volume are walls\n"
+    "<out> is the uint8 array to write the mask in, like an np.memmap, the volume is read <slab> layers of x at a "
+    "time, so the temporaries stay small for a large volume"
+    faces = np.zeros(volume.shape, dtype=np.uint8) if out is None else out
+    for x0 in range(0, volume.shape[0], slab):
+        x1 = min(x0 + slab, volume.shape[0])
+        lo = max(x0 - 1, 0) # the layers around the slab give the bits of its x faces
+        faces[x0: x1] = slab_faces(volume[lo: x1 + 1])[x0 - lo: x1 - lo]
+    return faces
+
+def slab_faces(volume: np.ndarray) -> np.ndarray:
+    "the open-face mask of a part of the volume, the faces toward the voxels out of it are closed"
+    path = volume != 0
+    faces = np.zeros(volume.shape, dtype=np.uint8)
+    for axis in range(3):
+        low = [slice(None)] * 3
+        high = [slice(None)] * 3
+        low[axis] = slice(None, -1)
+        high[axis] = slice(1, None)
+        both = (path[tuple(low)] & path[tuple(high)]).view(np.uint8)
+        faces[tuple(low)] |= both << (2 * axis) # the positive direction of the lower voxel
+        faces[tuple(high)] |= both << (2 * axis + 1)
+    return faces
+
+def directions(mask: int) -> Tuple[int, ...]:
+    "the indices in OFFSETS of the bits set in a mask"
+    return tuple(i for i in range(6) if mask >> i & 1)
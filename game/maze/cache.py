@@ -0,0 +1,13 @@
+import hashlib
+import os
+
+CACHE_VERSION = 5 # bump it when the generation changes, old artifacts are then never hit
+
+def cache_key(**params) -> str:
+    "the content address of a maze, it is the sha1 of its generation parameters"
+    text = repr(sorted(params.items()) + [("version", CACHE_VERSION)])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def cache_path(directory: str, **params) -> str:
+    "the path of the cached maze in the directory"
+    return os.path.join(directory, f"maze_{cache_key(**params)}.maze")
@@ -0,0 +1,179 @@
+import random
+import numpy as np
+from collections import OrderedDict
+from threading import Lock
+from ..engine import Point, GeneralPoint
+from .generator import GENERATORS, carve
+from .bitmask import slab_faces
+from .collision import sweep
+from typing import Tuple, List
+
+Key = Tuple[int, int, int] # the coordinate of a chunk
+CHUNK_CELLS = 6 # the cells along each side of a chunk
+CAPACITY = 128 # the chunks kept before the least recently used one is dropped
+
+class ChunkManager:
+    "the volume of an infinite maze, cut into chunks of <chunk> ^ 3 cells that are made when they are first read\n"
+    "the chunk (i, j, k) covers the voxels from (i, j, k) * side to (i + 1, j + 1, k + 1) * side - 1, "
+    "side = 2 * chunk, its first layer along each axis is the wall it shares with the chunk before it, "
+    "so a chunk only depends on (seed, coordinate) and the same seed always gives the same maze\n"
+    "every chunk is a perfect maze, and the wall it shares with the chunk before it along each axis has <doors> "
+    "doors, picked from the seed and the pair of chunks, so the chunks are connected to each other\n"
+    "the maze is the octant of the non-negative voxels, the voxels out of it are walls"
+    def __init__(self, seed: int, chunk: int = CHUNK_CELLS, algorithm: str = "prim",
+                 capacity: int = CAPACITY, doors: int = 1) -> None:
+        if algorithm not in GENERATORS:
+            raise ValueError(f"Unknown maze algorithm <{algorithm}>, it should be one of {', '.join(GENERATORS)}")
+        if capacity < 1:
+            raise ValueError("The capacity should be at least one chunk")
+        self.seed = seed
+        self.chunk = chunk
+        self.side = chunk * 2
+        self.algorithm = algorithm
+        self.capacity = capacity
+        self.doors_per_face = doors
+        self.chunks: OrderedDict[Key, Tuple[np.ndarray, np.ndarray]] = OrderedDict() # the LRU, oldest first
+        self.lock = Lock()
+        self.faces = ChunkFaces(self)
+
+    def rng(self, *key) -> random.Random:
+        "a random generator for the key, a str seed is hashed by sha512, so it is the same in every process"
+        return random.Random(f"{self.seed}:{':'.join(map(str, key))}")
+
+    def doors(self, key: Key, axis: int) -> List[Tuple[int, int, int]]:
+        "the local voxels of the doors in the first layer of the chunk along <axis>, "
+        "there is none on the border of the octant"
+        if key[axis] <= 0:
+            return []
+        rng = self.rng(*key, axis)
+        res = []
+        for _ in range(self.doors_per_face):
+            voxel = [rng.randrange(self.chunk) * 2 + 1 for _ in range(3)]
+            voxel[axis] = 0
+            res.append(tuple(voxel))
+        return res
+
+    def generate(self, key: Key) -> Tuple[np.ndarray, np.ndarray]:
+        "the volume of a chunk and its open-face mask, both in shape (side, side, side)"
+        passage = GENERATORS[self.algorithm](self.chunk, self.chunk, self.chunk, self.rng(*key))
+        volume = np.ascontiguousarray(carve(passage)[:-1, :-1, :-1]) # the last walls are the next chunks'
+        # the voxels around the chunk give the faces of its border, a door leads to a cell of the chunk before, and
+        # the first layer of the chunk after is wall but its doors
+        padded = np.zeros((self.side + 2,) * 3, dtype=np.uint8)
+        padded[1:-1, 1:-1, 1:-1] = volume
+        for axis in range(3):
+            for voxel in self.doors(key, axis):
+                volume[voxel] = 1
+                padded[tuple(v + 1 for v in voxel)] = 1
+                padded[tuple(v if a == axis else v + 1 for a, v in enumerate(voxel))] = 1
+            after = tuple(k + (a == axis) for a, k in enumerate(key))
+            for voxel in self.doors(after, axis):
+                padded[tuple(self.side + 1 if a == axis else v + 1 for a, v in enumerate(voxel))] = 1
+        return volume, slab_faces(padded)[1:-1, 1:-1, 1:-1]
+
+    def get(self, key: Key) -> Tuple[np.ndarray, np.ndarray]:
+        "the volume and the open-face mask of a chunk, it is made if it is not kept"
+        with self.lock:
+            entry = self.chunks.get(key)
+            if entry is not None:
+                self.chunks.move_to_end(key)
+                return entry
+        entry = self.generate(key) # out of the lock, another thread makes the same chunk at worst
+        with self.lock:
+            self.chunks[key] = entry
+            while len(self.chunks) > self.capacity:
+                self.chunks.popitem(last=False)
+        return entry
+
+    def chunk_of(self, position: GeneralPoint | Tuple[float, float, float]) -> Key:
+        "the chunk of a position"
+        if isinstance(position, Point):
+            position = (position.x, position.y, position.z)
+        return tuple(int(v) // self.side for v in position)
+
+    def origin(self, key: Key) -> Tuple[int, int, int]:
+        "the first voxel of a chunk"
+        return tuple(k * self.side for k in key)
+
+    def __getitem__(self, index: Tuple[int, int, int]) -> int:
+        "the voxel of a position in ints, like a volume"
+        x, y, z = index
+        if x < 0 or y < 0 or z < 0:
+            return 0
+        s = self.side
+        volume, _ = self.get((x // s, y // s, z // s))
+        return int(volume[x % s, y % s, z % s])
+
+    def region(self, lo: Key, hi: Key) -> np.ndarray:
+        "the volume of the chunks from <lo> to <hi>, both included, in one array"
+        shape = tuple((h - l + 1) * self.side for l, h in zip(lo, hi))
+        res = np.zeros(shape, dtype=np.uint8)
+        for i in range(lo[0], hi[0] + 1):
+            for j in range(lo[1], hi[1] + 1):
+                for k in range(lo[2], hi[2] + 1):
+                    x, y, z = ((v - l) * self.side for v, l in zip((i, j, k), lo))
+                    res[x: x + self.side, y: y + self.side, z: z + self.side] = self.get((i, j, k))[0]
+        return res
+
+
+class ChunkFaces:
+    "the open-face mask of a ChunkManager, read by a position in ints like Maze.layout_faces"
+    def __init__(self, chunks: ChunkManager) -> None:
+        self.chunks = chunks
+
+    def __getitem__(self, index: Tuple[int, int, int]) -> int:
+        x, y, z = index
+        if x < 0 or y < 0 or z < 0:
+            return 0
+        s = self.chunks.side
+        _, faces = self.chunks.get((x // s, y // s, z // s))
+        return int(faces[x % s, y % s, z % s])
+
+
+class ChunkedMaze:
+    'one is path, zero is wall'
+    def __init__(self, chunk: int = CHUNK_CELLS, delta: float = 0.2, algorithm: str = "prim",
+                 seed: int | None = None, capacity: int = CAPACITY) -> None:
+        "an endless maze made around the player, see ChunkManager, nothing is made until it is read, "
+        "so it starts at once whatever the size of the explored maze\n"
+        "without a seed a random one is picked, the maze is still the same in every process it is pickled to\n"
+        "it has no goal, chambers or floating blocks, the player starts at (1, 1, 1)"
+        self.chunk = chunk
+        self.delta = delta
+        self.algorithm = algorithm
+        self.seed = seed if seed is not None else random.randrange(1 << 32)
+        self.capacity = capacity
+        self.chunks = ChunkManager(self.seed, chunk, algorithm, capacity)
+        self.phase = 0
+
+    def __reduce__(self):
+        "the chunks are made again where the maze is unpickled"
+        return ChunkedMaze, (self.chunk, self.delta, self.algorithm, self.seed, self.capacity)
+
+    @property
+    def maze(self) -> ChunkManager:
+        return self.chunks
+
+    @property
+    def layout_faces(self) -> ChunkFaces:
+        return self.chunks.faces
+
+    def set_phase(self, phase: int):
+        "there are no floating blocks, the phase only follows the texture"
+        self.phase = phase
+
+    def cell_at(self, position: GeneralPoint) -> int:
+        "there are no chambers"
+        return 0
+
+    def in_cell(self, position: GeneralPoint) -> bool:
+        return False
+
+    def position_refiner(self, position: GeneralPoint, start: GeneralPoint | None = None) -> Tuple[GeneralPoint, bool]:
+        "as Maze.position_refiner(), the voxels are read from the chunks"
+        if isinstance(position, Point):
+            position = (position.x, position.y, position.z)
+        if isinstance(start, Point):
+            start = (start.x, start.y, start.z)
+        (x, y, z), collide = sweep(self.chunks, start, position, self.delta)
+        return Point(x, y, z), collide
@@ -0,0 +1,120 @@
+import numpy as np
+from typing import Sequence, Tuple
+
+Coordinate = Tuple[float, float, float]
+MAX_PUSHES = 64 # a position deep inside the walls is pushed at most this many times
+
+def push_out(volume: np.ndarray, p: list, radius: float) -> bool:
+    "keeps the position <p> (a list of three floats, changed in place) <radius> away from the walls of <volume>\n"
+    "the probes are the position moved <radius> along x+, x-, y+, y-, z+, z- in this order, a probe in a wall "
+    "puts the position back <radius> * 1.01 from the face of that wall, then the probes start over\n"
+    "it returns True if any probe hit a wall"
+    margin = radius * 1.01
+    collide = False
+    for _ in range(MAX_PUSHES):
+        x, y, z = p
+        i, j, k = int(x), int(y), int(z)
+        if not volume[int(x + radius), j, k]:
+            p[0] = int(x + radius) - margin
+        elif not volume[int(x - radius), j, k]:
+            p[0] = i + margin
+        elif not volume[i, int(y + radius), k]:
+            p[1] = int(y + radius) - margin
+        elif not volume[i, int(y - radius), k]:
+            p[1] = j + margin
+        elif not volume[i, j, int(z + radius)]:
+            p[2] = int(z + radius) - margin
+        elif not volume[i, j, int(z - radius)]:
+            p[2] = k + margin
+        else:
+            break
+        collide = True
+    return collide
+
+def sweep(volume: np.ndarray, start: Sequence[float] | None, end: Sequence[float],
+          radius: float) -> Tuple[Coordinate, bool]:
+    "moves a point of <radius> from <start> to <end> through the path voxels of <volume> (zero is wall), "
+    "start and end are any three floats, like a tuple or a NumPy array\n"
+    "the motion is taken one axis at a time, x, y, then z, and the leading probe checks every voxel it crosses, "
+    "so a step longer than a voxel cannot pass through a wall, a blocked axis stops at the wall while the other "
+    "axes go on, which slides along the wall\n"
+    "without <start> the end is only pushed out of the walls, as push_out()\n"
+    "it returns the resolved position and True if it hit a wall"
+    p = [float(end[0]), float(end[1]), float(end[2])]
+    collide = False
+    if start is not None:
+        margin = radius * 1.01
+        p = [float(start[0]), float(start[1]), float(start[2])]
+        for axis in range(3):
+            target = float(end[axis])
+            at = [int(p[0]), int(p[1]), int(p[2])]
+            if target > p[axis]:
+                for k in range(int(p[axis] + radius) + 1, int(target + radius) + 1):
+                    at[axis] = k
+                    if not volume[at[0], at[1], at[2]]:
+                        target = k - margin
+                        collide = True
+                        break
+            elif target < p[axis]:
+                for k in range(int(p[axis] - radius) - 1, int(target - radius) - 1, -1):
+                    at[axis] = k
+                    if not volume[at[0], at[1], at[2]]:
+                        target = k + 1 + margin
+                        collide = True
+                        break
+            p[axis] = target
+    collide = push_out(volume, p, radius) or collide
+    return (p[0], p[1], p[2]), collide
+
+def sweep_batch(volume: np.ndarray, starts: np.ndarray | None, ends: np.ndarray,
+                radius: float) -> Tuple[np.ndarray, np.ndarray]:
+    "sweep() for many points at once, <starts> and <ends> are in shape (N, 3)\n"
+    "every step is a few array operations over all points, the loops only run over the voxels crossed by the "
+    "longest move and the pushes of push_out()\n"
+    "it returns the resolved positions in float64 and whether each point hit a wall"
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 3)
+    margin = radius * 1.01
+    collide = np.zeros(len(ends), dtype=bool)
+    if starts is None:
+        p = ends.copy()
+    else:
+        p = np.array(starts, dtype=np.float64).reshape(-1, 3)
+        for axis in range(3):
+            target = ends[:, axis].copy()
+            forward = target > p[:, axis]
+            # the first voxel the leading probe enters and the number of voxels it crosses
+            first = np.where(forward, (p[:, axis] + radius).astype(np.int64) + 1,
+                             (p[:, axis] - radius).astype(np.int64) - 1)
+            last = np.where(forward, (target + radius).astype(np.int64), (target - radius).astype(np.int64))
+            count = np.maximum(np.where(forward, last - first, first - last) + 1, 0)
+            count[target == p[:, axis]] = 0
+            sign = np.where(forward, 1, -1)
+            at = p.astype(np.int64)
+            moving = np.flatnonzero(count)
+            for s in range(int(count.max(initial=0))):
+                moving = moving[count[moving] > s]
+                if not len(moving):
+                    break
+                k = first[moving] + sign[moving] * s
+                at[moving, axis] = k
+                hit = volume[at[moving, 0], at[moving, 1], at[moving, 2]] == 0
+                blocked = moving[hit]
+                target[blocked] = np.where(forward[blocked], k[hit] - margin, k[hit] + 1 + margin)
+                collide[blocked] = True
+                moving = moving[~hit]
+            p[:, axis] = target
+    probes = np.array([radius, -radius] * 3)
+    axes = np.repeat(np.arange(3), 2)
+    for _ in range(MAX_PUSHES):
+        at = p.astype(np.int64)
+        probe_at = np.repeat(at[:, None, :], 6, axis=1) # the voxel of each probe in shape (N, 6, 3)
+        probe_at[:, np.arange(6), axes] = (p[:, axes] + probes).astype(np.int64)
+        wall = volume[probe_at[..., 0], probe_at[..., 1], probe_at[..., 2]] == 0
+        hit = np.flatnonzero(wall.any(axis=1))
+        if not len(hit):
+            break
+        i = wall[hit].argmax(axis=1) # only the first probe in a wall, then the probes start over
+        axis = axes[i]
+        p[hit, axis] = np.where(i & 1, at[hit, axis] + margin, probe_at[hit, i, axis] - margin)
+        collide[hit] = True
+    return p, collide
@@ -0,0 +1,65 @@
+import json
+import struct
+import zlib
+import numpy as np
+from typing import Any, Dict, Iterable, Tuple
+from .storage import smallest_dtype
+
+# the compact maze format: MAGIC, the format version and the length of a JSON header, then the header, then the
+# sections, the header holds the scalars of the maze and, for each array, its dtype, shape, encoding and byte range
+MAGIC = b"MAZE"
+FORMAT_VERSION = 1
+PREFIX = struct.Struct("<4sHI")
+RAW, BITS, ZLIB = "raw", "bits", "zlib" # the encodings of a section
+
+def smallest_int(array: np.ndarray) -> np.ndarray:
+    "the array in the smallest integer dtype that holds its values"
+    lo, hi = (int(array.min()), int(array.max())) if array.size else (0, 0)
+    return array.astype(smallest_dtype(lo, hi), copy=False)
+
+def dumps(meta: Dict[str, Any], arrays: Dict[str, np.ndarray], bits: Iterable[str] = (),
+          compressed: Iterable[str] = ()) -> bytes:
+    "packs the scalars <meta> and the arrays into the compact format, the arrays named in <bits> are stored "
+    "one bit per element with np.packbits (any non-zero is one) and the ones named in <compressed> with zlib"
+    bits, compressed = set(bits), set(compressed)
+    sections = []
+    payload = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if name in bits:
+            data, encoding = np.packbits(array != 0).tobytes(), BITS
+        elif name in compressed:
+            data, encoding = zlib.compress(array.tobytes(), 1), ZLIB
+        else:
+            data, encoding = array.tobytes(), RAW
+        sections.append({"name": name, "dtype": array.dtype.str, "shape": array.shape, "encoding": encoding,
+                         "offset": offset, "size": len(data)})
+        payload.append(data)
+        offset += len(data)
+    header = json.dumps({"meta": meta, "sections": sections}, separators=(",", ":")).encode()
+    return b"".join([PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)), header] + payload)
+
+def loads(data: bytes | memoryview) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    "unpacks the compact format, the raw sections are read-only views of <data>, the others are decoded into "
+    "writable arrays"
+    magic, version, length = PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a compact maze")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact maze version <{version}>, it should be {FORMAT_VERSION}")
+    start = PREFIX.size + length
+    header = json.loads(bytes(data[PREFIX.size: start]))
+    arrays = {}
+    for section in header["sections"]:
+        shape = tuple(section["shape"])
+        chunk = memoryview(data)[start + section["offset"]: start + section["offset"] + section["size"]]
+        if section["encoding"] == BITS:
+            count = int(np.prod(shape))
+            array = np.unpackbits(np.frombuffer(chunk, dtype=np.uint8), count=count).astype(section["dtype"])
+        elif section["encoding"] == ZLIB:
+            array = np.frombuffer(bytearray(zlib.decompress(chunk)), dtype=section["dtype"])
+        else:
+            array = np.frombuffer(chunk, dtype=section["dtype"])
+        arrays[section["name"]] = array.reshape(shape)
+    return header["meta"], arrays
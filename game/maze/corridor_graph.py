@@ -0,0 +1,331 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from .bitmask import OFFSETS, open_faces
+from .labelling import label_components, union_find
+from .solver import padded_field, distance_field
+
+Position = Tuple[int, int, int]
+Anchor = Tuple[int, int] # (node, distance in voxels)
+POPCOUNT = np.array([bin(i).count("1") for i in range(64)], dtype=np.uint8)
+
+def corridor_links(corridor: np.ndarray, node: np.ndarray, faces: np.ndarray,
+                   flat_steps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    "the flat indices of the corridor voxels next to a node and of that node, once for each such pair"
+    voxels, targets = [], []
+    for d, step in enumerate(flat_steps):
+        at = np.flatnonzero(corridor.ravel() & (faces.ravel() >> d & 1 == 1))
+        at = at[node.ravel()[at + step]]
+        voxels.append(at)
+        targets.append(at + step)
+    return np.concatenate(voxels), np.concatenate(targets)
+
+def multigraph_table(u: np.ndarray, v: np.ndarray, num_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+    "the neighbor table in shape (N, 6) of the multigraph of the edges (u, v) and the edge (the index in u) of "
+    "each entry, an edge from a node to itself is in its row twice"
+    ids = np.arange(len(u))
+    tail = np.concatenate((u, v))
+    order = np.argsort(tail, kind="stable")
+    tail, head, ids = tail[order], np.concatenate((v, u))[order], np.concatenate((ids, ids))[order]
+    first = np.searchsorted(tail, tail) # a node has an entry for each open face, so six columns are enough
+    table = np.full((num_nodes, 6), -1, dtype=np.int64)
+    edge = np.full((num_nodes, 6), -1, dtype=np.int64)
+    table[tail, np.arange(len(tail)) - first] = head
+    edge[tail, np.arange(len(tail)) - first] = ids
+    return table, edge
+
+def voxel_links(near: np.ndarray, node: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    "the corridor of each voxel of the neighbor table <near> (-1 for a node), numbered in scan order, the voxel "
+    "count of each corridor and the corridor voxels next to a node and that node, once for each such pair, "
+    "as corridor_links()"
+    inside = np.flatnonzero(~node)
+    u: List[np.ndarray] = []
+    v: List[np.ndarray] = []
+    for d in (0, 2, 4):
+        step = near[inside, d]
+        linked = step >= 0
+        linked[linked] = ~node[step[linked]]
+        u.append(inside[linked])
+        v.append(step[linked])
+    parent = union_find(np.arange(len(near), dtype=np.int64), np.concatenate(u), np.concatenate(v))
+    _, number, counts = np.unique(parent[inside], return_inverse=True, return_counts=True)
+    labels = np.full(len(near), -1, dtype=np.int64)
+    labels[inside] = number # every root is the smallest voxel of its corridor, so they follow the scan order
+    voxels, targets = [], []
+    for d in range(6):
+        step = near[inside, d]
+        linked = step >= 0
+        linked[linked] = node[step[linked]]
+        voxels.append(inside[linked])
+        targets.append(step[linked])
+    return labels, counts, np.concatenate(voxels), np.concatenate(targets)
+
+def voxel_corridors(voxels: np.ndarray, shape: Tuple[int, ...]) -> Tuple[np.ndarray, ...]:
+    "the corridor graph that CorridorGraph builds for the sorted flat indices <voxels> of a volume of <shape> "
+    "without chambers, found from the voxels alone, so its memory follows the voxels and not the volume\n"
+    "it returns node_of, edge_of and offset of each voxel as in CorridorGraph, the neighbor table and the edge ids "
+    "of CorridorGraph.node_table() and the rows of CorridorGraph.edges"
+    n = len(voxels)
+    flat_steps = np.array((shape[1] * shape[2], -shape[1] * shape[2], shape[2], -shape[2], 1, -1))
+    near = np.full((n, 6), -1, dtype=np.int64) # the index of the voxel next to each voxel in the order of OFFSETS
+    for d, step in enumerate(flat_steps):
+        index = np.minimum(np.searchsorted(voxels, voxels + step), n - 1)
+        near[:, d] = np.where(voxels[index] == voxels + step, index, -1)
+    node = (near >= 0).sum(axis=1) != 2
+    labels, counts, link_voxel_, link_target = voxel_links(near, node)
+    ends = np.zeros(len(counts), dtype=bool)
+    ends[labels[link_voxel_]] = True
+    if not ends.all(): # a corridor with no end is a loop on its own, its first voxel becomes a node
+        inside = np.flatnonzero(~node)
+        node[inside[np.searchsorted(np.maximum.accumulate(labels[inside]), np.flatnonzero(~ends))]] = True
+        labels, counts, link_voxel_, link_target = voxel_links(near, node)
+    node_voxels = np.flatnonzero(node)
+    node_of = np.full(n, -1, dtype=np.int64)
+    node_of[node_voxels] = np.arange(len(node_voxels))
+    link_node_ = node_of[link_target]
+    link_edge = labels[link_voxel_]
+    order = np.lexsort((link_voxel_, link_edge))
+    link_voxel_, link_node_, link_edge = link_voxel_[order], link_node_[order], link_edge[order]
+    if not np.array_equal(link_edge, np.repeat(np.arange(len(counts)), 2)):
+        raise RuntimeError("A corridor does not have two ends")
+    offset = np.zeros(n, dtype=np.int64) # the distance from the first node of the corridor
+    frontier = link_voxel_[0::2]
+    d = 1
+    while len(frontier):
+        offset[frontier] = d
+        d += 1
+        frontier = near[frontier].ravel()
+        frontier = frontier[frontier >= 0]
+        frontier = np.unique(frontier[(labels[frontier] >= 0) & (offset[frontier] == 0)])
+    u = [link_node_[0::2]]
+    v = [link_node_[1::2]]
+    w = [counts.astype(np.int64) + 1]
+    for d in (0, 2, 4):
+        step = near[node_voxels, d]
+        linked = step >= 0
+        linked[linked] = node[step[linked]]
+        u.append(node_of[node_voxels[linked]])
+        v.append(node_of[step[linked]])
+        w.append(np.ones(linked.sum(), dtype=np.int64))
+    edges = np.stack((np.concatenate(u), np.concatenate(v), np.concatenate(w)), axis=1)
+    return (node_of, labels, offset) + multigraph_table(edges[:, 0], edges[:, 1], len(node_voxels)) + (edges,)
+
+
+class CorridorGraph:
+    "the maze volume compressed into a weighted graph, the nodes are the junctions, the dead ends and the portals "
+    "of the chambers (the voxels just outside a chamber), the edges are the corridors between them weighted by "
+    "their length in voxels, and the chambers are cliques of their portals weighted by the distance inside\n"
+    "every path voxel maps to a node, a corridor (self.edge_of with self.offset from its first node) or a chamber, "
+    "so the distance between any two voxels is exact"
+    def __init__(self, volume: np.ndarray, cell_id: np.ndarray | None = None) -> None:
+        "<volume> is path where it is non-zero, <cell_id> is the chamber of each voxel as Maze.cell_id, "
+        "the path is expected to stay off the border of the volume, as the maze always does"
+        self.shape = volume.shape
+        path = volume != 0
+        chamber = path & (cell_id > 0) if cell_id is not None else np.zeros(self.shape, dtype=bool)
+        faces = open_faces(volume)
+        degree = POPCOUNT[faces]
+        flat_steps = np.array((self.shape[1] * self.shape[2], -self.shape[1] * self.shape[2],
+                               self.shape[2], -self.shape[2], 1, -1))
+        portal = np.zeros(self.shape, dtype=bool)
+        for dx, dy, dz in OFFSETS:
+            portal |= np.roll(chamber, (-dx, -dy, -dz), axis=(0, 1, 2))
+        portal &= path & ~chamber
+        node = path & ~chamber & ((degree != 2) | portal)
+        corridor = path & ~chamber & ~node
+        labels, counts, _ = label_components(corridor, split=False)
+        link_voxel_, link_target = corridor_links(corridor, node, faces, flat_steps)
+        ends = np.zeros(len(counts), dtype=bool)
+        ends[labels.ravel()[link_voxel_] - 1] = True
+        if not ends.all(): # a corridor with no end is a loop on its own, its first voxel becomes a node
+            inside = np.flatnonzero(corridor)
+            # the labels follow the scan order, so the first voxel of a label is where the running maximum reaches it
+            first = np.searchsorted(np.maximum.accumulate(labels.ravel()[inside]), np.flatnonzero(~ends) + 1)
+            node.ravel()[inside[first]] = True
+            corridor &= ~node
+            labels, counts, _ = label_components(corridor, split=False)
+            link_voxel_, link_target = corridor_links(corridor, node, faces, flat_steps)
+        self.node_voxels = np.flatnonzero(node) # sorted flat indices, the node i is node_voxels[i]
+        self.node_of = np.full(self.shape, -1, dtype=np.int32)
+        self.node_of.ravel()[self.node_voxels] = np.arange(len(self.node_voxels), dtype=np.int32)
+        # two links for each corridor, sorted by corridor then voxel
+        link_node_ = self.node_of.ravel()[link_target]
+        link_edge = labels.ravel()[link_voxel_] - 1
+        order = np.lexsort((link_voxel_, link_edge))
+        link_voxel_, link_node_, link_edge = link_voxel_[order], link_node_[order], link_edge[order]
+        if not np.array_equal(link_edge, np.repeat(np.arange(len(counts)), 2)):
+            raise RuntimeError("A corridor does not have two ends")
+        # the offset of a corridor voxel is its distance from the first node of its corridor
+        first = link_voxel_[0::2]
+        padded = padded_field(corridor, np.stack(np.unravel_index(first, self.shape), axis=1))
+        self.offset = padded.reshape(tuple(s + 2 for s in self.shape))[1:-1, 1:-1, 1:-1].copy()
+        self.offset[~corridor] = 0
+        self.edge_of = np.where(corridor, labels - 1, -1).astype(np.int32)
+        # the edges: the corridors, then the nodes next to each other, then the chambers
+        u = [link_node_[0::2]]
+        v = [link_node_[1::2]]
+        w = [counts.astype(np.int64) + 1]
+        for d, step in zip((0, 2, 4), flat_steps[0::2]):
+            a = self.node_voxels[(faces.ravel()[self.node_voxels] >> d & 1 == 1)]
+            a = a[node.ravel()[a + step]]
+            u.append(self.node_of.ravel()[a])
+            v.append(self.node_of.ravel()[a + step])
+            w.append(np.ones(len(a), dtype=np.int64))
+        self.num_corridors = len(counts) # the edges are the corridors, the links of two nodes, then the chambers
+        self.num_links = sum(len(a) for a in u[1:])
+        self.chambers: Dict[int, Tuple[Tuple[slice, ...], np.ndarray, np.ndarray, np.ndarray]] = {}
+        self.chamber_of = np.where(chamber, cell_id, 0).astype(np.int32) if cell_id is not None else \
+            np.zeros(self.shape, dtype=np.int32)
+        self.build_chambers(chamber, portal, u, v, w)
+        self.edges = np.stack((np.concatenate(u), np.concatenate(v), np.concatenate(w)), axis=1).astype(np.int64)
+        self.build_adjacency()
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_voxels)
+
+    @property
+    def nodes(self) -> np.ndarray:
+        "the positions of the nodes in shape (N, 3)"
+        return np.stack(np.unravel_index(self.node_voxels, self.shape), axis=1)
+
+    def build_chambers(self, chamber: np.ndarray, portal: np.ndarray,
+                       u: List[np.ndarray], v: List[np.ndarray], w: List[np.ndarray]):
+        "links the portals of every chamber to each other by their distance inside the chamber, "
+        "self.chambers keeps the box around each chamber, its volume with the portals, the portal nodes and "
+        "their positions in the box"
+        ids = self.chamber_of
+        for k in np.unique(ids[ids > 0]).tolist():
+            inside = np.argwhere(ids == k)
+            box = tuple(slice(lo - 1, hi + 2) for lo, hi in zip(inside.min(axis=0), inside.max(axis=0)))
+            own = ids[box] == k
+            near = np.zeros(own.shape, dtype=bool) # the portals of this chamber
+            for dx, dy, dz in OFFSETS:
+                near |= np.roll(own, (-dx, -dy, -dz), axis=(0, 1, 2))
+            near &= portal[box]
+            local = np.argwhere(near)
+            sub = (own | near).astype(np.uint8)
+            nodes = self.node_of[box][near]
+            for i in range(len(local)):
+                field = distance_field(sub, [tuple(local[i])])
+                d = field[near][i + 1:]
+                reach = d > 0
+                u.append(np.full(reach.sum(), nodes[i], dtype=np.int64))
+                v.append(nodes[i + 1:][reach].astype(np.int64))
+                w.append(d[reach].astype(np.int64) - 1)
+            self.chambers[k] = (box, sub, nodes, local)
+
+    def build_adjacency(self):
+        "the edges of each node in CSR form, self.adjacency[self.first[i]: self.first[i + 1]] are (neighbor, weight)"
+        u, v, w = self.edges.T
+        tail = np.concatenate((u, v))
+        head = np.concatenate((v, u))
+        order = np.argsort(tail, kind="stable")
+        self.first = np.zeros(self.num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tail, minlength=self.num_nodes), out=self.first[1:])
+        self.adjacency = np.stack((head[order], np.concatenate((w, w))[order]), axis=1)
+
+    def node_table(self) -> Tuple[np.ndarray, np.ndarray]:
+        "the nodes linked by the corridors and by the links of two nodes as a multigraph for labelling.dfs_tree(), "
+        "so a depth first search walks a corridor in one step instead of voxel by voxel, a corridor from a node back "
+        "to itself is in its row twice, the chambers are left out, so it is meant for a volume without them\n"
+        "it returns the neighbor table in shape (N, 6) and the edge (the row in self.edges) of each entry"
+        u, v, _ = self.edges[: self.num_corridors + self.num_links].T
+        return multigraph_table(u, v, self.num_nodes)
+
+    def locate(self, position: Position) -> List[Anchor]:
+        "the nodes a voxel reaches without passing another node, with their distances, empty for a wall"
+        x, y, z = position
+        n = int(self.node_of[x, y, z])
+        if n >= 0:
+            return [(n, 0)]
+        e = int(self.edge_of[x, y, z])
+        if e >= 0:
+            a, b, length = self.edges[e].tolist()
+            o = int(self.offset[x, y, z])
+            return [(a, o), (b, length - o)]
+        k = int(self.chamber_of[x, y, z])
+        if k > 0:
+            box, sub, nodes, local = self.chambers[k]
+            field = distance_field(sub, [(x - box[0].start, y - box[1].start, z - box[2].start)])
+            d = field[tuple(local.T)]
+            return [(int(node), int(dist) - 1) for node, dist in zip(nodes, d) if dist > 0]
+        return []
+
+    def search(self, sources: List[Anchor], targets: List[Anchor] | None = None,
+               bound: float = np.inf) -> Tuple[np.ndarray, np.ndarray]:
+        "a search over the nodes from the anchors <sources>, each round relaxes the edges of all the nodes whose "
+        "distance dropped in the last one at once, a node is dropped once it is not closer than <bound> or than the "
+        "nearest of <targets> found so far, so the distances are exact up to there\n"
+        "it returns the distance of each node (-1 is not reached) and the node it is reached from (-1 for a source)"
+        best = np.full(self.num_nodes, np.inf)
+        parent = np.full(self.num_nodes, -1, dtype=np.int64)
+        left = np.full(self.num_nodes, np.inf) # the distance from a target node on to its voxel
+        frontier, d = np.array(sources, dtype=np.int64).reshape(-1, 2).T
+        np.minimum.at(best, frontier, d)
+        if targets is not None:
+            ends, extra = np.array(targets, dtype=np.int64).reshape(-1, 2).T
+            np.minimum.at(left, ends, extra)
+        heads, weights = self.adjacency.T
+        degree = np.diff(self.first)
+        slot = np.empty(self.num_nodes, dtype=np.int64) # the last place of a node in the round, it drops the repeats
+        frontier = np.unique(frontier)
+        while len(frontier):
+            bound = min(bound, (best[frontier] + left[frontier]).min()) # only the nodes that dropped can lower it
+            frontier = frontier[best[frontier] < bound]
+            counts = degree[frontier]
+            tail = np.repeat(frontier, counts)
+            rows = np.repeat(self.first[frontier] - np.cumsum(counts) + counts, counts) + np.arange(len(tail))
+            head = heads[rows]
+            reach = best[tail] + weights[rows]
+            keep = reach < np.minimum(best[head], bound)
+            tail, head, reach = tail[keep], head[keep], reach[keep]
+            np.minimum.at(best, head, reach)
+            won = reach == best[head] # the ties keep the last of their tails
+            tail, head = tail[won], head[won]
+            parent[head] = tail
+            places = np.arange(len(head))
+            slot[head] = places
+            frontier = head[slot[head] == places]
+        return np.where(best < np.inf, best, -1).astype(np.int64), parent
+
+    def direct(self, a: Position, b: Position) -> float:
+        "the distance between two voxels without passing a node, inf if there is no such path"
+        ea, eb = int(self.edge_of[a]), int(self.edge_of[b])
+        if ea >= 0 and ea == eb:
+            return abs(int(self.offset[a]) - int(self.offset[b]))
+        k = int(self.chamber_of[a])
+        if k > 0 and k == int(self.chamber_of[b]):
+            box, sub, _, _ = self.chambers[k]
+            lo = np.array([s.start for s in box])
+            return int(distance_field(sub, [tuple(np.array(a) - lo)])[tuple(np.array(b) - lo)]) - 1
+        return np.inf
+
+    def distance(self, a: Position, b: Position) -> int:
+        "the length of the shortest path between two voxels in steps, -1 if there is none"
+        if a == b:
+            return 0 if self.locate(a) else -1
+        best = self.direct(a, b)
+        sources, targets = self.locate(a), self.locate(b)
+        if sources and targets:
+            dist, _ = self.search(sources, targets, best)
+            for node, d in targets:
+                if dist[node] >= 0:
+                    best = min(best, dist[node] + d)
+        return int(best) if best < np.inf else -1
+
+    def waypoints(self, a: Position, b: Position) -> np.ndarray:
+        "the nodes passed by a shortest path from a to b in shape (N, 3), in order, "
+        "empty if the path passes no node or there is no path"
+        sources, targets = self.locate(a), self.locate(b)
+        if not sources or not targets:
+            return np.zeros((0, 3), dtype=np.int64)
+        dist, parent = self.search(sources, targets)
+        best, last = self.direct(a, b), -1
+        for node, d in targets:
+            if dist[node] >= 0 and dist[node] + d < best:
+                best, last = dist[node] + d, node
+        route = []
+        while last >= 0:
+            route.append(last)
+            last = int(parent[last])
+        return self.nodes[route[::-1]] if route else np.zeros((0, 3), dtype=np.int64)
@@ -0,0 +1,210 @@
+import random
+import numpy as np
+from typing import Callable, Dict, List, Tuple
+from .storage import slabs
+
+# the order of the passage flags: M(LEFT, UP, RIGHT, DOWN, FRONT, BACK)
+LEFT, UP, RIGHT, DOWN, FRONT, BACK = range(6)
+OPPOSITE = (RIGHT, DOWN, LEFT, UP, BACK, FRONT)
+
+GENERATORS: Dict[str, Callable[..., np.ndarray]] = {}
+
+def generator(name: str) -> Callable:
+    "register a maze generator, it will be called with param=(rows, cols, height, rng) and should return "
+    "the passage flags M(LEFT, UP, RIGHT, DOWN, FRONT, BACK) of a perfect maze in shape (rows, cols, height, 6)"
+    def decorator(func: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+        GENERATORS[name] = func
+        return func
+    return decorator
+
+def get_steps(cols: int, height: int) -> Tuple[int, ...]:
+    "the offset of the flat cell index in each direction"
+    return (-height, -cols * height, height, cols * height, -1, 1)
+
+def neighbors(cell: int, rows: int, cols: int, height: int) -> List[Tuple[int, int]]:
+    "returns the (direction, neighbor) pairs of a flat cell index in the order of LEFT, UP, FRONT, RIGHT, DOWN, BACK"
+    row_step = cols * height
+    r, rest = divmod(cell, row_step)
+    c, t = divmod(rest, height)
+    res = []
+    if c > 0:
+        res.append((LEFT, cell - height))
+    if r > 0:
+        res.append((UP, cell - row_step))
+    if t > 0:
+        res.append((FRONT, cell - 1))
+    if c < cols - 1:
+        res.append((RIGHT, cell + height))
+    if r < rows - 1:
+        res.append((DOWN, cell + row_step))
+    if t < height - 1:
+        res.append((BACK, cell + 1))
+    return res
+
+
+@generator("prim")
+def prim(rows: int, cols: int, height: int, rng=random) -> np.ndarray:
+    "randomized Prim\n"
+    "cells are addressed by a flat index, the frontier is an unordered list and a random candidate is "
+    "swapped with the last one before popping, so both picking and removing are O(1)"
+    steps = get_steps(cols, height)
+    state = np.zeros(rows * cols * height, dtype=np.uint8) # 0 is unvisited, 1 is visited, 2 is in the frontier
+    passage = np.zeros((rows * cols * height, 6), dtype=np.uint8)
+    frontier = [0]
+    while frontier:
+        # random choose a candidate cell from the frontier
+        ind = rng.randrange(len(frontier))
+        cell = frontier[ind]
+        frontier[ind] = frontier[-1]
+        frontier.pop()
+        state[cell] = 1 # designate this location as visited
+        check = []
+        for direction, neighbor in neighbors(cell, rows, cols, height):
+            visit = state[neighbor]
+            if visit == 1: # if this cell was visited, it can be choiced as direction
+                check.append(direction)
+            elif visit == 0: # else it joins the frontier
+                frontier.append(neighbor)
+                state[neighbor] = 2
+        # select one of these edges at random, and break the walls between these two cells
+        if check:
+            direction = rng.choice(check)
+            passage[cell, direction] = 1
+            passage[cell + steps[direction], OPPOSITE[direction]] = 1
+    return passage.reshape(rows, cols, height, 6)
+
+@generator("kruskal")
+def kruskal(rows: int, cols: int, height: int, rng=random) -> np.ndarray:
+    "randomized Kruskal\n"
+    "all inner walls are shuffled once, a wall is broken if it joins two sets of the union-find, "
+    "which is a flat parent array with path halving"
+    n = rows * cols * height
+    steps = get_steps(cols, height)
+    index = np.arange(n).reshape(rows, cols, height)
+    # every inner wall once, as the cell and the direction towards its RIGHT, DOWN or BACK neighbor
+    wall_cells = np.concatenate((index[:, :-1, :].ravel(), index[:-1, :, :].ravel(), index[:, :, :-1].ravel()))
+    wall_directions = np.repeat(np.array((RIGHT, DOWN, BACK)), (rows * (cols - 1) * height,
+                                                                (rows - 1) * cols * height, rows * cols * (height - 1)))
+    order = np.random.default_rng(rng.getrandbits(64)).permutation(len(wall_cells))
+    wall_cells = wall_cells[order]
+    wall_directions = wall_directions[order]
+    parent = list(range(n))
+    broken: List[int] = []
+    for ind, (cell, direction) in enumerate(zip(wall_cells.tolist(), wall_directions.tolist())):
+        a = cell
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        b = cell + steps[direction]
+        while parent[b] != b:
+            parent[b] = parent[parent[b]]
+            b = parent[b]
+        if a != b:
+            parent[a] = b
+            broken.append(ind)
+            if len(broken) == n - 1: # it is a spanning tree now
+                break
+    wall_cells = wall_cells[broken]
+    wall_directions = wall_directions[broken]
+    passage = np.zeros((n, 6), dtype=np.uint8)
+    passage[wall_cells, wall_directions] = 1
+    passage[wall_cells + np.array(steps)[wall_directions], np.array(OPPOSITE)[wall_directions]] = 1
+    return passage.reshape(rows, cols, height, 6)
+
+@generator("backtracker")
+def backtracker(rows: int, cols: int, height: int, rng=random) -> np.ndarray:
+    "recursive backtracker, the recursion is an explicit stack so that large mazes cannot overflow it"
+    n = rows * cols * height
+    visited = np.zeros(n, dtype=np.bool_)
+    passage = np.zeros((n, 6), dtype=np.uint8)
+    start = rng.randrange(n)
+    visited[start] = True
+    stack = [start]
+    while stack:
+        cell = stack[-1]
+        check = [(direction, neighbor) for direction, neighbor in neighbors(cell, rows, cols, height)
+                 if not visited[neighbor]]
+        if not check:
+            stack.pop()
+            continue
+        direction, neighbor = rng.choice(check)
+        passage[cell, direction] = 1
+        passage[neighbor, OPPOSITE[direction]] = 1
+        visited[neighbor] = True
+        stack.append(neighbor)
+    return passage.reshape(rows, cols, height, 6)
+
+@generator("wilson")
+def wilson(rows: int, cols: int, height: int, rng=random) -> np.ndarray:
+    "Wilson's loop-erased random walks, it samples uniformly from all spanning trees but the first walks are long\n"
+    "the loops are erased implicitly: only the last exit of each cell is kept and the walk is replayed from its start"
+    n = rows * cols * height
+    steps = get_steps(cols, height)
+    in_tree = np.zeros(n, dtype=np.bool_)
+    exit_direction = np.zeros(n, dtype=np.uint8)
+    passage = np.zeros((n, 6), dtype=np.uint8)
+    in_tree[rng.randrange(n)] = True
+    for start in range(n):
+        cell = start
+        while not in_tree[cell]:
+            direction, cell_ = rng.choice(neighbors(cell, rows, cols, height))
+            exit_direction[cell] = direction
+            cell = cell_
+        cell = start
+        while not in_tree[cell]:
+            direction = int(exit_direction[cell])
+            in_tree[cell] = True
+            passage[cell, direction] = 1
+            cell += steps[direction]
+            passage[cell, OPPOSITE[direction]] = 1
+    return passage.reshape(rows, cols, height, 6)
+
+@generator("growing-tree")
+def growing_tree(rows: int, cols: int, height: int, rng=random, newest: float = 0.5) -> np.ndarray:
+    "growing tree, it grows from the newest active cell with probability <newest>, else from a random one\n"
+    "newest=1 behaves like the backtracker and newest=0 like Prim"
+    n = rows * cols * height
+    visited = np.zeros(n, dtype=np.bool_)
+    passage = np.zeros((n, 6), dtype=np.uint8)
+    start = rng.randrange(n)
+    visited[start] = True
+    active = [start]
+    while active:
+        ind = len(active) - 1 if rng.random() < newest else rng.randrange(len(active))
+        cell = active[ind]
+        check = [(direction, neighbor) for direction, neighbor in neighbors(cell, rows, cols, height)
+                 if not visited[neighbor]]
+        if not check: # retire the cell, swap it with the last one and pop in O(1)
+            active[ind] = active[-1]
+            active.pop()
+            continue
+        direction, neighbor = rng.choice(check)
+        passage[cell, direction] = 1
+        passage[neighbor, OPPOSITE[direction]] = 1
+        visited[neighbor] = True
+        active.append(neighbor)
+    return passage.reshape(rows, cols, height, 6)
+
+
+def carve(passage: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    "turns the passage flags in shape (rows, cols, height, 6) into the maze volume in shape "
+    "(2 * rows + 1, 2 * cols + 1, 2 * height + 1), one is path, zero is wall\n"
+    "the cell (r, c, t) is the voxel (2r + 1, 2c + 1, 2t + 1) and its walls are the voxels between two cells, "
+    "so every flag channel is written by one strided slice assignment\n"
+    "<out> is the uint8 volume to write in, like an np.memmap, it is carved a slab of rows at a time"
+    rows, cols, height, _ = passage.shape
+    maze = np.empty((rows * 2 + 1, cols * 2 + 1, height * 2 + 1), dtype=np.uint8) if out is None else out
+    maze[0] = 0
+    for part in slabs((rows, cols * 2 + 1, height * 2 + 1, 2)): # a row of cells is two layers of voxels
+        flags = passage[part]
+        block = np.zeros((len(flags) * 2 + 1,) + maze.shape[1:], dtype=np.uint8)
+        block[0] = maze[part.start * 2] # the wall layer before the slab, with the flags of the slab before
+        block[1::2, 1::2, 1::2] = 1
+        block[1::2, 0:-1:2, 1::2] |= flags[..., LEFT]
+        block[0:-1:2, 1::2, 1::2] |= flags[..., UP]
+        block[1::2, 2::2, 1::2] |= flags[..., RIGHT]
+        block[2::2, 1::2, 1::2] |= flags[..., DOWN]
+        block[1::2, 1::2, 0:-1:2] |= flags[..., FRONT]
+        block[1::2, 1::2, 2::2] |= flags[..., BACK]
+        maze[part.start * 2: part.stop * 2 + 1] = block
+    return maze
@@ -0,0 +1,326 @@
+import numpy as np
+from typing import Callable, Dict, Iterator, List, Tuple
+from .storage import slabs
+
+Position = Tuple[int, int, int]
+
+def label_components(mask: np.ndarray, split: bool = True,
+                     out: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+    "labels the 6-connected components of a boolean volume\n"
+    "it returns the int32 label volume (or <out>), where 0 is the background and the components are numbered from 1 "
+    "in the scan order of their first voxel, the voxel count of each label and the sorted flat indices of each "
+    "label (empty if not <split>)\n"
+    "<out> is the integer volume to write the labels in, like an np.memmap, it may be <mask> itself, its dtype must "
+    "hold the number of foreground voxels\n"
+    "every slab of storage.slabs() is labelled on its own by label_slab(), the labels of two slabs that touch are "
+    "joined by one more union-find over the labels, and the volume is numbered again a slab at a time, so the "
+    "temporaries are bounded by a slab and the number of labels"
+    layer = int(np.prod(mask.shape[1:]))
+    dtype = np.int32 if mask.size < 2 ** 31 else np.int64
+    labels = np.empty(mask.shape, dtype=dtype) if out is None else out
+    sizes: List[np.ndarray] = [np.zeros(1, dtype=np.int64)] # the voxel count of each label of the slabs, from 0
+    u: List[np.ndarray] = []
+    v: List[np.ndarray] = []
+    last = None # the labels of the last layer of the slab before
+    total = 0
+    for part in slabs(mask.shape):
+        local, counts = label_slab(np.asarray(mask[part]) != 0) # read before <out> is written, it may be <mask>
+        local[local > 0] += total
+        if last is not None:
+            both = (last > 0) & (local[0] > 0)
+            u.append(last[both])
+            v.append(local[0][both])
+        last = local[-1].copy()
+        labels[part] = local
+        sizes.append(counts)
+        total += len(counts)
+    sizes_ = np.concatenate(sizes)
+    parent = union_find(np.arange(len(sizes_), dtype=np.int64), np.concatenate(u + [np.zeros(0, dtype=np.int64)]),
+                        np.concatenate(v + [np.zeros(0, dtype=np.int64)]))
+    # every root is the smallest label of its set and the labels of the slabs follow the scan order
+    _, number = np.unique(parent, return_inverse=True) # 0 is the background, which is a set on its own
+    counts = np.bincount(number, weights=sizes_)[1:].astype(np.int64)
+    # the indices of all labels in one array, a label after another, each slab appends to every label it holds
+    grouped = np.empty(int(counts.sum()) if split else 0, dtype=np.int64)
+    end = np.cumsum(counts) - counts # where the next index of each label goes
+    for part in slabs(mask.shape):
+        labels[part] = number[labels[part]]
+        if split:
+            inside = np.flatnonzero(labels[part])
+            found = labels[part].ravel()[inside].astype(np.int64) - 1
+            order = np.argsort(found, kind="stable")
+            found, inside = found[order], inside[order]
+            rank = np.arange(len(found)) - np.searchsorted(found, found) # the place of a voxel among its label's
+            grouped[end[found] + rank] = inside + part.start * layer
+            end += np.bincount(found, minlength=len(counts))
+    if not split or not len(counts):
+        return labels, counts, []
+    return labels, counts, np.split(grouped, np.cumsum(counts)[:-1])
+
+def label_slab(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    "the int64 labels of the 6-connected components of a boolean volume as label_components() and their counts\n"
+    "every pair of adjacent voxels is an edge of a union-find over the foreground, see union_find()"
+    flat = mask.ravel()
+    foreground = np.flatnonzero(flat)
+    dtype = np.int32 if flat.size < 2 ** 31 else np.int64
+    compact = np.full(mask.shape, -1, dtype=dtype) # the index of a voxel in foreground
+    compact.ravel()[foreground] = np.arange(len(foreground), dtype=dtype)
+    u: List[np.ndarray] = []
+    v: List[np.ndarray] = []
+    for axis in range(3):
+        low: List[slice] = [slice(None)] * 3
+        high: List[slice] = [slice(None)] * 3
+        low[axis] = slice(None, -1)
+        high[axis] = slice(1, None)
+        both = mask[tuple(low)] & mask[tuple(high)]
+        u.append(compact[tuple(low)][both])
+        v.append(compact[tuple(high)][both])
+    del compact
+    parent = union_find(np.arange(len(foreground), dtype=dtype), np.concatenate(u), np.concatenate(v))
+    # every root is the smallest index of its set, so the sorted roots follow the scan order
+    _, inverse, counts = np.unique(parent, return_inverse=True, return_counts=True)
+    labels = np.zeros(mask.shape, dtype=np.int64)
+    labels.ravel()[foreground] = inverse + 1
+    return labels, counts
+
+def union_find(parent: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    "joins the sets of the pairs (u, v) into the forest <parent> and returns it flat, each element then points to "
+    "the smallest element of its set\n"
+    "all edges are hooked at once (the larger root to the smaller one) and the forest is flattened by pointer "
+    "jumping, so it takes O(log n) rounds of array operations"
+    while len(u):
+        pu = parent[u]
+        pv = parent[v]
+        keep = pu != pv # the edges inside a set are done
+        u, v, pu, pv = u[keep], v[keep], pu[keep], pv[keep]
+        if not len(u):
+            break
+        np.minimum.at(parent, np.maximum(pu, pv), np.minimum(pu, pv))
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+    return parent
+
+
+class LabelView:
+    "a Dict[Position, int] like view of a label volume, for the code that reads and writes the labels by tuples"
+    def __init__(self, labels: np.ndarray) -> None:
+        self.labels = labels
+
+    def __getitem__(self, pos: Position) -> int:
+        return int(self.labels[pos])
+
+    def __setitem__(self, pos: Position, value: int):
+        self.labels[pos] = value
+
+    def __contains__(self, pos: Position) -> bool:
+        return len(pos) == 3 and all(0 <= p < s for p, s in zip(pos, self.labels.shape))
+
+    def __len__(self) -> int:
+        return self.labels.size
+
+    def __iter__(self) -> Iterator[Position]:
+        return iter(np.ndindex(self.labels.shape))
+
+    def get(self, pos: Position, default: int | None = None) -> int | None:
+        return self[pos] if pos in self else default
+
+    def keys(self) -> Iterator[Position]:
+        return iter(self)
+
+    def values(self) -> Iterator[int]:
+        return iter(self.labels.ravel().tolist())
+
+    def items(self) -> Iterator[Tuple[Position, int]]:
+        return zip(np.ndindex(self.labels.shape), self.labels.ravel().tolist())
+
+
+def dfs_tree(table: np.ndarray, root: int | List[int] = 0, edges: np.ndarray | None = None) -> Tuple[np.ndarray, ...]:
+    "a depth first search over a neighbor table in shape (N, 6), an entry is the node next to the node of its row or "
+    "-1, the recursion is an explicit stack, <root> may be a list of roots, one for each component, their trees "
+    "follow each other in order\n"
+    "<edges> is the id of the edge of each entry for a multigraph, then only the edge a node is reached by leads "
+    "back to its parent, another edge to the parent is a back edge\n"
+    "it returns order (the nodes in preorder), disc (the preorder index of each node), low (the lowest disc "
+    "reachable from the subtree with one back edge), parent (-1 for the root and the unreached nodes) and size "
+    "(the number of nodes in the subtree), so the subtree of v is order[disc[v]: disc[v] + size[v]]\n"
+    "v is an articulation point if a child c has low[c] >= disc[v], or if v is the root with two children (Tarjan)"
+    n = len(table)
+    rows = table.tolist()
+    ids = edges.tolist() if edges is not None else None
+    disc = [-1] * n
+    low = [0] * n
+    parent = [-1] * n
+    up = [-1] * n # the edge each node is reached by
+    size = [0] * n
+    ptr = [0] * n
+    order = []
+    for r in np.ravel(root).tolist():
+        if disc[r] >= 0:
+            continue
+        disc[r] = low[r] = len(order)
+        order.append(r)
+        stack = [r]
+        while stack:
+            v = stack[-1]
+            if ptr[v] < 6:
+                i = ptr[v]
+                w = rows[v][i]
+                ptr[v] += 1
+                if w < 0:
+                    continue
+                if disc[w] < 0:
+                    parent[w] = v
+                    if ids is not None:
+                        up[w] = ids[v][i]
+                    disc[w] = low[w] = len(order)
+                    order.append(w)
+                    stack.append(w)
+                elif (w != parent[v] if ids is None else ids[v][i] != up[v]) and disc[w] < low[v]:
+                    low[v] = disc[w]
+            else: # all descendants of v have been discovered since v was
+                stack.pop()
+                size[v] = len(order) - disc[v]
+                p = parent[v]
+                if p >= 0 and low[v] < low[p]:
+                    low[p] = low[v]
+    return np.array(order), np.array(disc), np.array(low), np.array(parent), np.array(size)
+
+class CutForest:
+    "the depth first search forest (dfs_tree) over the corridor graph of some parts, it finds the voxels whose "
+    "removal splits their part and the pieces they leave\n"
+    "the voxels of a corridor count for its end further down the tree, so the aggregate of a subtree is a difference "
+    "of prefix sums over the preorder, a node is a cut if it is an articulation point of the multigraph, and the "
+    "voxels of a corridor are if the corridor is a bridge"
+    def __init__(self, voxels: np.ndarray, bounds: np.ndarray, own: np.ndarray, node_of: np.ndarray,
+                 corridor_of: np.ndarray, offset: np.ndarray, table: np.ndarray, edges: np.ndarray,
+                 ends: np.ndarray) -> None:
+        "<voxels> are the flat indices of the parts one after another, the part p is voxels[bounds[p]: bounds[p + 1]], "
+        "<own> is the aggregate of each voxel in shape (N, K)\n"
+        "<node_of>, <corridor_of> and <offset> are the node, the corridor (-1 if none) and the distance from the first "
+        "end of the corridor of each voxel, <table> and <edges> are from CorridorGraph.node_table() and <ends> are "
+        "the rows (first end, second end, length) of CorridorGraph.edges"
+        self.bounds = bounds
+        self.own = own
+        self.part_of = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+        self.in_corridor = in_corridor = node_of < 0
+        nodes = node_of[~in_corridor] # part by part, the first node of a part is the root of its search
+        m = len(nodes)
+        self.roots = np.searchsorted(self.part_of[~in_corridor], np.arange(len(bounds) - 1))
+        local_of = np.full(len(table), -1, dtype=np.int64)
+        local_of[nodes] = np.arange(m)
+        rows = table[nodes]
+        self.order, self.disc, low, parent, self.size = dfs_tree(np.where(rows >= 0, local_of[rows], -1), self.roots,
+                                                                 edges[nodes])
+        if len(self.order) < m:
+            raise RuntimeError("A part of the maze is not connected")
+        disc = self.disc
+        corridors, which = np.unique(corridor_of[in_corridor], return_inverse=True)
+        self.a, b = local_of[ends[corridors, :2]].T
+        self.deep = np.where(disc[self.a] >= disc[b], self.a, b) # the end further down the search tree
+        high = np.where(disc[self.a] >= disc[b], b, self.a)
+        self.corridor_of = np.full(len(voxels), -1, dtype=np.int64) # the index of the corridor in <corridors>
+        self.corridor_of[in_corridor] = which
+        self.local = np.empty(len(voxels), dtype=np.int64) # the node each voxel counts for
+        self.local[~in_corridor] = np.arange(m)
+        self.local[in_corridor] = self.deep[which]
+        node_own = np.zeros((m, own.shape[1]), dtype=np.int64)
+        np.add.at(node_own, self.local, own)
+        prefix = np.zeros((m + 1, own.shape[1] + 1), dtype=np.int64)
+        np.cumsum(np.column_stack((node_own, np.bincount(self.local, minlength=m)))[self.order], axis=0,
+                  out=prefix[1:])
+        sub = prefix[disc + self.size] - prefix[disc] # the aggregate and the voxels of each subtree
+        self.sub, count = sub[:, :-1], sub[:, -1]
+        self.total = self.sub[self.roots] # the aggregate of each part
+        self.corridor_own = np.zeros((len(corridors), own.shape[1]), dtype=np.int64)
+        np.add.at(self.corridor_own, which, own[in_corridor])
+        # a child subtree that cannot reach above its parent and a corridor from a node back to itself become pieces
+        # when the node is removed
+        child = np.flatnonzero(parent >= 0)
+        child = child[low[child] >= disc[parent[child]]]
+        ring = np.flatnonzero(self.a == b)
+        self.at = np.concatenate((parent[child], self.a[ring]))
+        self.piece_own = np.concatenate((self.sub[child], self.corridor_own[ring]))
+        self.root = parent < 0
+        separated = np.zeros((m, own.shape[1]), dtype=np.int64)
+        np.add.at(separated, self.at, self.piece_own)
+        self.rest = self.total[self.part_of[~in_corridor]] - own[~in_corridor] - separated # keeps the parent
+        self.rest_size = np.diff(bounds)[self.part_of[~in_corridor]] - 1 - \
+            np.bincount(self.at, weights=np.concatenate((count[child], np.bincount(which)[ring])), minlength=m)
+        self.heads = child[np.argsort(parent[child], kind="stable")] # the pieces of each node, grouped
+        self.head_first = np.searchsorted(parent[self.heads], np.arange(m + 1))
+        self.rings = ring[np.argsort(self.a[ring], kind="stable")]
+        self.ring_first = np.searchsorted(self.a[self.rings], np.arange(m + 1))
+        # the voxel at <step> from the upper end of a bridge corridor leaves the voxels before it with the rest
+        # and the ones after it with the subtree of the deeper end
+        bridge = (self.a != b) & (parent[self.deep] == high) & (low[self.deep] > disc[high])
+        self.inner = np.flatnonzero(in_corridor)[bridge[which]]
+        self.step = np.zeros(len(voxels), dtype=np.int64)
+        k = self.corridor_of[self.inner]
+        first, _, length = ends[corridors[k]].T
+        self.step[self.inner] = np.where(nodes[high[k]] == first, offset[self.inner], length - offset[self.inner])
+
+    def candidates(self, valid: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        "whether each voxel splits its part into pieces that all pass <valid>, which takes the aggregates of the "
+        "pieces in shape (M, K) and returns a boolean for each"
+        m = len(self.order)
+        pieces = np.bincount(self.at, minlength=m)
+        bad = np.bincount(self.at, weights=~valid(self.piece_own), minlength=m) > 0
+        candidates = np.zeros(len(self.local), dtype=bool)
+        candidates[~self.in_corridor] = np.where(self.root, pieces >= 2, pieces >= 1) & ~bad & \
+            ((self.rest_size == 0) | valid(self.rest))
+        if len(self.inner):
+            by_step = self.inner[np.lexsort((self.step[self.inner], self.corridor_of[self.inner]))]
+            k = self.corridor_of[by_step]
+            before = np.cumsum(self.own[by_step], axis=0) - self.own[by_step]
+            group = np.flatnonzero(np.r_[True, k[1:] != k[:-1]]) # the first voxel of each corridor
+            before -= np.repeat(before[group], np.diff(np.r_[group, len(k)]), axis=0)
+            deep = self.deep[k]
+            kept = self.total[self.part_of[by_step]] - self.sub[deep] + before
+            cut = self.sub[deep] - before - self.own[by_step]
+            candidates[by_step] = valid(kept) & valid(cut)
+        return candidates
+
+    def pieces(self, v: int) -> Tuple[np.ndarray, np.ndarray]:
+        "the pieces left when the voxel <v> (an index of the voxels) is removed from its part, it returns the piece "
+        "of each voxel of the part (-1 for v, the piece 0 keeps the rest of the part and may be empty) and the "
+        "aggregate of each piece"
+        p = self.part_of[v]
+        part = slice(self.bounds[p], self.bounds[p + 1])
+        piece = np.zeros(len(self.order), dtype=np.int64)
+        if self.in_corridor[v]:
+            c = self.deep[self.corridor_of[v]]
+            piece[self.order[self.disc[c]: self.disc[c] + self.size[c]]] = 1
+            piece_of = piece[self.local[part]]
+            mine = self.corridor_of[part] == self.corridor_of[v]
+            step = self.step[part]
+            piece_of[mine] = step[mine] > self.step[v]
+            own = self.own[part]
+            kept = self.total[p] - self.sub[c] + own[mine & (step < self.step[v])].sum(axis=0)
+            cut = self.sub[c] - own[mine & (step <= self.step[v])].sum(axis=0)
+            aggregates = np.stack((kept, cut))
+        else:
+            c = self.local[v]
+            heads = self.heads[self.head_first[c]: self.head_first[c + 1]]
+            for k, h in enumerate(heads, 1):
+                piece[self.order[self.disc[h]: self.disc[h] + self.size[h]]] = k
+            piece_of = piece[self.local[part]]
+            loops = self.rings[self.ring_first[c]: self.ring_first[c + 1]]
+            for k, r in enumerate(loops, len(heads) + 1):
+                piece_of[self.corridor_of[part] == r] = k
+            aggregates = np.concatenate((self.rest[c: c + 1], self.sub[heads], self.corridor_own[loops]))
+        piece_of[v - self.bounds[p]] = -1
+        return piece_of, aggregates
+
+
+def group_labels(labels: np.ndarray) -> Dict[int, np.ndarray]:
+    "returns the sorted flat indices of each positive label of a label volume"
+    flat = labels.ravel()
+    foreground = np.flatnonzero(flat > 0)
+    order = np.argsort(flat[foreground], kind="stable")
+    keys, starts = np.unique(flat[foreground][order], return_index=True)
+    grouped = foreground[order]
+    bounds = starts.tolist() + [len(grouped)]
+    return {key: grouped[bounds[i]: bounds[i + 1]] for i, key in enumerate(keys.tolist())}
@@ -1,370 +1,472 @@
 import random
+import os
+import struct
+import zlib
 import numpy as np
 from ..engine import Point, GeneralPoint
 from ..engine.global_var import get_var
-from math import inf
-from typing import Tuple, Dict, List
+from .generator import GENERATORS, carve
+from .cache import cache_path
+from .labelling import label_components, group_labels, CutForest, LabelView
+from .bitmask import OFFSETS, open_faces
+from .solver import FieldSolver, NO_HINT
+from .collision import sweep
+from .corridor_graph import voxel_corridors
+from .compact import dumps, loads, smallest_int
+from .storage import Storage, smallest_dtype, slabs, CHUNK
+from typing import Tuple, Dict, Iterable, Iterator, List
+
+SPLIT_BATCH = CHUNK // 8 # the voxels of the parts split at once, the search keeps some hundred bytes for each
 
 class Maze:
     'one is path, zero is wall'
     def __init__(self, rows: int, cols: int, height: int, delta: float = 0.2, optimizing: bool = False,
-                 cells: int | float = 0.01) -> None:
-        "if cell is int then it is the number of cells, if it is float then it is the density of cells"
+                 cells: int | float = 0.01, algorithm: str = "prim", seed: int | None = None,
+                 cache: str | None = None, poisson: bool = False, memmap: str | None = None) -> None:
+        "if cell is int then it is the number of cells, if it is float then it is the density of cells\n"
+        "algorithm is the name of a generator in GENERATORS\n"
+        "seed drives a private random generator, the same parameters and seed give the same maze\n"
+        "cache is a directory of generated mazes, it is only used with a seed\n"
+        "poisson places the cells with a single pass Poisson-disk sampler from the start, see generate_cell()\n"
+        "memmap is a directory to keep the volumes in as np.memmap files, for the mazes too large for the memory, "
+        "they are filled a slab at a time and their pages are dropped once a step is done (Storage.release()), so "
+        "only the part index and the temporaries of a slab or a batch stay in memory, the processes the maze is "
+        "pickled to then map the same files"
         if get_var("WEB_CONTROLLED") and optimizing:
             return
+        if algorithm not in GENERATORS:
+            raise ValueError(f"Unknown maze algorithm <{algorithm}>, it should be one of {', '.join(GENERATORS)}")
+        self.algorithm = algorithm
         self.rows = rows
         self.cols = cols
         self.height = height
         self.delta = delta
         self.cell_num = int(cells) if isinstance(cells, int) else int(rows * cols * height * cells)
+        self.poisson = poisson
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.storage = Storage(memmap)
+        path = None
+        if cache is not None and seed is not None:
+            path = cache_path(cache, size=(rows, cols, height), cells=cells, delta=delta, seed=seed, 
+                              algorithm=algorithm, poisson=poisson)
+            if os.path.exists(path):
+                try:
+                    self.load(path)
+                    return
+                except (ValueError, KeyError, struct.error, zlib.error, EOFError) as err: # a truncated or corrupt file
+                    print(f"The cached maze {path} cannot be read ({err!r}), it is generated again")
         self.generate_maze()
-        self.solute()
+        self.build_phases()
+        if path is not None:
+            self.save(path)
 
     def generate_maze(self): # from web, i extend it to 3d
         num_rows = self.rows
         num_cols = self.cols
         num_h = self.height
-        M = np.zeros((num_rows, num_cols, num_h, 7), dtype=np.uint8)
-        # The array M is going to hold the array information for each cell.
-        # The first four coordinates tell if walls exist on those sides
-        # and the fifth indicates if the cell has been visited in the search.
-        # M(LEFT, UP, RIGHT, DOWN, FRONT, BACK, CHECK_IF_VISITED)
-
-        possibility = [(0, 0, 0)]
-
-        while possibility:
-            # random choose a candidate cell from the cell set histroy
-            r, c, t = random.choice(possibility)
-            M[r, c, t, 6] = 1  # designate this location as visited
-
-            possibility.remove((r, c, t))
-            check = []
-            # If the randomly chosen cell has multiple edges
-            # that connect it to the existing self.
-            if c > 0:  # the visit state of left cell (for example)
-                if M[r, c - 1, t, 6] == 1:  # If this cell was visited,
-                    check.append("L")  # it can be choiced as direction.
-                elif M[r, c - 1, t, 6] == 0:  # else if it has not been visited...
-                    possibility.append((r, c - 1, t))
-                    M[r, c - 1, t, 6] = 2
-            if r > 0:  # the visit state of up cell
-                if M[r - 1, c, t, 6] == 1:
-                    check.append("U")
-                elif M[r - 1, c, t, 6] == 0:
-                    possibility.append((r - 1, c, t))
-                    M[r - 1, c, t, 6] = 2
-            if t > 0: # the visit state of front cell
-                if M[r, c, t - 1, 6] == 1:
-                    check.append("F")
-                elif M[r, c, t - 1, 6] == 0:
-                    possibility.append((r, c, t - 1))
-                    M[r, c, t - 1, 6] = 2
-            if c < num_cols - 1:  # the visit state of right cell
-                if M[r, c + 1, t, 6] == 1:
-                    check.append("R")
-                elif M[r, c + 1, t, 6] == 0:
-                    possibility.append((r, c + 1, t))
-                    M[r, c + 1, t, 6] = 2
-            if r < num_rows - 1:  # the visit state of down cell
-                if M[r + 1, c, t, 6] == 1:
-                    check.append("D")
-                elif M[r + 1, c, t, 6] == 0:
-                    possibility.append((r + 1, c, t))
-                    M[r + 1, c, t, 6] = 2
-            if t < num_h - 1:  # the visit state of back cell
-                if M[r, c, t + 1, 6] == 1:
-                    check.append("B")
-                elif M[r, c, t + 1, 6] == 0:
-                    possibility.append((r, c, t + 1))
-                    M[r, c, t + 1, 6] = 2
-
-            # Select one of these edges as direction at random,
-            # and break the walls between these two cells.
-            if len(check):
-                move_direction = random.choice(check)  # Select a direction
-                # Break the walls.
-                if move_direction == "L":
-                    M[r, c, t, 0] = 1
-                    c = c - 1
-                    M[r, c, t, 2] = 1
-                if move_direction == "U":
-                    M[r, c, t, 1] = 1
-                    r = r - 1
-                    M[r, c, t, 3] = 1
-                if move_direction == "R":
-                    M[r, c, t, 2] = 1
-                    c = c + 1
-                    M[r, c, t, 0] = 1
-                if move_direction == "D":
-                    M[r, c, t, 3] = 1
-                    r = r + 1
-                    M[r, c, t, 1] = 1
-                if move_direction == "F":
-                    M[r, c, t, 4] = 1
-                    t = t - 1
-                    M[r, c, t, 5] = 1
-                if move_direction == "B":
-                    M[r, c, t, 5] = 1
-                    t = t + 1
-                    M[r, c, t, 4] = 1
-
-        # generate the maze into 2d array without display
-        maze = np.zeros((num_rows * 2 + 1, num_cols * 2 + 1, num_h * 2 + 1), dtype=np.uint8)
-        for row in range(num_rows):
-            for col in range(num_cols):
-                for height in range(num_h):
-                    maze[row * 2 + 1, col * 2 + 1, height * 2 + 1] = 1
-                    if M[row, col, height, 0] == 1:
-                        maze[row * 2 + 1, col * 2, height * 2 + 1] = 1
-                    if M[row, col, height, 1] == 1:
-                        maze[row * 2, col * 2 + 1, height * 2 + 1] = 1
-                    if M[row, col, height, 2] == 1:
-                        maze[row * 2 + 1, col * 2 + 2, height * 2 + 1] = 1
-                    if M[row, col, height, 3] == 1:
-                        maze[row * 2 + 2, col * 2 + 1, height * 2 + 1] = 1
-                    if M[row, col, height, 4] == 1:
-                        maze[row * 2 + 1, col * 2 + 1, height * 2] = 1
-                    if M[row, col, height, 5] == 1:
-                        maze[row * 2 + 1, col * 2 + 1, height * 2 + 2] = 1
-        self.maze = maze
+        M = GENERATORS[self.algorithm](num_rows, num_cols, num_h, self.rng)
+        # The array M holds the passage information for each cell,
+        # a flag tells if the wall on that side is broken.
+        # M(LEFT, UP, RIGHT, DOWN, FRONT, BACK)
+        self.maze = carve(M, self.storage.empty("layout", tuple(s * 2 + 1 for s in M.shape[:3]), np.uint8))
         self.generate_cell()
 
-    def generate_cell(self):
-        cell_pos = [(-1, -1, -1)]
+    def generate_cell(self, spacing: int = 7, tries: int = 100, block: int = 4096):
+        "places the cells at least <spacing> apart in manhattan distance, a mask keeps the free positions and a "
+        "placed cell clears the diamond around it\n"
+        "each cell gets <tries> random tries while they succeed, once a cell misses, the free positions left are few, "
+        "so they are walked once in random order (a single pass of dart throwing, each cell is still a uniform pick "
+        "of the free positions) and it stops when they are used up, if self.poisson is True it walks from the start"
         self.cells: Dict[Tuple[int, int, int], int] = {} # Dict[Position, Size]
-        for i in range(self.cell_num):
-            x, y, z = cell_pos[0]
-            cnt = 1
-            while min(abs(x - c[0]) + abs(y - c[1]) + abs(z - c[2]) for c in cell_pos) <= 6:
-                x = random.randint(0, self.rows - 3)
-                y = random.randint(0, self.cols - 3)
-                z = random.randint(0, self.height - 3)
-                cnt += 1
-                if cnt > 100:
+        shape = (max(self.rows - 2, 0), max(self.cols - 2, 0), max(self.height - 2, 0))
+        free = np.ones(shape, dtype=bool)
+        offset = np.abs(np.indices((2 * spacing - 1,) * 3) - (spacing - 1)).sum(axis=0)
+        diamond = offset >= spacing # the positions a cell leaves free around it
+        def place(x: int, y: int, z: int):
+            lo = [max(v - spacing + 1, 0) for v in (x, y, z)]
+            hi = [min(v + spacing, s) for v, s in zip((x, y, z), shape)]
+            free[lo[0]: hi[0], lo[1]: hi[1], lo[2]: hi[2]] &= diamond[lo[0] - x + spacing - 1: hi[0] - x + spacing - 1,
+                                                                      lo[1] - y + spacing - 1: hi[1] - y + spacing - 1,
+                                                                      lo[2] - z + spacing - 1: hi[2] - z + spacing - 1]
+        place(-1, -1, -1) # keeps the cells away from the start
+        if not self.poisson and free.any():
+            while len(self.cells) < self.cell_num:
+                for _ in range(tries):
+                    x = self.rng.randint(0, shape[0] - 1)
+                    y = self.rng.randint(0, shape[1] - 1)
+                    z = self.rng.randint(0, shape[2] - 1)
+                    if free[x, y, z]:
+                        break
+                else: # run if there's no break
+                    break
+                place(x, y, z)
+                self.carve_cell(x, y, z)
+        flat = free.ravel()
+        order = np.flatnonzero(flat)
+        order = order[np.random.default_rng(self.rng.getrandbits(64)).permutation(len(order))]
+        for start in range(0, len(order), block):
+            if len(self.cells) >= self.cell_num:
+                break
+            for i in order[start: start + block][flat[order[start: start + block]]].tolist():
+                if len(self.cells) >= self.cell_num:
                     break
-            else: # run if there's no break
-                cell_pos.append((x, y, z))
-                size = 3
-                self.cells[(x, y, z)] = size
-                self.maze[x * 2 + 1: x * 2 + size + 1, y * 2 + 1: y * 2 + size + 1, z * 2 + 1: z * 2 + size + 1] = 1
+                if flat[i]: # a cell of this block may have taken it
+                    x, y, z = np.unravel_index(i, shape)
+                    place(int(x), int(y), int(z))
+                    self.carve_cell(int(x), int(y), int(z))
+        self.build_cell_id()
         self.divide_maze()
+        self.storage.release()
         self.bordered_part_num = self.gen_floating_blocks()
+        self.storage.release()
 
-    def in_cell(self, position: Point) -> bool:
-        for pos, size in self.cells.items():
-            pos = Point(pos[0] * 2 + 1, pos[1] * 2 + 1, pos[2] * 2 + 1)
-            pos2: Point = pos + (size, ) * 3
-            if pos.x <= position.x <= pos2.x and pos.y <= position.y <= pos2.y and pos.z <= position.z <= pos2.z:
-                return True
-        return False
-
-    def position_refiner(self, position: Point, collide: bool = False) -> Tuple[GeneralPoint, bool]:
-        delta = self.delta
-        if not self.maze[int(position.x + delta), int(position.y), int(position.z)]: # is wall
-            return self.position_refiner(Point(int(position.x + delta) - delta * 1.01, position.y, position.z), True)
-        if not self.maze[int(position.x - delta), int(position.y), int(position.z)]:
-            return self.position_refiner(Point(int(position.x) + delta  * 1.01, position.y, position.z), True)
-        if not self.maze[int(position.x), int(position.y + delta), int(position.z)]:
-            return self.position_refiner(Point(position.x, int(position.y + delta) - delta * 1.01, position.z), True)
-        if not self.maze[int(position.x), int(position.y - delta), int(position.z)]:
-            return self.position_refiner(Point(position.x, int(position.y) + delta * 1.01, position.z), True)
-        if not self.maze[int(position.x), int(position.y), int(position.z + delta)]:
-            return self.position_refiner(Point(position.x, position.y, int(position.z + delta) - delta * 1.01), True)
-        if not self.maze[int(position.x), int(position.y), int(position.z - delta)]:
-            return self.position_refiner(Point(position.x, position.y, int(position.z) + delta * 1.01), True)
-        return position, collide
-
-    def solute(self) -> np.ndarray:
-        if hasattr(self, "solution"):
-            return self.solution
-        solution = np.zeros((self.rows * 2 + 1, self.cols * 2 + 1, self.height * 2 + 1), dtype=np.int32)
-        solution[self.maze == 0] = -1
-        available = [(self.rows * 2 - 1, self.cols * 2 - 1, self.height * 2 - 1, 1)]
-        # visited path: > 0
-        # unvisited path: 0
-        # wall: -1
-        while available:
-            x, y, z, d = available.pop()
-            if solution[x, y, z]: # if the cell is visited or wall
-                continue
-            solution[x, y, z] = d
-            if solution[x + 1, y, z] == 0: # if the cell is a unvisited path
-                solution[x + 1, y, z] = d + 1
-                available.append((x + 2, y, z, d + 2))
-            if solution[x - 1, y, z] == 0:
-                solution[x - 1, y, z] = d + 1
-                available.append((x - 2, y, z, d + 2))
-            if solution[x, y + 1, z] == 0:
-                solution[x, y + 1, z] = d + 1
-                available.append((x, y + 2, z, d + 2))
-            if solution[x, y - 1, z] == 0:
-                solution[x, y - 1, z] = d + 1
-                available.append((x, y - 2, z, d + 2))
-            if solution[x, y, z + 1] == 0:
-                solution[x, y, z + 1] = d + 1
-                available.append((x, y, z + 2, d + 2))
-            if solution[x, y, z - 1] == 0:
-                solution[x, y, z - 1] = d + 1
-                available.append((x, y, z - 2, d + 2))
-        self.solution = solution
-        return solution
-    
-    def next_path(self, position: GeneralPoint) -> Point:
+    def carve_cell(self, x: int, y: int, z: int, size: int = 3):
+        self.cells[(x, y, z)] = size
+        self.maze[x * 2 + 1: x * 2 + size + 1, y * 2 + 1: y * 2 + size + 1, z * 2 + 1: z * 2 + size + 1] = 1
+
+    def save(self, path: str):
+        "saves the maze in the compact format of to_bytes()"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp = f"{path}.{os.getpid()}" # written aside and renamed, other processes never see a partial file
+        with open(temp, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(temp, path)
+
+    def load(self, path: str):
+        "loads the maze saved by save()"
+        with open(path, "rb") as f:
+            self.from_buffer(f.read())
+
+    def to_bytes(self) -> bytes:
+        "the maze in the compact format of compact.py, the volumes of the layout and the phases are bit-packed, "
+        "the labels and the distances to the goal are in the smallest dtype and compressed, "
+        "the rest is rebuilt from them in prepare()"
+        arrays = {"layout": self.layout, "part_label": smallest_int(self.part_label), "cells": self.cell_array()}
+        arrays.update({f"floating_block_{i}": smallest_int(np.array(blocks, dtype=np.int64).reshape(-1, 3))
+                       for i, blocks in enumerate(self.floating_block)})
+        arrays.update({f"phase_{i}": volume for i, (volume, _, _) in enumerate(self.phases)})
+        # the distances to the goal of the path voxels in scan order, the walls are known from the volume
+        arrays.update({f"solution_{i}": smallest_int(solver.field[volume != 0])
+                       for i, (volume, _, solver) in enumerate(self.phases)})
+        return dumps(self.header(), arrays, bits=[name for name in arrays if name == "layout" or name.startswith("phase_")],
+                     compressed=["part_label"] + [name for name in arrays if name.startswith("solution_")])
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview) -> "Maze":
+        "the maze packed by to_bytes()"
+        maze = cls.__new__(cls)
+        maze.storage = Storage()
+        maze.from_buffer(data)
+        return maze
+
+    def __reduce__(self):
+        "pickles the maze in the compact format, a mapped maze only passes its folder and the small arrays"
+        if self.storage.mapped:
+            self.storage.flush()
+            blocks = {f"floating_block_{i}": np.array(b, dtype=np.int64).reshape(-1, 3) for i, b in enumerate(self.floating_block)}
+            return type(self).attach, (self.storage.folder, dumps(self.header(), {"cells": self.cell_array(), **blocks}))
+        return type(self).from_bytes, (self.to_bytes(),)
+
+    @classmethod
+    def attach(cls, folder: str, data: bytes) -> "Maze":
+        "the maze pickled from a mapped maze, its volumes are mapped copy-on-write from the same files, "
+        "so the pages are shared with the other processes and nothing is searched again"
+        maze = cls.__new__(cls)
+        meta, arrays = loads(data)
+        maze.set_header(meta, arrays)
+        maze.storage = storage = Storage(folder=folder)
+        maze.maze = maze.layout = storage.open("layout")
+        maze.layout_faces = storage.open("layout_faces")
+        maze.part_label = storage.open("part_label")
+        maze.cell_id = storage.open("cell_id")
+        maze.index_parts()
+        maze.phases = [[storage.open(f"phase_{k}"), storage.open(f"faces_{k}"),
+                        FieldSolver.attach(maze.layout.shape, storage.open(f"distance_{k}"), storage.open(f"hint_{k}"))]
+                       for k in range(max(len(maze.floating_block), 1))]
+        maze.set_phase(meta["phase"])
+        return maze
+
+    def header(self) -> Dict:
+        "the scalars of the maze"
+        return {"rows": self.rows, "cols": self.cols, "height": self.height, "delta": self.delta,
+                "algorithm": self.algorithm, "cell_num": self.cell_num, "poisson": self.poisson, "seed": self.seed,
+                "part_num": self.part_num, "bordered_part_num": self.bordered_part_num, "phase": self.phase}
+
+    def cell_array(self) -> np.ndarray:
+        "the cells in shape (N, 4), the position and the size"
+        return smallest_int(np.array([(*pos, size) for pos, size in self.cells.items()], dtype=np.int64).reshape(-1, 4))
+
+    def set_header(self, meta: Dict, arrays: Dict[str, np.ndarray]):
+        "sets the scalars, the cells and the floating blocks from header() and the arrays of to_bytes()"
+        for key in ("rows", "cols", "height", "delta", "algorithm", "cell_num", "poisson", "seed",
+                    "part_num", "bordered_part_num"):
+            setattr(self, key, meta[key])
+        self.rng = random.Random(self.seed)
+        self.cells = {(x, y, z): size for x, y, z, size in arrays["cells"].tolist()}
+        self.floating_block = []
+        while f"floating_block_{len(self.floating_block)}" in arrays:
+            self.floating_block.append([tuple(pos) for pos in arrays[f"floating_block_{len(self.floating_block)}"].tolist()])
+
+    def from_buffer(self, data: bytes | memoryview):
+        "sets the maze from the bytes of to_bytes()"
+        meta, arrays = loads(data)
+        self.set_header(meta, arrays)
+        self.maze = self.storage.keep("layout", arrays["layout"])
+        self.part_label = self.storage.keep("part_label", arrays["part_label"], self.label_dtype())
+        volumes = [arrays[f"phase_{i}"] for i in range(max(len(self.floating_block), 1))]
+        solutions = []
+        for i, volume in enumerate(volumes):
+            solution = np.full(volume.shape, -1, dtype=np.int32)
+            solution[volume != 0] = arrays[f"solution_{i}"]
+            solutions.append(solution)
+        self.prepare(volumes, solutions)
+        self.set_phase(meta["phase"])
+
+    def prepare(self, volumes: List[np.ndarray] | None = None, solutions: List[np.ndarray] | None = None):
+        "builds the indices, the chambers and the phases from the saved state, <volumes> are the volumes of the "
+        "phases and <solutions> their distance fields"
+        self.index_parts()
+        self.build_cell_id()
+        self.build_phases(volumes, solutions)
+
+    def index_parts(self):
+        "builds self.maze_part, self.part_index and self.label_num from self.part_label"
+        self.maze_part = LabelView(self.part_label)
+        groups = group_labels(self.part_label) # the groups are in order, so their positions are unravelled at once
+        positions = np.stack(np.unravel_index(np.concatenate([np.zeros(0, dtype=np.int64)] + list(groups.values())),
+                                              self.part_label.shape), axis=1).astype(self.coord_dtype())
+        bounds = np.cumsum([0] + [len(voxels) for voxels in groups.values()]).tolist()
+        self.part_index = {label: positions[bounds[i]: bounds[i + 1]] for i, label in enumerate(groups)}
+        self.label_num = max(self.part_index, default=0)
+
+    def label_dtype(self) -> np.dtype:
+        "the dtype of self.part_label, there are never more parts than path voxels"
+        return smallest_dtype(-3, int(np.count_nonzero(self.maze)))
+
+    def coord_dtype(self) -> np.dtype:
+        "the dtype of the positions in self.part_index"
+        return smallest_dtype(0, max(self.maze.shape))
+
+    def build_phases(self, volumes: List[np.ndarray] | None = None, solutions: List[np.ndarray] | None = None):
+        "precomputes the volume, the open-face mask and the solver of every phase, in the phase k the floating blocks "
+        "of the type k are hidden and the others are walls, so a flip is only a swap of references in set_phase()\n"
+        "self.layout keeps the volume with every block open and self.layout_faces its open-face mask, <volumes> and "
+        "<solutions> are the volumes and the distance fields of the phases saved before"
+        self.layout = self.maze
+        shape = self.layout.shape
+        self.layout_faces = open_faces(self.layout, self.storage.empty("layout_faces", shape, np.uint8))
+        goal = (self.rows * 2 - 1, self.cols * 2 - 1, self.height * 2 - 1)
+        self.phases: List[List] = [] # [volume, faces, solver] of each phase
+        for k in range(max(len(self.floating_block), 1)):
+            volume = self.storage.keep(f"phase_{k}", self.layout if volumes is None else volumes[k])
+            if volumes is None:
+                for j, blocks in enumerate(self.floating_block):
+                    if j != k and blocks:
+                        volume[tuple(np.array(blocks).T)] = 0
+            solver = FieldSolver(volume, [goal], None if solutions is None else solutions[k],
+                                       *self.solver_buffers(k))
+            self.phases.append([volume, open_faces(volume, self.storage.empty(f"faces_{k}", shape, np.uint8)), solver])
+            self.storage.release() # the next phase has volumes of its own
+        self.set_phase(0)
+
+    def solver_buffers(self, phase: int) -> Tuple[np.ndarray, np.ndarray]:
+        "the flat buffers of the distances and the hints of the solver of a phase"
+        size = int(np.prod([s + 2 for s in self.layout.shape]))
+        return self.storage.empty(f"distance_{phase}", (size,), np.int32), self.storage.empty(f"hint_{phase}", (size,), np.uint8)
+
+    def set_phase(self, phase: int):
+        "makes the phase active, self.maze, self.faces, self.solution and self.hint are then the ones of this phase"
+        self.phase = phase
+        self.maze, self.faces, self.solver = self.phases[phase]
+        self.solution = self.solver.field
+        self.hint = self.solver.hint_field
+
+    def build_cell_id(self):
+        "builds self.cell_id, the chamber of each voxel, 0 is not in a chamber and k is the k-th chamber in self.cells"
+        self.cell_id = self.storage.zeros("cell_id", self.maze.shape, smallest_dtype(0, len(self.cells)))
+        for k, ((x, y, z), size) in enumerate(self.cells.items(), 1):
+            self.cell_id[x * 2 + 1: x * 2 + size + 1, y * 2 + 1: y * 2 + size + 1, z * 2 + 1: z * 2 + size + 1] = k
+
+    def cell_at(self, position: GeneralPoint) -> int:
+        "returns the chamber of the position, 0 is not in a chamber and k is the k-th chamber in self.cells"
+        if isinstance(position, tuple):
+            return int(self.cell_id[int(position[0]), int(position[1]), int(position[2])])
+        return int(self.cell_id[int(position.x), int(position.y), int(position.z)])
+
+    def in_cell(self, position: GeneralPoint) -> bool:
+        return self.cell_at(position) > 0
+
+    def position_refiner(self, position: GeneralPoint, start: GeneralPoint | None = None) -> Tuple[GeneralPoint, bool]:
+        "keeps the position <delta> away from the walls, with <start> the move from it is swept so it cannot pass "
+        "through a wall, see collision.sweep()"
+        if isinstance(position, Point):
+            position = (position.x, position.y, position.z)
+        if isinstance(start, Point):
+            start = (start.x, start.y, start.z)
+        (x, y, z), collide = sweep(self.maze, start, position, self.delta)
+        return Point(x, y, z), collide
+
+    def solute(self, force: bool = False) -> np.ndarray:
+        "the distance field of the active phase to the goal, self.solver keeps it in self.solution, "
+        "it is searched again if <force> is True\n"
+        "wall: -1, a path that cannot reach the goal: 0, else the length of the shortest path to the goal in voxels"
+        if force:
+            self.solver = FieldSolver(self.maze, [(self.rows * 2 - 1, self.cols * 2 - 1, self.height * 2 - 1)],
+                                      dist=self.solver.dist, hint=self.solver.hint)
+            self.phases[self.phase][2] = self.solver
+            self.solution = self.solver.field
+            self.hint = self.solver.hint_field
+        return self.solution
+
+    def next_path(self, position: GeneralPoint) -> Point | None:
+        "the next voxel on the shortest path to the goal, None at the goal or if the goal cannot be reached"
         if isinstance(position, tuple):
             position = Point(*position)
         x, y, z = int(position.x), int(position.y), int(position.z)
-        solution = self.solution
-        xp = solution[x + 1, y, z] if solution[x + 1, y, z] > 0 else inf 
-        xn = solution[x - 1, y, z] if solution[x - 1, y, z] > 0 else inf
-        yp = solution[x, y + 1, z] if solution[x, y + 1, z] > 0 else inf
-        yn = solution[x, y - 1, z] if solution[x, y - 1, z] > 0 else inf
-        zp = solution[x, y, z + 1] if solution[x, y, z + 1] > 0 else inf
-        zn = solution[x, y, z - 1] if solution[x, y, z - 1] > 0 else inf
-        m = min(xp, xn, yp, yn, zp, zn)
-        if xp == m:
-            return Point(x + 1, y, z)
-        if xn == m:
-            return Point(x - 1, y, z)
-        if yp == m:
-            return Point(x, y + 1, z)
-        if yn == m:
-            return Point(x, y - 1, z)
-        if zp == m:
-            return Point(x, y, z + 1)
-        if zn == m:
-            return Point(x, y, z - 1)
-        
+        hint = self.hint[x, y, z]
+        if hint == NO_HINT:
+            return None
+        dx, dy, dz = OFFSETS[hint]
+        return Point(x + dx, y + dy, z + dz)
+
+    def path_from(self, position: GeneralPoint) -> np.ndarray:
+        "the shortest path from the voxel of a position to the goal in shape (N, 3), both ends included, "
+        "it is empty if the goal cannot be reached"
+        if not isinstance(position, tuple):
+            position = (position.x, position.y, position.z)
+        return self.solver.path(tuple(int(i) for i in position))
+
     def divide_maze(self):
-        "this method sets self.maze_part and returns the num of parts"
+        "this method sets self.maze_part and returns the num of parts\n"
+        "the parts are the connected components of the path outside the cells, labelled by label_components a slab "
+        "at a time in the storage, self.part_label is the label volume and self.maze_part is a view of it indexed by "
+        "positions"
         # 0 in wall, -1 is unvisted, -2 is cell, -3 is floating block, positive integer is the index of the maze
-        maze_cp = self.maze.astype(np.int32)
-        for (x, y, z), size in self.cells.items():
-            maze_cp[x * 2 + 1: x * 2 + size + 1, y * 2 + 1: y * 2 + size + 1, z * 2 + 1: z * 2 + size + 1] = -2
-        maze_cp[maze_cp == 1] = -1
-        maze: Dict[Tuple[int, int, int], int] = {(x, y, z): maze_cp[x, y, z] for x in range(2 * self.rows + 1) 
-                                                 for y in range(2 * self.cols + 1) for z in range(2 * self.height + 1)}
-        index = 0
-        while True:
-            for (x, y, z), state in maze.items():
-                if state == -1:
-                    index += 1
-                    available = [(x, y, z)]
-                    while available:
-                        x, y, z = available.pop(0)
-                        maze[(x, y, z)] = index
-                        if maze[(x + 1, y, z)] == -1:
-                            available.append((x + 1, y, z))
-                        if maze[(x - 1, y, z)] == -1:
-                            available.append((x - 1, y, z))
-                        if maze[(x, y + 1, z)] == -1:
-                            available.append((x, y + 1, z))
-                        if maze[(x, y - 1, z)] == -1:
-                            available.append((x, y - 1, z))
-                        if maze[(x, y, z + 1)] == -1:
-                            available.append((x, y, z + 1))
-                        if maze[(x, y, z - 1)] == -1:
-                            available.append((x, y, z - 1))
-                    break
-            else:
-                break
-        self.maze_part = maze
-        self.part_num = index
-        return index
-
-    def select_from_index(self, index: int) -> Tuple[Tuple[int, int, int], List[Tuple[int, int, int]]] | None:
-        "this method returns a random position from the index and guarantee that the position has at least two neighbors\n"
-        "it returns <pos>, <neighbors> if it is found, else None"
-        cnt = 0
-        while True:
-            cnt += 1
-            pos = random.choice(tuple((x, y, z) for (x, y, z), i in self.maze_part.items() if i == index))
-            directions = [[pos[0] + 1, pos[1], pos[2]], [pos[0] - 1, pos[1], pos[2]], [pos[0], pos[1] + 1, pos[2]],
-                          [pos[0], pos[1] - 1, pos[2]], [pos[0], pos[1], pos[2] + 1], [pos[0], pos[1], pos[2] - 1]]
-            neighbors = [(x, y, z) for x, y, z in directions if self.maze_part[(x, y, z)] == index]
-            if len(neighbors) >= 2:
-                return pos, neighbors
-            if cnt > 100:
-                return None
-
-    def gen_floating_blocks(self, num: int = 2) -> int:
+        self.part_label = self.storage.empty("part_label", self.maze.shape, self.label_dtype())
+        for part in slabs(self.maze.shape):
+            self.part_label[part] = (self.maze[part] == 1) & (self.cell_id[part] == 0)
+        _, counts, indices = label_components(self.part_label, out=self.part_label)
+        for part in slabs(self.maze.shape):
+            self.part_label[part][self.cell_id[part] > 0] = -2
+        self.maze_part = LabelView(self.part_label)
+        self.part_index: Dict[int, np.ndarray] = {} # the positions of each part in shape (N, 3), kept up to date
+        for label, voxels in enumerate(indices, 1):
+            self.index_part(label, voxels)
+        self.part_num = self.label_num = len(counts)
+        return self.part_num
+
+    def index_part(self, label: int, voxels: np.ndarray):
+        "records the sorted flat indices <voxels> as the positions of the part <label> in self.part_index"
+        self.part_index[label] = np.stack(np.unravel_index(voxels, self.maze.shape), axis=1).astype(self.coord_dtype())
+
+    def part_voxels(self, label: int) -> np.ndarray:
+        "the sorted flat indices of the part <label>"
+        return np.ravel_multi_index(tuple(self.part_index[label].T), self.maze.shape)
+
+    def gen_floating_blocks(self, num: int = 2, rounds: int = 1) -> int:
+        "places the floating blocks of <num> types in turn, a block is shown in the phases of the other types\n"
+        "every block is an articulation point of its part, so the part is split into pieces, and each piece either "
+        "touches a cell, where the phase can be changed, or is a pocket that only borders this block, "
+        "so there is always a path to the goal\n"
+        "a part is split once in each round, the pieces touching a cell are split again in the next round, "
+        "so it takes at most <rounds> searches of the corridor graph of the parts\n"
+        "the default of one round places at most one block in each part, as the former flood fill did: it meant to "
+        "split the pieces touching a cell again, but it only walked the voxels of the part and never saw a cell, "
+        "more rounds place more blocks and change the maze"
         self.floating_block: List[List[Tuple[int, int, int]]] = [[] for _ in range(num)]
-        cnt = self.part_num + 1
+        # the parts are read as the batches need them, a part is only relabelled after it is read
+        available: Iterable[np.ndarray] = (self.part_voxels(label) for label in range(1, self.part_num + 1))
         type_ = 0
-        for ind in range(1, self.part_num + 1):
-            available: List[int] = [ind]
-            re_calc: Dict[int, int] = {}
-            while available:
-                ind = available.pop(0)
-                if len([0 for _, i in self.maze_part.items() if i == ind]) < 5 or re_calc.get(ind, 0) > 2000:
-                    continue
-                pos = self.select_from_index(ind)
-                if pos is None:
-                    continue
-                pos, neighbors = pos
-                self.maze_part[pos] = -3 # floating block
-                flags: List[int] = []
-                changed: List[Tuple[int, int, int]] = []
-                for neighbor in neighbors:
-                    current = [neighbor]
-                    flags.append(0)
-                    while current:
-                        x, y, z = current.pop(0)
-                        if self.maze_part[(x, y, z)] == ind:
-                            self.maze_part[(x, y, z)] = cnt
-                            changed.append((x, y, z))
-                            if self.maze_part[(x + 1, y, z)] == ind:
-                                current.append((x + 1, y, z))
-                            if self.maze_part[(x - 1, y, z)] == ind:
-                                current.append((x - 1, y, z))
-                            if self.maze_part[(x, y + 1, z)] == ind:
-                                current.append((x, y + 1, z))
-                            if self.maze_part[(x, y - 1, z)] == ind:
-                                current.append((x, y - 1, z))
-                            if self.maze_part[(x, y, z + 1)] == ind:
-                                current.append((x, y, z + 1))
-                            if self.maze_part[(x, y, z - 1)] == ind:
-                                current.append((x, y, z - 1))
-                        elif self.maze_part[(x, y, z)] == -2: # cell
-                            flags[-1] |= 1
-                        elif self.maze_part[(x, y, z)] == -3: # floating block
-                            flags[-1] += 64
-                    cnt += 1
-                if any(flag % 64 == 0 and flag >= 128 for flag in flags):
-                    self.maze_part[pos] = ind
-                    for x, y, z in changed:
-                        self.maze_part[(x, y, z)] = ind
-                    if ind not in re_calc:
-                        re_calc[ind] = 0
-                    re_calc[ind] += 1
+        for round_ in range(rounds):
+            next_round = []
+            for split in self.split_parts(voxels for voxels in available if len(voxels) >= 5):
+                if split is None:
                     continue
-                for neighbor, flag in zip(neighbors, flags):
-                    if flag & 1:
-                        available.append(self.maze_part[neighbor])
+                pos, pieces = split
                 self.floating_block[type_].append(pos)
                 type_ = (type_ + 1) % num
-        available = [(1, 1, 1)]
-        remove_lst = []
-        while available:
-            x, y, z = available.pop(0)
-            if self.maze_part[(x, y, z)] == -3:
-                remove_lst.append((x, y, z))
-            if self.maze_part[(x + 1, y, z)] in (-3, -1):
-                available.append((x + 1, y, z))
-            if self.maze_part[(x - 1, y, z)] in (-3, -1):
-                available.append((x - 1, y, z))
-            if self.maze_part[(x, y + 1, z)] in (-3, -1):
-                available.append((x, y + 1, z))
-            if self.maze_part[(x, y - 1, z)] in (-3, -1):
-                available.append((x, y - 1, z))
-            if self.maze_part[(x, y, z + 1)] in (-3, -1):
-                available.append((x, y, z + 1))
-            if self.maze_part[(x, y, z - 1)] in (-3, -1):
-                available.append((x, y, z - 1))
-        for pos in remove_lst:
-            for i in range(num):
-                for j in range(len(self.floating_block[i]) - 1, -1, -1):
-                    if self.floating_block[i][j] == pos:
-                        self.floating_block[i].pop(j)
-                        break
-            self.maze_part[pos] = -1
+                if round_ < rounds - 1:
+                    next_round.extend(piece for piece, bordered in pieces if bordered)
+            if not next_round:
+                break
+            available = next_round
         return len([1 for i in self.floating_block for j in i])
+
+    def split_parts(self, parts: Iterable[np.ndarray]) -> Iterator[Tuple[Tuple[int, int, int],
+                                                                         List[Tuple[np.ndarray, bool]]] | None]:
+        "turns a random valid articulation point of every part, made of the sorted flat indices in <parts>, into a "
+        "floating block and gives every piece a new label, the parts are taken in order in batches of about "
+        "SPLIT_BATCH voxels, see split_batch(), so the temporaries are bounded by a batch and the largest part\n"
+        "it yields for each part <pos>, [(<voxels of the piece>, <touches a cell>), ...] or None if there is no "
+        "valid candidate"
+        batch: List[np.ndarray] = []
+        size = 0
+        for voxels in parts:
+            if batch and size + len(voxels) > SPLIT_BATCH:
+                yield from self.split_batch(batch)
+                batch, size = [], 0
+            batch.append(voxels)
+            size += len(voxels)
+        if batch:
+            yield from self.split_batch(batch)
+
+    def split_batch(self, parts: List[np.ndarray]) -> List[Tuple[Tuple[int, int, int],
+                                                                 List[Tuple[np.ndarray, bool]]] | None]:
+        "split_parts() for a batch of parts, one labelling.CutForest searches their corridor graph, which is found "
+        "from their voxels by corridor_graph.voxel_corridors(), the draw and the new labels go part by part"
+        labels = self.part_label.ravel()
+        shape = self.maze.shape
+        bounds = np.zeros(len(parts) + 1, dtype=np.int64) # the part p is voxels[bounds[p]: bounds[p + 1]]
+        np.cumsum([len(voxels) for voxels in parts], out=bounds[1:])
+        voxels = np.concatenate(parts)
+        around = (voxels[:, None] + np.array((shape[1] * shape[2], -shape[1] * shape[2], shape[2], -shape[2], 1, -1)))
+        start = np.ravel_multi_index((1, 1, 1), shape)
+        goal = np.ravel_multi_index((shape[0] - 2, shape[1] - 2, shape[2] - 2), shape)
+        # columns: touches a cell, touches an older floating block, is the start
+        own = np.stack(((labels[around] == -2).any(axis=1), (labels[around] == -3).any(axis=1), voxels == start),
+                       axis=1)
+        forbidden = (voxels == start) | (voxels == goal) | (around == start).any(axis=1)
+        order = np.argsort(voxels, kind="stable") # the parts overlap in the scan order, so their voxels are not sorted
+        graph = voxel_corridors(voxels[order], shape)
+        back = np.empty_like(order)
+        back[order] = np.arange(len(order))
+        node_of, edge_of, offset = (a[back] for a in graph[:3])
+        forest = CutForest(voxels, bounds, own.astype(np.int64), node_of, edge_of, offset, *graph[3:])
+        candidates = np.flatnonzero(forest.candidates(self.valid_piece) & ~forbidden)
+        drawn = np.searchsorted(candidates, bounds) # the part p draws from candidates[drawn[p]: drawn[p + 1]]
+        res = []
+        for p in range(len(parts)):
+            if drawn[p] == drawn[p + 1]:
+                res.append(None)
+                continue
+            v = candidates[drawn[p] + self.rng.randrange(drawn[p + 1] - drawn[p])]
+            piece_of, aggregates = forest.pieces(v)
+            res.append((tuple(int(i) for i in np.unravel_index(voxels[v], shape)),
+                        self.relabel_pieces(parts[p], piece_of, aggregates[:, 0] > 0)))
+            labels[voxels[v]] = -3 # floating block
+        return res
+
+    @staticmethod
+    def valid_piece(aggregates: np.ndarray) -> np.ndarray:
+        "whether each piece of the aggregates of split_parts() touches a cell, where the phase can be changed, "
+        "or is a pocket that borders no other floating block and does not hold the start"
+        return (aggregates[:, 0] > 0) | ((aggregates[:, 1] == 0) & (aggregates[:, 2] == 0))
+
+    def relabel_pieces(self, voxels: np.ndarray, piece_of: np.ndarray,
+                       bordered: np.ndarray) -> List[Tuple[np.ndarray, bool]]:
+        "gives a new label to every non-empty piece of the part made of the sorted flat indices <voxels>, "
+        "<piece_of> is the piece of each voxel (-1 is left out) and <bordered> whether each piece touches a cell\n"
+        "it returns [(<voxels of the piece>, <touches a cell>), ...]"
+        labels = self.part_label.ravel()
+        del self.part_index[int(labels[voxels[0]])]
+        res = []
+        for k in range(len(bordered)):
+            members = voxels[piece_of == k]
+            if not len(members):
+                continue
+            self.label_num += 1
+            labels[members] = self.label_num
+            self.index_part(self.label_num, members)
+            res.append((members, bool(bordered[k])))
+        return res
@@ -1,50 +1,46 @@
 from .maze3d import Maze
+from .chunked import ChunkedMaze, Key
 from ..engine import *
 from ..engine.global_var import set_var, get_var
-from typing import Dict, List
+from typing import Dict, List, Tuple
+from itertools import product
+import numpy as np
 from ..animation import FlipTexture
 
 
 class Viewer:
     'one is path, zero is wall'
     EXISTS = False
-    def __init__(self, maze: Maze, flip_texture: FlipTexture, allowpath: bool = True) -> None:
+    START_COLOR = (1.0, 0.7, 0.7)
+    GOAL_COLOR = (0.7, 1.0, 0.7)
+    PATH_COLOR = (0.7, 0.7, 1.0)
+    MARK_COLOR = (1.0, 1.0, 0.7)
+    def __init__(self, maze: Maze, flip_texture: FlipTexture, allowpath: bool = True, greedy: bool = False) -> None:
+        "<greedy> merges the coplanar walls into rectangles, see VoxelMesh"
         if Viewer.EXISTS:
             raise RuntimeError("Viewer already exists")
         Viewer.EXISTS = True
         set_var("GLOBAL_VIEWER", self)
         self.rows = maze.rows
         self.cols = maze.cols
+        self.height = maze.height
         self.texture = flip_texture.textures[0]
         self.flip_texture = flip_texture
         self.maze = maze
-        self.height = maze.height
-        self.tubes: Dict[GeneralPoint, Tube] = {}
+        self.start = (1, 1, 1)
+        self.goal = (2 * self.rows - 1, 2 * self.cols - 1, 2 * self.height - 1)
+        self.mesh: VoxelMesh
+        self.marks: Dict[GeneralPoint, Tuple[float, float, float]] = {} # the marked voxels and their former tints
         self.floating_blocks: Dict[Texture, List[FloatingBlock]] = {}
         self.allowpath = allowpath
+        self.greedy = greedy
         self.register()
         
     def register(self):
-        for i in range(1, self.rows * 2):
-            for j in range(1, self.cols * 2):
-                for k in range(1, self.height * 2):
-                    if self.maze.maze[i, j, k]:
-                        available: List[str] = []
-                        if self.maze.maze[i - 1, j, k]:
-                            available.append('x-')
-                        if self.maze.maze[i + 1, j, k]:
-                            available.append('x+')
-                        if self.maze.maze[i, j - 1, k]:
-                            available.append('y-')
-                        if self.maze.maze[i, j + 1, k]:
-                            available.append('y+')
-                        if self.maze.maze[i, j, k - 1]:
-                            available.append('z-')
-                        if self.maze.maze[i, j, k + 1]:
-                            available.append('z+')
-                        self.tubes[(i, j, k)] = Tube((i, j, k), available, texture=self.texture)
-        self.tubes[(1, 1, 1)].change_color((1.0, 0.7, 0.7))
-        self.tubes[(2 * self.rows - 1, 2 * self.cols - 1, 2 * self.height - 1)].change_color((0.7, 1.0, 0.7))
+        "the walls of the maze are one VoxelMesh made from the layout and its open-face mask"
+        self.mesh = VoxelMesh(self.maze.layout, self.maze.layout_faces, texture=self.texture, greedy=self.greedy)
+        self.paint_ends()
+        get_var("GLOBAL_RENDER").register(self.mesh)
         for block_lst, texture in zip(self.maze.floating_block, self.flip_texture.textures):
             self.floating_blocks[texture] = []
             for block in block_lst:
@@ -52,48 +48,139 @@ class Viewer:
         for blk in self.floating_blocks[self.texture]:
             blk.hide()
 
+    def paint_ends(self):
+        self.mesh.set_tint([self.start], self.START_COLOR)
+        self.mesh.set_tint([self.goal], self.GOAL_COLOR)
+
     def draw(self):
-        for tube in self.tubes.values():
-            tube.draw()
+        self.mesh.draw(get_var("GLOBAL_RENDER").frustum())
     
     def show_path(self, pos: Point = Point(1, 1, 1)):
         if not self.allowpath:
             return
-        self.maze.solute()
-        # pos = Point(1, 1, 1)
         x, y, z = int(pos.x), int(pos.y), int(pos.z)
-        d = self.maze.solution[x, y, z]
-        self.tubes[(x, y, z)].change_color((0.7, 0.7, 1.0))
-        self.tubes[(1, 1, 1)].change_color((1.0, 0.7, 0.7))
-        self.tubes[(2 * self.rows - 1, 2 * self.cols - 1, 2 * self.height - 1)].change_color((0.7, 1.0, 0.7))
-        while d > 2:
-            pos = self.maze.next_path(pos)
-            x, y, z = int(pos.x), int(pos.y), int(pos.z)
-            self.tubes[(x, y, z)].change_color((0.7, 0.7, 1.0))
-            d = self.maze.solution[x, y, z]
+        route = self.maze.path_from((x, y, z))
+        self.mesh.set_tint([(x, y, z)], self.PATH_COLOR)
+        self.mesh.set_tint(route[1: -1], self.PATH_COLOR) # the goal keeps its color
+        self.paint_ends()
 
     def hide_path(self):
-        for tube in self.tubes.values():
-            tube.change_color((1.0, 1.0, 1.0))
-        self.tubes[(1, 1, 1)].change_color((1.0, 0.7, 0.7))
-        self.tubes[(2 * self.rows - 1, 2 * self.cols - 1, 2 * self.height - 1)].change_color((0.7, 1.0, 0.7))
+        self.mesh.set_tint(np.stack(np.unravel_index(self.mesh.voxels, self.mesh.shape), axis=1), WHITE)
+        self.marks.clear()
+        self.paint_ends()
     
     def mark(self):
         render = get_var("GLOBAL_RENDER")
         pos = render.camera.position
-        tube = self.tubes[(int(pos.x), int(pos.y), int(pos.z))]
+        key = (int(pos.x), int(pos.y), int(pos.z))
+        if key in self.marks:
+            self.mesh.set_tint([key], self.marks.pop(key))
+            return
+        tint = self.mesh.get_tint(key)
+        if tint is None:
+            return
+        self.marks[key] = tint
+        self.mesh.set_tint([key], self.MARK_COLOR)
+
+    def change_texture(self, texture: Texture):
+        self.maze.set_phase(self.flip_texture.textures.index(texture)) # the blocks of this texture are hidden
+        self.mesh.change_texture(texture)
+        for block in self.floating_blocks[self.texture]:
+            block.show()
+        self.texture = texture
+        for block in self.floating_blocks[texture]:
+            block.hide()
+
+
+class ChunkViewer:
+    'the tubes of the chunks around the player in a ChunkedMaze'
+    def __init__(self, maze: ChunkedMaze, flip_texture: FlipTexture, radius: int = 1, per_frame: int = 1) -> None:
+        "the chunks within <radius> chunks of the chunk of the player are shown, the farther ones are dropped\n"
+        "update() loads the chunk of the player at once and at most <per_frame> other chunks each time"
+        if Viewer.EXISTS:
+            raise RuntimeError("Viewer already exists")
+        Viewer.EXISTS = True
+        set_var("GLOBAL_VIEWER", self)
+        self.maze = maze
+        self.texture = flip_texture.textures[0]
+        self.flip_texture = flip_texture
+        self.radius = radius
+        self.per_frame = per_frame
+        self.allowpath = False # the maze has no goal
+        self.tubes: Dict[GeneralPoint, Tube] = {}
+        self.loaded: Dict[Key, List[Tube]] = {}
+        self.pending: List[Key] = [] # the chunks to load, the nearest last
+        self.center: Key | None = None
+
+    def update(self, position: GeneralPoint):
+        "follows the player, it is called every frame"
+        center = self.maze.chunks.chunk_of(position)
+        if center != self.center:
+            self.center = center
+            r = self.radius
+            near = {tuple(c + d for c, d in zip(center, delta)) for delta in product(range(-r, r + 1), repeat=3)}
+            near = {key for key in near if min(key) >= 0}
+            far = [key for key in self.loaded if key not in near]
+            if far:
+                self.unload(far)
+            self.pending = sorted((key for key in near if key not in self.loaded), 
+                                  key=lambda key: -sum((a - b) ** 2 for a, b in zip(key, center)))
+        if center not in self.loaded:
+            self.load(center)
+        for _ in range(self.per_frame):
+            while self.pending and self.pending[-1] in self.loaded:
+                self.pending.pop()
+            if not self.pending:
+                break
+            self.load(self.pending.pop())
+
+    def load(self, key: Key):
+        volume, faces = self.maze.chunks.get(key)
+        x0, y0, z0 = self.maze.chunks.origin(key)
+        tubes = []
+        for (i, j, k), mask in zip(np.argwhere(volume).tolist(), faces[volume != 0].tolist()):
+            tube = Tube((x0 + i, y0 + j, z0 + k), mask, texture=self.texture)
+            self.tubes[tube.key] = tube
+            tubes.append(tube)
+        if (1, 1, 1) in self.tubes and key == (0, 0, 0):
+            self.tubes[(1, 1, 1)].change_color(Viewer.START_COLOR)
+        self.loaded[key] = tubes
+
+    def unload(self, keys: List[Key]):
+        tubes = [tube for key in keys for tube in self.loaded.pop(key)]
+        get_var("GLOBAL_RENDER").unregister(*tubes)
+        for tube in tubes:
+            del self.tubes[tube.key]
+            if Tube.ALL.get(tube.key) is tube:
+                del Tube.ALL[tube.key]
+            if Tube.LIT.get(tube.key) is tube:
+                del Tube.LIT[tube.key]
+
+    def draw(self):
+        for tube in self.tubes.values():
+            tube.draw()
+
+    def show_path(self, pos: Point = Point(1, 1, 1)):
+        "there is no goal to show the path to"
+
+    def hide_path(self):
+        "there is no goal to show the path to"
+
+    def mark(self):
+        render = get_var("GLOBAL_RENDER")
+        pos = render.camera.position
+        tube = self.tubes.get((int(pos.x), int(pos.y), int(pos.z)))
+        if tube is None:
+            return
         if hasattr(tube, "old_color"):
             tube.change_color(tube.old_color)
             del tube.old_color
             return
         tube.old_color = tube.color
-        tube.change_color((1.0, 1.0, 0.7))
+        tube.change_color(Viewer.MARK_COLOR)
 
     def change_texture(self, texture: Texture):
+        self.maze.set_phase(self.flip_texture.textures.index(texture))
         for tube in self.tubes.values():
             tube.change_texture(texture)
-        for block in self.floating_blocks[self.texture]:
-            block.show()
         self.texture = texture
-        for block in self.floating_blocks[texture]:
-            block.hide()
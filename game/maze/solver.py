@@ -0,0 +1,126 @@
+import numpy as np
+from typing import Iterable, Tuple
+from .storage import CHUNK, slabs
+
+Position = Tuple[int, int, int]
+NO_HINT = 255 # the hint of a wall, a source and a path that cannot reach any source
+
+def padded_steps(shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    "the offsets of the six neighbors of a flat index in a volume of <shape> padded by one voxel"
+    strides = ((shape[1] + 2) * (shape[2] + 2), shape[2] + 2, 1)
+    return (strides[0], -strides[0], strides[1], -strides[1], strides[2], -strides[2])
+
+def padded_index(position: Position, shape: Tuple[int, ...]) -> int:
+    "the flat index of a position in a volume of <shape> padded by one voxel"
+    x, y, z = position
+    return ((x + 1) * (shape[1] + 2) + y + 1) * (shape[2] + 2) + z + 1
+
+def padded_shape(shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    return tuple(s + 2 for s in shape)
+
+def pad_into(volume: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    "the flat int32 field of a volume padded by one voxel of wall, -1 is wall and 0 is path, "
+    "<out> is the flat buffer of the padded size to write in, like an np.memmap, it is filled a slab at a time"
+    shape = padded_shape(volume.shape)
+    dist = np.empty(int(np.prod(shape)), dtype=np.int32) if out is None else out
+    grid = dist.reshape(shape)
+    grid[0] = grid[-1] = -1
+    for layers in slabs(volume.shape):
+        inner = grid[layers.start + 1: layers.stop + 1]
+        inner[:, [0, -1]] = -1
+        inner[:, :, [0, -1]] = -1
+        inner[:, 1:-1, 1:-1] = np.where(volume[layers] != 0, 0, -1)
+    return dist
+
+def padded_field(volume: np.ndarray, sources: Iterable[Position], out: np.ndarray | None = None) -> np.ndarray:
+    "the flat distance field of distance_field() in the volume padded by one voxel of wall, "
+    "the walls around keep the flat neighbors inside the volume, <out> is a buffer for pad_into(), "
+    "<sources> may be an array in shape (N, 3)"
+    dist = pad_into(volume, out)
+    steps = np.array(padded_steps(volume.shape))
+    sources = np.asarray(sources if isinstance(sources, np.ndarray) else list(sources), dtype=np.int64)
+    frontier = np.ravel_multi_index(tuple(sources.reshape(-1, 3).T + 1), padded_shape(volume.shape))
+    frontier = np.unique(frontier[dist[frontier] == 0])
+    d = 1
+    while len(frontier):
+        dist[frontier] = d
+        d += 1
+        neighbors = (frontier[:, None] + steps).ravel()
+        neighbors = neighbors[dist[neighbors] == 0]
+        # a candidate marks its voxel with -2 - its place, the last mark wins and drops the repeats, the field is
+        # its own scratch, so the search needs no other array of the padded size
+        places = np.arange(len(neighbors), dtype=np.int32)
+        dist[neighbors] = -2 - places
+        frontier = neighbors[dist[neighbors] == -2 - places]
+    return dist
+
+def padded_hint(dist: np.ndarray, index: np.ndarray, steps: Tuple[int, ...]) -> np.ndarray:
+    "the hints of the flat indices <index> of a padded distance field, the hint of a voxel is the first direction "
+    "in the order x+, x-, y+, y-, z+, z- (as bitmask.OFFSETS) whose neighbor is one step closer to a source"
+    d = dist[index]
+    hint = np.full(len(index), NO_HINT, dtype=np.uint8)
+    for i in range(len(steps) - 1, -1, -1): # the first direction is written last and wins
+        hint[(d > 1) & (dist[index + steps[i]] == d - 1)] = i
+    return hint
+
+def distance_field(volume: np.ndarray, sources: Iterable[Position]) -> np.ndarray:
+    "the exact BFS distance of every path voxel of <volume> to the nearest source, one is the source itself\n"
+    "it returns an int32 array in the shape of volume, -1 is wall, 0 is a path that cannot reach any source\n"
+    "the search runs a whole frontier at a time over flat indices, every step is a few array operations"
+    return padded_field(volume, sources).reshape(padded_shape(volume.shape))[1:-1, 1:-1, 1:-1].copy()
+
+
+class FieldSolver:
+    "the distance field of distance_field() and the hint of every voxel, in flat padded buffers, so the shortest "
+    "path from any voxel is read without a search"
+    def __init__(self, volume: np.ndarray, sources: Iterable[Position], field: np.ndarray | None = None,
+                 dist: np.ndarray | None = None, hint: np.ndarray | None = None) -> None:
+        "<field> is a distance field of the volume computed before, it is searched again if it is None\n"
+        "<dist> (int32) and <hint> (uint8) are flat buffers of the padded size to keep the field in, like np.memmap"
+        self.shape = volume.shape
+        self.steps = padded_steps(volume.shape)
+        if field is None:
+            self.dist = padded_field(volume, sources, dist)
+        else:
+            self.dist = pad_into(volume, dist)
+            self.dist.reshape(padded_shape(self.shape))[1:-1, 1:-1, 1:-1] = field
+        self.hint = np.empty(len(self.dist), dtype=np.uint8) if hint is None else hint # see padded_hint()
+        for start in range(0, len(self.dist), CHUNK):
+            self.hint[start: start + CHUNK] = NO_HINT
+            index = start + np.flatnonzero(self.dist[start: start + CHUNK] > 1) # the others have no hint
+            self.hint[index] = padded_hint(self.dist, index, self.steps)
+
+    @classmethod
+    def attach(cls, shape: Tuple[int, ...], dist: np.ndarray, hint: np.ndarray) -> "FieldSolver":
+        "a solver over the buffers of another solver of the same volume, nothing is searched"
+        solver = cls.__new__(cls)
+        solver.shape = shape
+        solver.steps = padded_steps(shape)
+        solver.dist = dist
+        solver.hint = hint
+        return solver
+
+    @property
+    def field(self) -> np.ndarray:
+        "the distance field in the shape of the volume, it is a view of the buffer"
+        return self.dist.reshape(padded_shape(self.shape))[1:-1, 1:-1, 1:-1]
+
+    @property
+    def hint_field(self) -> np.ndarray:
+        "the uint8 direction to the goal of every voxel in the shape of the volume, as an index of bitmask.OFFSETS, "
+        "NO_HINT if there is no step to take, it is a view of the buffer"
+        return self.hint.reshape(padded_shape(self.shape))[1:-1, 1:-1, 1:-1]
+
+    def path(self, position: Position) -> np.ndarray:
+        "the shortest path from a position to the nearest source in shape (N, 3), both ends included, "
+        "it is empty if the position cannot reach any source"
+        i = padded_index(position, self.shape)
+        if self.dist[i] <= 0:
+            return np.zeros((0, 3), dtype=np.int64)
+        route = [i]
+        hint = self.hint
+        steps = self.steps
+        while hint[i] != NO_HINT:
+            i += steps[hint[i]]
+            route.append(i)
+        return np.stack(np.unravel_index(route, padded_shape(self.shape)), axis=1) - 1
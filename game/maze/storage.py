@@ -0,0 +1,94 @@
+import atexit
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import numpy as np
+from typing import Dict, Iterator, Tuple
+
+MANIFEST = "manifest.json"
+CHUNK = 1 << 20 # the voxels handled at once when a whole volume is filled, it bounds the temporaries
+
+def smallest_dtype(lo: int, hi: int) -> np.dtype:
+    "the smallest integer dtype that holds the values from lo to hi"
+    for dtype in (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def slabs(shape: Tuple[int, ...], chunk: int = CHUNK) -> Iterator[slice]:
+    "the slices of the first axis that cut a volume of <shape> into slabs of about <chunk> voxels, at least one "
+    "layer each, a volume is filled a slab at a time so that only a slab of temporaries is in memory"
+    step = max(chunk // max(int(np.prod(shape[1:])), 1), 1)
+    for x0 in range(0, shape[0], step):
+        yield slice(x0, min(x0 + step, shape[0]))
+
+
+class Storage:
+    "allocates the volumes of a maze, in memory, or as np.memmap files in a fresh folder of <directory>\n"
+    "the files are listed in a manifest, so another process can open the folder and map the same pages, "
+    "the folder is removed when the process that made it exits"
+    def __init__(self, directory: str | None = None, folder: str | None = None) -> None:
+        "<folder> is the folder of another storage to open, its arrays are then read by open()"
+        self.folder = folder
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.manifest: Dict[str, Tuple[Tuple[int, ...], str]] = {}
+        if folder is not None:
+            with open(os.path.join(folder, MANIFEST)) as f:
+                self.manifest = {name: (tuple(shape), dtype) for name, (shape, dtype) in json.load(f).items()}
+        elif directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.folder = tempfile.mkdtemp(prefix="maze_", dir=directory)
+            atexit.register(shutil.rmtree, self.folder, True) # the files mapped by others stay on some systems
+
+    @property
+    def mapped(self) -> bool:
+        return self.folder is not None
+
+    def empty(self, name: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        "a new array, its content is undefined unless it is mapped, then it is zero"
+        if not self.mapped:
+            return np.empty(shape, dtype=dtype)
+        dtype = np.dtype(dtype)
+        array = np.memmap(os.path.join(self.folder, f"{name}.dat"), dtype=dtype, mode="w+", shape=shape)
+        self.arrays[name] = array
+        self.manifest[name] = (tuple(shape), dtype.str)
+        with open(os.path.join(self.folder, MANIFEST), "w") as f:
+            json.dump(self.manifest, f)
+        return array
+
+    def zeros(self, name: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        array = self.empty(name, shape, dtype)
+        if not self.mapped: # a new file is already zero
+            array.fill(0)
+        return array
+
+    def keep(self, name: str, array: np.ndarray, dtype=None) -> np.ndarray:
+        "a copy of the array in the storage, in <dtype> if it is given"
+        res = self.empty(name, array.shape, array.dtype if dtype is None else dtype)
+        res[...] = array
+        return res
+
+    def open(self, name: str, mode: str = "c") -> np.ndarray:
+        "maps an array of an opened folder, the default mode is copy-on-write, so the pages are shared with the "
+        "other processes until they are written"
+        shape, dtype = self.manifest[name]
+        return np.memmap(os.path.join(self.folder, f"{name}.dat"), dtype=dtype, mode=mode, shape=shape)
+
+    def flush(self):
+        "writes the mapped arrays to their files, the processes that open the folder then see them"
+        for array in self.arrays.values():
+            array.flush()
+
+    def release(self):
+        "writes the mapped arrays to their files and drops their pages from the memory of this process, they are "
+        "read again from the page cache when they are used, so the volumes built one after another are not all "
+        "resident at once, it does nothing in memory"
+        self.flush()
+        if not hasattr(mmap, "MADV_DONTNEED"): # not on every system
+            return
+        for array in self.arrays.values():
+            if isinstance(array.base, mmap.mmap): # an empty array has no mapping
+                array.base.madvise(mmap.MADV_DONTNEED)
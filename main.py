@@ -1,5 +1,6 @@
 from environment import *
 import re
+import os
 try:
     from game import *
 except Exception:
@@ -18,6 +19,18 @@ with ErrorInterface(exit_window):
     PARSER.add_argument("--concentrate", type=float, default=0.99, help="The IPD ratio after 1 block")
     PARSER.add_argument("--speed", type=float, default=0.035, help="The speed of the player")
     PARSER.add_argument("--size", type=int, default=15, help="The size of the maze")
+    PARSER.add_argument("--algorithm", type=str, default="prim", 
+                        help="The algorithm to generate the maze: prim, kruskal, backtracker, wilson or growing-tree")
+    PARSER.add_argument("--seed", type=int, default=None, help="The seed of the maze, the same seed gives the same maze")
+    PARSER.add_argument("--cache", type=str, default=os.path.join(os.getenv("TEMP", "."), "vr_maze_cache"), 
+                        help="The directory to cache the generated mazes, only used with --seed")
+    PARSER.add_argument("--poisson", action="store_true", help="Place the chambers in a single pass from the start, without the random tries first")
+    PARSER.add_argument("--memmap", type=str, default=None, 
+                        help="The directory to keep the maze volumes in as memory-mapped files, for very large mazes")
+    PARSER.add_argument("--infinite", action="store_true", 
+                        help="Play an endless maze made in chunks around the player, --size is not used")
+    PARSER.add_argument("--greedy", action="store_true", 
+                        help="Merge the coplanar walls into larger quads, lit by a 3D light texture")
     PARSER.add_argument("--collidedistance", type=float, default=0.25, help="The minimum distance between the player and the wall")
     PARSER.add_argument("--maxbrightness", type=int, default=9, help="The maximum brightness level of the screen")
     PARSER.add_argument("--fovy", type=int, default=90, help="The field of view angle of the camera")
@@ -66,7 +79,11 @@ with ErrorInterface(exit_window):
     if __name__ == "__main__":
         disable_mouse()
         
-        maze = Maze(size, size, size, delta=collidedistance, optimizing=True, cells=0.19)
+        if args.infinite:
+            maze = ChunkedMaze(delta=collidedistance, algorithm=args.algorithm, seed=args.seed)
+        else:
+            maze = Maze(size, size, size, delta=collidedistance, optimizing=True, cells=0.19, algorithm=args.algorithm, 
+                        seed=args.seed, cache=args.cache, poisson=args.poisson, memmap=args.memmap)
         SUBINSTRUCTION = """The game is controlled by keyboard and mouse
 {}<Alt>: mark the your position
 <Space>: change your up direction to your forward direction
@@ -108,19 +125,21 @@ with ErrorInterface(exit_window):
         fp = FlipTexture(render, (Texture("game/texture/light.jpg"), 
                                 Texture("game/texture/dark.jpg")),
                         70, 0.0, supress_control=False, web_controller=controller)
-        viewer = Viewer(maze, fp, allowpath=allowpath)
+        viewer = ChunkViewer(maze, fp) if args.infinite else Viewer(maze, fp, allowpath=allowpath, greedy=args.greedy)
         @render.draw
         def draw_maze(render: Render):
+            if args.infinite:
+                viewer.update(cam.position)
             render.draw_objs()
 
 
         font = Font("consolas", 30, sysfont=True, bold=True)
         text = Text(INSTRUCTION, font)
-        in_cell = False
+        in_cell = 0 # the chamber the player is in, 0 is not in a chamber
         @render.draw_without_opengl
         def draw(render: Render):
             global in_cell
-            new = maze.in_cell(cam.position)
+            new = maze.cell_at(cam.position)
             if new and not in_cell:
                 fp.play()
             in_cell = new
@@ -130,24 +149,9 @@ with ErrorInterface(exit_window):
             text.draw(render)
 
 
-        from math import pi
+        from game.engine.direction import NAMES, facing
         def get_axis(theta: float, phi: float) -> str:
             _, axis, _ = get_control_coordinator()
-            if phi > pi / 4:
-                return axis[2]
-            elif phi < -pi / 4:
-                return f"{axis[2][0]}{'-' if axis[2][1] == '+' else '+'}"
-            if theta > pi:
-                theta -= pi * 2
-            elif theta < -pi:
-                theta += pi * 2
-            if -pi / 4 < theta < pi / 4:
-                return axis[0]
-            elif pi / 4 < theta < 3 * pi / 4:
-                return axis[1]
-            elif -3 * pi / 4 < theta < -pi / 4:
-                return f"{axis[1][0]}{'-' if axis[1][1] == '+' else '+'}"
-            else:
-                return f"{axis[0][0]}{'-' if axis[0][1] == '+' else '+'}"
+            return NAMES[facing(axis, theta, phi)]
 
         render.mainloop()